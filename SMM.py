@@ -1,16 +1,31 @@
-import numpy as np
-import networkx as nx
-import copy
 import time
 
-from collections import Counter
-from itertools import combinations
+import numpy as np
+
+from spanning import (iter_k_best_trees, iter_near_optimal_trees, iter_uniform_trees, iter_band_samples,
+                      get_band_weight, edges_to_matrix, count_optimal_trees, get_edge_arrays)
+from selection import TreeSelector
+from degree_search import find_min_std_tree
+from relations import RELATIONS, get_cooccurrence, is_sparse
+from connectivity import check_forms_connectivity, FormComponents, PairFormIndex, CandidateEdgeQueue
+from subgraphs import count_connected_subgraphs
+from packed import PackedMatrix
+from instrumentation import timed, span, count
+from metrics import get_graph_metrics, get_gt_metrics, get_stack_edges
+
+# candidate tree generation modes, see SemanticMap.get_optimal_SpanningTrees
+CANDIDATE_MODES = ['optimal', 'k_best', 'near_optimal', 'min_std']
+# number of edges added by merge_edge between two progress reports
+MERGE_PROGRESS_INTERVAL = 10
 
 
 class SemanticMap(object):
 
-    def __init__(self, tfM, featNames, formNames, adjM=None, GT_adj=None, zeroOcc=0, calc_type='G'):
-        # form-feature matrix    np.array  (N, D)
+    def __init__(self, tfM, featNames, formNames, adjM=None, GT_adj=None, zeroOcc=0, calc_type='G',
+                 max_trees=6000, time_budget=None, diagnostics=False, n_candidates=5, diversity=None,
+                 candidate_mode='optimal', tolerance=0.0, relative_tolerance=1e-9, seed=0, search_budget=10.0,
+                 count_limit=300000):
+        # form-feature matrix, bit-packed after the deduplication    PackedMatrix  (N, D)
         self.tfM = tfM
         # feature map    dict(int: str)
         self.origin_featNames = featNames
@@ -26,170 +41,165 @@ class SemanticMap(object):
         self.calc_type = calc_type
         # fully connected adjacency matrix
         self.adjM = adjM
-        # graph corresponding to the fully connected adjacency matrix
-        self.G = None
-        # candidate tree list
+        # candidate tree list, each tree is an (m, 2) edge array
         self.trees = []
+        # upper bound on the number of enumerated optimal trees
+        self.max_trees = max_trees
+        # time budget of the tree enumeration in seconds, None for unlimited
+        self.time_budget = time_budget
+        # number of candidate trees to return
+        self.n_candidates = n_candidates
+        # diversity criterion between candidate trees: None or 'jaccard'
+        self.diversity = diversity
+        # how the candidate trees are generated: 'optimal', 'k_best', 'near_optimal' or 'min_std'
+        self.candidate_mode = candidate_mode
+        # absolute and relative tolerance on the total weight of the 'near_optimal' trees
+        self.tolerance = tolerance
+        self.relative_tolerance = relative_tolerance
+        # seed of the optimal tree sampler
+        self.seed = seed
+        # time budget of the 'min_std' tree search in seconds, None for an exhaustive search
+        self.search_budget = search_budget
+        # largest number of connected sets of the 2-core enumerated by the subgraph count behind the productivity
+        # of every map, None for unlimited: the count grows exponentially with the cycles of the map
+        self.count_limit = count_limit
+        # whether to collect diagnostics about the candidate trees
+        self.diagnostics = diagnostics
+        # diagnostics information    dict
+        self.diagnostics_info = {}
+        # whether a time budget may have stopped the last candidate generation, whose result then depends on the
+        # machine load
+        self.time_capped = False
         # record deduplication information    list
         self.merge_feat_info = []
+        # deduplicated feature index of every original feature    np.array  (D_origin,)
+        self.unmerged_index = None
+        # feature pair -> forms inverted index, built on first use
+        self.pair_index = None
+        # symmetric boolean ground truth edge matrix, built on first use
+        self.gt_edges = None
+        # progress callback(name, value) of the long-running steps, None to disable
+        self.progress = None
         # feature deduplication
         self.merge_feat()
         
 
 
+    def __getstate__(self):
+        """
+        Leave out the progress callback, the candidate trees and the pair index (rebuilt on first use) when the map
+        is sent to a worker process.
+        """
+        state = self.__dict__.copy()
+        state['progress'] = None
+        state['trees'] = []
+        state['pair_index'] = None
+        return state
+
+
+
+    @timed('merge_feat')
     def merge_feat(self):
         """
         merge the feature columns if they are totally the same.
         """
+        if is_sparse(self.tfM):
+            # sorted row indices and no stored zeros, so that equal columns have equal arrays
+            self.tfM = self.tfM.tocsc(copy=True)
+            self.tfM.sum_duplicates()
+            self.tfM.eliminate_zeros()
         unique_featNames = []
-        unique_columns = []
-        for i, col in enumerate(self.tfM.T.tolist()):
-            if col not in unique_columns or sum(col) == 0:
-                unique_columns.append(col)
+        unique_indices = []
+        # column bytes -> position in the deduplicated list
+        column_index = dict()
+        for i, (key, column_sum) in enumerate(self._iter_column_keys()):
+            if key not in column_index or column_sum == 0:
+                if column_sum != 0:
+                    column_index[key] = len(unique_indices)
+                unique_indices.append(i)
                 unique_featNames.append(self.origin_featNames[i])
             else:
-                ix = unique_columns.index(col)
+                ix = column_index[key]
                 unique_featNames[ix] += "/" + self.origin_featNames[i]
                 self.merge_feat_info.append((ix, i)) #  the i-th feature is merged into the ix-th feature.
 
-        # update form-feature matrix
-        self.tfM = np.stack(unique_columns, axis=1)
+        # original feature -> deduplicated feature, reused by get_unmerged_matrix
+        unmerged_index = np.empty(self.tfM.shape[1], dtype=np.int64)
+        unmerged_index[unique_indices] = np.arange(len(unique_indices))
+        for ix, i in self.merge_feat_info:
+            unmerged_index[i] = ix
+        self.unmerged_index = unmerged_index
+        # update form-feature matrix, only the bits are kept for a presence/absence table
+        self.tfM = PackedMatrix(self.tfM[:, unique_indices])
         # update deduplicated feature list
         self.unique_featNames = unique_featNames
 
 
 
-    def add_node(self, adj_matrix, original_index, insert_index):
+    def _iter_column_keys(self):
         """
-        在邻接矩阵中添加一个新节点，该节点与指定节点具有相同的邻接关系，并与指定节点相连
-
-        参数:
-        adj_matrix (np.ndarray): 原始邻接矩阵 (n x n)
-        original_index (int): 要复制的原始节点索引 (0-based)
-        insert_index (int): 新节点要插入的位置索引 (0-based)
-
-        返回:
-        np.ndarray: 新的邻接矩阵 ((n+1) x (n+1))
+        Bytes and sum of every column of the form-feature matrix, equal columns having equal bytes. A sparse (CSC)
+        matrix is read column by column from its arrays, without building the dense matrix.
+        :return: generator of (key, column sum)
         """
-        n = adj_matrix.shape[0]
-
-        # 创建新的 (n+1) x (n+1) 矩阵
-        new_adj_matrix = np.zeros((n + 1, n + 1), dtype=adj_matrix.dtype)
-
-        # 复制原始矩阵数据（跳过插入位置）
-        # 上半部分（插入位置之前）
-        new_adj_matrix[:insert_index, :insert_index] = adj_matrix[:insert_index, :insert_index]
-        new_adj_matrix[:insert_index, insert_index + 1:] = adj_matrix[:insert_index, insert_index:]
-
-        # 下半部分（插入位置之后）
-        new_adj_matrix[insert_index + 1:, :insert_index] = adj_matrix[insert_index:, :insert_index]
-        new_adj_matrix[insert_index + 1:, insert_index + 1:] = adj_matrix[insert_index:, insert_index:]
-
-        # 确定原始节点在新矩阵中的位置
-        pos_old = original_index if original_index < insert_index else original_index + 1
-
-        # 复制原始节点的邻接关系到新节点
-        # 处理插入位置之前的列
-        if insert_index > 0:
-            new_adj_matrix[insert_index, :insert_index] = adj_matrix[original_index, :insert_index]
-            new_adj_matrix[:insert_index, insert_index] = adj_matrix[original_index, :insert_index]
-
-        # 处理插入位置之后的列
-        if insert_index < n:
-            new_adj_matrix[insert_index, insert_index + 1:] = adj_matrix[original_index, insert_index:]
-            new_adj_matrix[insert_index + 1:, insert_index] = adj_matrix[original_index, insert_index:]
-
-        # 设置新节点与原始节点之间的邻接关系为1
-        new_adj_matrix[insert_index, pos_old] = 1
-        new_adj_matrix[pos_old, insert_index] = 1
-
-        return new_adj_matrix
-
-
-
-    def update_record(self, record, insert_index):
-        """
-        update the record of merged feature columns
-        """
-        for original_index, new_original_index in record.items():
-            if new_original_index >= insert_index:
-                record[original_index] = new_original_index + 1
-        return record
+        if is_sparse(self.tfM):
+            columns = self.tfM
+            for i in range(columns.shape[1]):
+                rows = columns.indices[columns.indptr[i]:columns.indptr[i + 1]].astype(np.int64)
+                data = columns.data[columns.indptr[i]:columns.indptr[i + 1]].astype(np.float64)
+                yield rows.tobytes() + data.tobytes(), data.sum()
+            return
+        # adding 0.0 turns -0.0 into 0.0 so that equal columns have equal bytes
+        columns = np.ascontiguousarray(self.tfM.T, dtype=np.float64) + 0.0
+        column_sums = columns.sum(axis=1)
+        for i, col in enumerate(columns):
+            yield col.tobytes(), column_sums[i]
 
 
 
     def get_unmerged_matrix(self, adj_matrix):
         """
-        restore the merged feature columns to maintain consistency with the features in the form-feature matrix
+        restore the merged feature columns to maintain consistency with the features in the form-feature matrix.
+        a restored feature has the same adjacency as the feature it was merged into, and all the features merged
+        together are connected to each other with weight 1.
         """
-        record = dict()
-        for i in range(adj_matrix.shape[0]):
-            record[i] = i
-        for original_index, insert_index in self.merge_feat_info:
-            new_original_index = record[original_index]
-            adj_matrix = self.add_node(adj_matrix, new_original_index, insert_index)
-            record = self.update_record(record, insert_index)
-        return adj_matrix
+        if not self.merge_feat_info:
+            return adj_matrix
+        index = self.unmerged_index
+        # both triangles, so that a restored feature also keeps the edges stored on the other side
+        sym_matrix = np.where(adj_matrix != 0, adj_matrix, adj_matrix.T)
+        unmerged_matrix = sym_matrix[np.ix_(index, index)]
+        # clique between the features merged together
+        same_feature = index[:, None] == index[None, :]
+        np.fill_diagonal(same_feature, False)
+        unmerged_matrix[same_feature] = 1
+        return unmerged_matrix
 
 
 
+    @timed('calculate_semantic_relations')
     def calculate_semantic_relations(self, matrix: np.ndarray,
                                      calc_type: str = 'G') -> np.ndarray:
         """
         compute the weights in the adjacency matrix
         """
         # input validation
-        if not isinstance(matrix, np.ndarray):
-            raise ValueError("the input must be a NumPy array")
+        if not isinstance(matrix, (np.ndarray, PackedMatrix)) and not is_sparse(matrix):
+            raise ValueError("the input must be a NumPy array, a PackedMatrix or a SciPy sparse matrix")
 
         if matrix.ndim != 2:
             raise ValueError("the input must be a 2D array")
 
-        if calc_type not in ['G', 'J', 'D']:
-            raise ValueError("the computation type must be 'G', 'J', or 'D'")
+        if calc_type not in RELATIONS:
+            raise ValueError("the computation type must be one of " + ", ".join(f"'{t}'" for t in RELATIONS))
 
         n_forms, n_features = matrix.shape
 
-        # compute the occurrence frequency of each semantic feature
-        feature_freq = np.sum(matrix, axis=0)  # 形状: (n_features,)
-
-        # initialize the adjacency matrix
-        adj_matrix = np.zeros((n_features, n_features))
-
-        if calc_type == 'G':
-            # Co-occurrence frequency = matrix transpose multiplied by the matrix
-            adj_matrix = matrix.T @ matrix * (1-self.zeroOcc) + (1 - matrix).T @ (1 - matrix) * self.zeroOcc
-
-        elif calc_type == 'J':
-            # Jaccard similarity = |Intersection| / |Union|
-            # |Intersection| = co-occurrence frequency
-            # |Union| = freq(A) + freq(B) - co-occurrence frequency
-            cooccurrence = matrix.T @ matrix
-            for i in range(n_features):
-                for j in range(n_features):
-                    if i == j:
-                        adj_matrix[i, j] = 0.0
-                    else:
-                        union = feature_freq[i] + feature_freq[j] - cooccurrence[i, j]
-                        if union > 0:
-                            adj_matrix[i, j] = 0.1*cooccurrence[i, j] / union + cooccurrence[i, j]*0.9
-                        else:
-                            adj_matrix[i, j] = 0.0
-
-        elif calc_type == 'D':
-            # Dice coefficient = 2 * |Intersection| / (|A| + |B|)
-            cooccurrence = matrix.T @ matrix
-
-            for i in range(n_features):
-                for j in range(n_features):
-                    if i == j:
-                        adj_matrix[i, j] = 0.0
-                    else:
-                        total = feature_freq[i] + feature_freq[j]
-                        if total > 0:
-                            adj_matrix[i, j] = 2 * cooccurrence[i, j] / total
-                        else:
-                            adj_matrix[i, j] = 0.0
+        # co-occurrence frequency and occurrence frequency of each semantic feature
+        cooccurrence, feature_freq = get_cooccurrence(matrix)
+
+        # all association measures are broadcast over the co-occurrence matrix
+        adj_matrix = RELATIONS[calc_type](cooccurrence, feature_freq, n_forms, self.zeroOcc)
 
         return adj_matrix
 
@@ -200,89 +210,143 @@ class SemanticMap(object):
         To construct an undirected acyclic (fully connected) graph according to a term-feature matrix
         """
 
-        if not self.adjM:
+        if self.adjM is None:
             adj_matrix = self.calculate_semantic_relations(self.tfM, self.calc_type)
             self.adjM = np.triu(adj_matrix) # get the upper triangular matrix
 
         # set the diagonal of the matrix to zero
         np.fill_diagonal(self.adjM, val=0)
-        self.G = nx.from_numpy_array(self.adjM)
 
 
 
+    @timed('get_optimal_SpanningTrees')
     def get_optimal_SpanningTrees(self):
         """
-        To get all the spanning trees given a graph. The trees should be ordered according to its sum of weights.
+        To get the maximum-weight spanning trees given a graph.
+        In the 'optimal' mode, only the tied optimal trees are considered and the candidates are picked by the
+        standard deviation of their degrees. All of them are enumerated when there are at most self.max_trees;
+        beyond that, self.max_trees of them are drawn uniformly at random (seeded by self.seed), so that the picked
+        trees are ranked over the whole optimal set rather than over an arbitrary prefix of the enumeration.
+        In the 'k_best' mode, the candidates are the self.n_candidates heaviest trees, optimal or not, ordered by
+        decreasing total weight.
+        In the 'near_optimal' mode, the trees within self.tolerance or self.relative_tolerance of the optimal total
+        weight are enumerated instead of the exactly tied ones, and picked like in the 'optimal' mode.
+        In the 'min_std' mode, the first candidate is the optimal tree of lowest degree std found by a
+        branch-and-bound search within self.search_budget, the others are picked like in the 'optimal' mode.
         """
+        if self.candidate_mode not in CANDIDATE_MODES:
+            raise ValueError("the candidate mode must be one of " + ", ".join(f"'{m}'" for m in CANDIDATE_MODES))
 
         self.connected_graph()
-
-        # trees = nx.algorithms.tree.mst.SpanningTreeIterator(self.G, minimum=False)
-        start_trees = time.time()
-        trees = nx.algorithms.tree.SpanningTreeIterator(self.G, minimum=False)
-        end_trees = time.time()
-        print("trees time: ", (end_trees - start_trees)*1000)
-        start_num = time.time()
-        number_trees = nx.algorithms.tree.number_of_spanning_trees(self.G)
-        end_num = time.time()
-        print("Spanning Trees: ", number_trees, (end_num-start_num)*1000)
-
-        max_weight = 0
-        start_std = time.time()
-        for index, tree in enumerate(trees):
-            # compute the sum of all edge weights
-            total_weight = sum(d['weight'] for u, v, d in tree.edges(data=True))
-            # the number of edges connected to each node.
-            deg = [d for _, d in tree.degree()]
-            deg_std = np.std(deg)
-            if index == 0:
-                max_weight = total_weight
-            if total_weight < max_weight or index >= 6000:
-                print(index)
-                break
-            self.trees.append((tree, deg_std))
-        end_std = time.time()
-        print("std time: ", (end_std - start_std)*1000)
-        start_sort = time.time()
-        self.trees = sorted(self.trees, key=lambda x: x[1], reverse=False) ## 修改这里！！！ 效率问题 别带着tree进行排序
-        end_sort = time.time()
-        print("sort time: ", (end_sort - start_sort)*1000)
-
-        start_sample = time.time()
-        # perform random sampling to enhance the diversity of candidate trees
-        if len(self.trees) > 5:
-            new_trees= []
-            # always include the first one, which by default is the optimal tree
-            new_trees.append(self.trees[0])
-            all_selected_index = np.linspace(1, len(self.trees)-2, 3, dtype=int)
-            for selected_index in all_selected_index:
-                new_trees.append(self.trees[selected_index])
-            # retain the worst-performing tree
-            new_trees.append(self.trees[-1])
-            self.trees = new_trees
-
-        # self.trees = self.trees[:5]
-        self.trees = [item[0] for item in self.trees]
-        end_sample = time.time()
-        print("sample time: ", (end_sample-start_sample)*1000)
-
-
-
-    def get_poss_subgraph(self, graph, max_size=5):
+        start = time.perf_counter()
+        self.time_capped = False
+
+        log_number_trees = None
+        if self.diagnostics or self.candidate_mode in ['optimal', 'min_std']:
+            # number of optimal trees, also deciding whether the optimal mode enumerates or samples them
+            with span('count_optimal_trees'):
+                log_number_trees = count_optimal_trees(self.adjM)
+        if self.diagnostics:
+            self.diagnostics_info['log10_optimal_trees'] = float(log_number_trees / np.log(10))
+            self.diagnostics_info['num_optimal_trees'] = round(float(np.exp(log_number_trees))) if log_number_trees < 700 else None
+
+        if self.candidate_mode == 'k_best':
+            with span('enumerate_trees'):
+                self.trees = list(iter_k_best_trees(self.adjM, self.n_candidates, self.time_budget))
+            self.time_capped = self.time_budget is not None and time.perf_counter() - start > self.time_budget
+            count('trees_enumerated', len(self.trees))
+            if self.diagnostics:
+                self.diagnostics_info['num_enumerated_trees'] = len(self.trees)
+                # total weight of every candidate, the first one being optimal
+                self.diagnostics_info['tree_weights'] = [float(edges_to_matrix(tree, self.adjM).sum() / 2)
+                                                         for tree in self.trees]
+            return
+
+        sample_stats = dict()
+        with span('enumerate_trees'):
+            if self.candidate_mode == 'near_optimal':
+                # one tree past max_trees tells whether the band holds more trees than the cap
+                trees = iter_near_optimal_trees(self.adjM, self.tolerance, self.relative_tolerance,
+                                                None if self.max_trees is None else self.max_trees + 1,
+                                                self.time_budget)
+                selector, capped = self._rank_trees(trees)
+                band_count = selector.count + capped
+                if capped:
+                    # the enumeration reaches the trees closest to the optimum first, the candidates are ranked
+                    # over a uniform sample of the whole band instead
+                    trees = iter_band_samples(self.adjM, self.tolerance, self.relative_tolerance, self.max_trees,
+                                              self.seed, self.time_budget, stats=sample_stats)
+                    selector, _ = self._rank_trees(trees)
+            else:
+                # every optimal tree up to max_trees of them, a uniform sample beyond
+                trees = iter_uniform_trees(self.adjM, self.max_trees, self.seed, self.time_budget,
+                                           stats=sample_stats, log_count=log_number_trees)
+                selector, _ = self._rank_trees(trees)
+        self.time_capped = self.time_budget is not None and time.perf_counter() - start > self.time_budget
+        count('trees_enumerated', selector.count)
+        if self.diagnostics:
+            self.diagnostics_info['num_enumerated_trees'] = selector.count
+            # repeated draws are dropped, so a sample can hold fewer distinct trees than max_trees
+            self.diagnostics_info['trees_sampled'] = sample_stats.get('draws') is not None
+            self.diagnostics_info['num_sample_draws'] = sample_stats.get('draws')
+        if self.diagnostics and self.candidate_mode == 'near_optimal':
+            optimal_weight, min_weight = get_band_weight(self.adjM, self.tolerance, self.relative_tolerance)
+            self.diagnostics_info['optimal_weight'] = optimal_weight
+            self.diagnostics_info['band_min_weight'] = min_weight
+            # trees of the band counted by the enumeration, only a lower bound when it stopped at max_trees + 1
+            # trees or time_budget may have stopped it
+            lower_bound = capped or self.time_capped
+            self.diagnostics_info['num_band_trees'] = band_count
+            self.diagnostics_info['num_band_trees_is_lower_bound'] = lower_bound
+            if lower_bound:
+                self.diagnostics_info['band_note'] = (
+                    f"At least {band_count} trees in the band: the enumeration stopped after the first "
+                    f"{band_count} trees it reached, the closest to the optimum, which are only a lower bound on "
+                    f"the band size." + (" The candidates are ranked over a uniform random sample of the whole band."
+                                         if capped else ""))
+            else:
+                self.diagnostics_info['band_note'] = f"Exactly {band_count} trees in the band, all ranked."
+        with span('select_trees'):
+            self.trees = selector.select()
+
+        if self.candidate_mode == 'min_std':
+            with span('search_min_std_tree'):
+                search = find_min_std_tree(self.adjM, self.search_budget)
+            # an uncertified search was stopped by its budget
+            self.time_capped = self.time_capped or not search['certified']
+            key = lambda tree: frozenset(map(tuple, np.sort(tree, axis=1).tolist()))
+            best_key = key(search['tree'])
+            others = [tree for tree in self.trees if key(tree) != best_key]
+            self.trees = ([search['tree']] + others)[:self.n_candidates]
+            if self.diagnostics:
+                self.diagnostics_info['min_deg_std'] = search['deg_std']
+                # lowest degree std that the unexplored branches could reach, the gap is 0 once certified
+                self.diagnostics_info['min_deg_std_lower_bound'] = search['lower_bound']
+                self.diagnostics_info['min_deg_std_gap'] = search['deg_std'] - search['lower_bound']
+                self.diagnostics_info['min_deg_std_certified'] = search['certified']
+
+
+
+    def _rank_trees(self, trees):
         """
-        Find all possible connected subgraphs in the current graph.
-        :param graph: current graph
-        :return: list of connected subgraphs
+        Stream trees into a TreeSelector by degree std, stopping once self.max_trees have been ranked.
+        :param trees: iterable of (m, 2) edge arrays
+        :return: TreeSelector, whether a tree past self.max_trees was left out
         """
-        nodes = list(graph.nodes)
-        poss_subG_list = []
-
-        for r in range(2, max_size):
-            for node_combination in combinations(nodes, r):
-                sub_graph = graph.subgraph(node_combination)
-                if nx.is_connected(sub_graph):
-                    poss_subG_list.append(sub_graph)
-        return poss_subG_list
+        n_nodes = self.adjM.shape[0]
+        # keep the best, quantile and worst trees by degree std while the trees are generated
+        selector = TreeSelector(self.n_candidates, self.diversity)
+        for tree in trees:
+            if self.max_trees is not None and selector.count >= self.max_trees:
+                return selector, True
+            # the number of edges connected to each node.
+            deg = np.bincount(tree.ravel(), minlength=n_nodes)
+            selector.add(tree, np.std(deg))
+            if self.progress is not None and selector.count % 100 == 0:
+                self.progress('trees_enumerated', selector.count)
+        if self.progress is not None:
+            self.progress('trees_enumerated', selector.count)
+        return selector, False
 
 
 
@@ -296,6 +360,16 @@ class SemanticMap(object):
 
 
 
+    def get_gt_edges(self):
+        """
+        Return the symmetric boolean edge matrix of the ground truth, built once.
+        """
+        if self.gt_edges is None and self.GT_adj is not None:
+            self.gt_edges = self.norm_matrix(self.GT_adj) != 0
+        return self.gt_edges
+
+
+
     def evaluate_against_gt(self, pre_matrix):
         """
         Evaluate accuracy, precision, recall, and F1 score against the ground truth
@@ -306,53 +380,82 @@ class SemanticMap(object):
             if self.GT_adj is None:
                 return None
 
-            pre_matrix = self.get_unmerged_matrix(pre_matrix)
-            pre_matrix = self.norm_matrix(pre_matrix)
-            gt_matrix = self.norm_matrix(self.GT_adj)
-            # gt_matrix = self.norm_matrix(gt_matrix)
-            acc = np.sum((pre_matrix!=0) == (gt_matrix!=0)) / (gt_matrix.shape[0] ** 2)
-
-            true_edges = (gt_matrix != 0)
-            pred_edges = (pre_matrix != 0)
-
-            # tp: predicted edge exists and ground truth edge exists
-            tp = np.sum(true_edges & pred_edges)
-            # fp: predicted edge exists but ground truth edge does not exist
-            fp = np.sum(~true_edges & pred_edges)
-            # fn: ground truth edge exists but predicted edge does not exist
-            fn = np.sum(true_edges & ~pred_edges)
-            # tn: ground truth edge does not exist and predicted edge does not exist
-            # tn = np.sum(~true_edges & ~pred_edges)
-
-            precision = tp / (tp + fp) if (tp + fp) > 0 else 0
-            recall = tp / (fn + tp) if (fn + tp) > 0 else 0
-            f1 = 2 * precision * recall / (precision + recall) if (precision + recall) > 0 else 0
-
-            return {"acc": acc, "precision": precision, "recall": recall, "f1": f1}
+            unmerged_index = self.unmerged_index if self.merge_feat_info else None
+            evaluation = get_gt_metrics(np.asarray(pre_matrix)[None], self.get_gt_edges(), unmerged_index)
+            return {name: float(values[0]) for name, values in evaluation.items()}
         except Exception as e:
             print(e)
             return {}
 
 
 
-    def find_cycles_networkx(self, nx_graph):
+    @timed('get_evaluation_metrics')
+    def get_evaluation_metrics(self, adj_matrices, selected_ins):
         """
-        使用NetworkX快速找到环的个数和节点信息
-
-        参数:
-        nx_graph: NetworkX图对象
-
-        返回:
-        tuple: (环的总数, 环信息列表)
+        Evaluate several semantic maps at once.
+        The edge, degree, cycle and ground truth metrics are computed on the stacked adjacency matrices, only the
+        form connectivity and the productivity are computed map by map.
+        :param adj_matrices: list of adjacency matrices, or a (K, D, D) array
+        :param selected_ins: form index list
+        :return: list of metric dicts
         """
-        # 获取所有环的基础集合
-        cycles = nx.cycle_basis(nx_graph)
-
-        cycle_mean_length = 0
-        for i, cycle in enumerate(cycles):
-            cycle_mean_length += 1/len(cycle)
+        try:
+            adj_stack = np.asarray(adj_matrices, dtype=np.float64)
+            n_maps, n_nodes = adj_stack.shape[0], adj_stack.shape[1]
+            graph_metrics = get_graph_metrics(adj_stack)
 
-        return len(cycles), cycle_mean_length/len(cycles) if cycle_mean_length > 0 else 0
+            # acc，p, r, f1
+            evaluation = None
+            if self.GT_adj is not None:
+                unmerged_index = self.unmerged_index if self.merge_feat_info else None
+                evaluation = get_gt_metrics(adj_stack, self.get_gt_edges(), unmerged_index)
+
+            # edges of every map, ordered by map
+            graph, u, v, _ = get_stack_edges(adj_stack)
+            bounds = np.searchsorted(graph, np.arange(n_maps + 1))
+            selected_ins = np.asarray(selected_ins, dtype=np.int64)
+            selected_tfM = self.tfM.member(selected_ins)
+
+            count('candidates_evaluated', n_maps)
+            metrics_list = list()
+            for k in range(n_maps):
+                # connectivity status of the subgraph corresponding to the selected forms, checked in one batch
+                edges = np.stack([u[bounds[k]:bounds[k + 1]], v[bounds[k]:bounds[k + 1]]], axis=1)
+                connected_flag_list, unconnected_index = check_forms_connectivity(edges, selected_tfM)
+                count('connectivity_checks', len(selected_ins))
+                # names of the forms corresponding to all disconnected subgraphs
+                unconnected_forms = [self.formNames[form_idx] for form_idx in selected_ins[unconnected_index]]
+
+                # coverage, productivity
+                coverage = float(np.sum(connected_flag_list) / len(selected_ins))
+                productivity = None
+                # connected subgraphs with 2 to D - 1 nodes, counted without enumerating node combinations, the
+                # productivity is unavailable (None, productivity_truncated) when the map is over the count limit
+                size_counts = count_connected_subgraphs(n_nodes, edges, self.count_limit)
+                num_poss_subgraph = None if size_counts is None else int(sum(size_counts[2:n_nodes]))
+                if num_poss_subgraph is None:
+                    count('productivity_unavailable')
+                elif num_poss_subgraph > 0:
+                    productivity = int(np.sum(connected_flag_list)) / num_poss_subgraph
+
+                metrics_list.append({
+                    "acc": float(evaluation['acc'][k]) if evaluation else None,
+                    "prec": float(evaluation['precision'][k]) if evaluation else None,
+                    "recall": float(evaluation['recall'][k]) if evaluation else None,
+                    "F1": float(evaluation['f1'][k]) if evaluation else None,
+                    "weight_sum": float(graph_metrics['weight_sum'][k]),
+                    "deg_mean": float(graph_metrics['deg_mean'][k]),
+                    "deg_std": float(graph_metrics['deg_std'][k]),
+                    "productivity": productivity,
+                    "productivity_truncated": num_poss_subgraph is None,
+                    "coverage": coverage,
+                    "unconnected_forms": unconnected_forms,
+                    "num_edges": int(graph_metrics['num_edges'][k]) # 前端是否需要？
+                })
+            return metrics_list
+        except Exception as e:
+            print(e)
+            return [{} for _ in range(len(adj_matrices))]
 
 
 
@@ -363,65 +466,7 @@ class SemanticMap(object):
         :param selected_ins: form index list
         :return:
         """
-        try:
-            nx_graph = nx.from_numpy_array(adj_matrix)
-
-            # 环情况
-            circle_num, circle_mean_length = self.find_cycles_networkx(nx_graph)
-            print("环总数：", circle_num)
-            print(f"环平均长度：{circle_mean_length:.3f}")
-
-            # connectivity status of the subgraph corresponding to the selected forms
-            connected_flag_list = []
-            # names of the forms corresponding to all disconnected subgraphs
-            unconnected_forms = []
-            # iterate over each form and examine the connectivity of the subgraph
-            for form_idx, form in enumerate(self.tfM[selected_ins, :]):
-                # construct subgraph based on non-zero features
-                sub_nx_graph = nx_graph.subgraph({ix for ix, semantics in enumerate(form) if semantics > 0})
-                # check the connectivity of the subgraph
-                connected_flag = nx.is_connected(sub_nx_graph)
-                connected_flag_list.append(connected_flag)
-                if not connected_flag:
-                    unconnected_forms.append(self.formNames[form_idx])
-
-            # coverage, productivity
-            coverage = sum(connected_flag_list) / len(selected_ins)
-            productivity = None
-            if len(self.unique_featNames) < 20:
-                poss_subgraph_list = self.get_poss_subgraph(nx_graph, len(self.unique_featNames))
-                productivity = sum(connected_flag_list) / len(poss_subgraph_list)
-
-            # degree
-            deg = [d for _, d in nx_graph.degree()]
-            deg_mean = np.mean(deg)
-            deg_std = np.std(deg)
-
-            # acc，p, r, f1
-            evaluation = self.evaluate_against_gt(adj_matrix)
-
-            # weight sum
-            weight_sum = sum(data.get('weight', 1) for u, v, data in nx_graph.edges(data=True))
-
-            # number of edges
-            num_edges = nx_graph.number_of_edges()
-
-            return {
-                "acc": evaluation.get("acc", None),
-                "prec": evaluation.get("precision", None),
-                "recall": evaluation.get("recall", None),
-                "F1": evaluation.get("f1", None),
-                "weight_sum": weight_sum,
-                "deg_mean": deg_mean,
-                "deg_std": deg_std,
-                "productivity": productivity,
-                "coverage": coverage,
-                "unconnected_forms": unconnected_forms,
-                "num_edges": num_edges # 前端是否需要？
-            }
-        except Exception as e:
-            print(e)
-            return {}
+        return self.get_evaluation_metrics([adj_matrix], selected_ins)[0]
 
 
 
@@ -430,14 +475,13 @@ class SemanticMap(object):
         return the fully connected adjacency matrix and the adjacency matrices of all candidate trees.
         """
         # generate candidate trees
-        start = time.time()
         self.get_optimal_SpanningTrees()
-        end = time.time()
-        print(f"get_all_matrix time: {end-start}")
         # fully connected adjacency matrix and the adjacency matrices corresponding to candidate trees
         return {
             'origin_matrix': self.adjM,
-            'trees': [nx.to_numpy_array(tree) for tree in self.trees]
+            'trees': [edges_to_matrix(tree, self.adjM) for tree in self.trees],
+            'diagnostics': self.diagnostics_info,
+            'time_capped': self.time_capped
         }
 
 
@@ -449,165 +493,75 @@ class SemanticMap(object):
         :param selected_ins: The index list corresponding to the form that requires connectivity check
         :return: unconnected_forms: Unconnected form list
         """
-        # 子图连通标志
-        # connected_flag_list = []
-        unconnected_forms = []
-
-        # 遍历每个form 查看每个form对应的所有语义节点构成的子图的连接情况
-        for form_index in selected_ins:
-            form = self.tfM[form_index, :]
-            # 根据子节点构建子图
-            sub_nx_graph = nx_graph.subgraph({ix for ix, semantics in enumerate(form) if semantics > 0})
-            # 判断连通性
-            connected_flag = nx.is_connected(sub_nx_graph)
-            # connected_flag_list.append(connected_flag)
-            # 记录未连通的form index
-            if not connected_flag:
-                unconnected_forms.append(form_index)
+        selected_ins = np.asarray(selected_ins, dtype=np.int64)
+        if len(selected_ins) == 0:
+            return []
+        edges = np.array(nx_graph.edges(), dtype=np.int64).reshape(-1, 2)
+        # 批量判断每个form对应的所有语义节点构成的子图的连通性
+        _, unconnected_index = check_forms_connectivity(edges, self.tfM.member(selected_ins))
+        count('connectivity_checks', len(selected_ins))
+        # 记录未连通的form index
+        unconnected_forms = selected_ins[unconnected_index].tolist()
         return unconnected_forms
 
 
 
-    def get_candidate_edges(self, unconnect_form_index_list) -> list:
-        """
-        Retrieve candidate edges for merging based on all disconnected forms.
-        :param unconnect_form_index_list: unconnected form index
-        :return: Sorted candidate edge list
-        """
-        possible_edges = []
-
-        # 逐 form 遍历
-        for form_index in unconnect_form_index_list:
-            # 不连通的 form
-            feat_list = [feat_index for feat_index in range(len(self.unique_featNames)) if
-                         self.tfM[form_index, feat_index] != 0]
-            # print(feat_list)
-            # print(nx.to_numpy_array(self.G))
-            if len(feat_list) < 2:
-                continue
-            # 获取边的权重
-            for feat_index in range(len(feat_list)):
-                for feat_index_after in range(feat_index + 1, len(feat_list)):
-                    node1 = feat_list[feat_index]
-                    node2 = feat_list[feat_index_after]
-                    edge = self.G.get_edge_data(node1, node2)
-                    weight = 0.00001
-                    if edge:
-                        weight = self.G.get_edge_data(node1, node2)['weight']
-                    possible_edges.append((node1, node2, {'weight': weight}))
-
-        # 统计边的次数（只考虑节点对，忽略权重）
-        edges_without_attributes = [(u, v) for u, v, _ in possible_edges]
-        edge_counts = Counter(edges_without_attributes)
-
-        # 构建一个包含次数和最大权重的结构
-        edge_info = {}
-        for u, v, attr in possible_edges:
-            edge = (u, v)
-            weight = attr['weight']
-            if edge not in edge_info:
-                edge_info[edge] = {"count": edge_counts[edge], "max_weight": weight} # 优先级考虑，先count再weight
-            else:
-                edge_info[edge]["max_weight"] = max(edge_info[edge]["max_weight"], weight)
-
-        # 排序：按次数和最大权重的累加降序进行排序
-        # sorted_edges_by_number = sorted(
-        #     edge_info.items(),
-        #     key=lambda x: x[1]["count"] + x[1]["max_weight"],
-        #     reverse=True,
-        # )
-        # 排序：优先按照count再根据weight进行降序排序
-        sorted_edges_by_number = sorted(
-            edge_info.items(),
-            key=lambda x: (-x[1]["count"], -x[1]["max_weight"])
-        )
-        sorted_edges_by_number = [(edge[0], edge[1], {'weight': info['max_weight'], 'count': info['count']}) for
-                                  edge, info in sorted_edges_by_number]
-
-        return sorted_edges_by_number
-
-
+    def get_pair_index(self):
+        """
+        Return the feature pair -> forms inverted index of the form-feature matrix, built once.
+        """
+        if self.pair_index is None:
+            self.pair_index = PairFormIndex(self.tfM)
+        return self.pair_index
 
-    def merge_edge(self, adj_matrix):
 
-        start = time.time()
-        self.connected_graph()
 
-        # 选择所有form
-        selected_ins = range(len(self.formNames))
+    @timed('merge_edge')
+    def merge_edge(self, adj_matrix, progress=None):
+        """
+        Greedily add edges until the subgraph of every form is connected.
+        Each round adds the candidate edge that connects the most forms, ties are broken by the candidate order
+        (count, then weight). The per-form components and the candidate counts are updated in place.
+        :param adj_matrix: adjacency matrix of the current map
+        :param progress: progress(name, value) callback, called with the number of added edges every
+                         MERGE_PROGRESS_INTERVAL edges, see jobs.JobManager
+        :return: merged adjacency matrix, list of added edges (u, v, weight)
+        """
+        if self.adjM is None:
+            self.connected_graph()
 
-        nx_graph = nx.from_numpy_array(adj_matrix)
+        edges, _ = get_edge_arrays(adj_matrix)
+        merged_matrix = edges_to_matrix(edges, adj_matrix)
 
         # 原始图的子图连接情况
-        unconnect_form_index_list = self.check_subgraph_connectivity(nx_graph, selected_ins)
-        sorted_edges_by_number = self.get_candidate_edges(unconnect_form_index_list)
+        pair_index = self.get_pair_index()
+        components = FormComponents(edges, self.tfM, pair_index)
+        unconnected = components.n_components > 1
+        # 候选边：未连通form中的节点对，按count再按weight排序
+        candidates = CandidateEdgeQueue(pair_index, self.adjM, unconnected, edges.tolist())
 
         # 'CO-CD'
         # 添加的边需要高亮出来
         highlight_edges = list()
 
         # 全连通后跳出循环停止merge
-        while unconnect_form_index_list and sorted_edges_by_number:
-            # last_unconnect_form_index_list = unconnect_form_index_list
-
-            # 首先是最大count的edge
-            confirm_edge = sorted_edges_by_number[0]
-            # 可能引起的未连通变化
-            max_unconnected_form_change = 0
-            new_unconnect_form_index_list = unconnect_form_index_list
-            # 第一个未出现在图中的候选边
-            is_first_edge = True
-
-            for index, e in enumerate(sorted_edges_by_number):
-                # 构建临时图 深拷贝
-                temporary_graph = copy.deepcopy(nx_graph)
-
-                # 在图中 跳过
-                if (e[0], e[1]) in temporary_graph.edges or (e[1], e[0]) in temporary_graph.edges:
-                    continue
-                # 不在图中
-                else:
-                    if is_first_edge:
-                        confirm_edge = e
-                        is_first_edge = False
-                    # 给临时graph添加候选边
-                    temporary_graph.add_edge(e[0], e[1], **e[2])
-                    # 查看添加候选边后未连通子图的变化情况
-                    temporary_unconnect_form_index_list = self.check_subgraph_connectivity(temporary_graph, unconnect_form_index_list)
-                    # 变化的数量
-                    unconnected_form_change = len(unconnect_form_index_list) - len(temporary_unconnect_form_index_list)
-                    # 更新本轮的最大变化 以及 带来变化的候选边 以及变化后的未连通子图情况
-                    # 必须是大于，不能是大于等于
-                    if unconnected_form_change > max_unconnected_form_change:
-                        max_unconnected_form_change = unconnected_form_change
-                        confirm_edge = e
-                        new_unconnect_form_index_list = temporary_unconnect_form_index_list
-                    # temporary_graph.remove_edge(e[0], e[1])
+        while True:
+            # 连通form最多的候选边，相同时取排序靠前的边
+            confirm_edge = candidates.select(components.count_connected_by())
+            if confirm_edge is None:
+                break
 
             # 添加边
-            nx_graph.add_edge(confirm_edge[0], confirm_edge[1], **confirm_edge[2])
-            highlight_edges.append((confirm_edge[0], confirm_edge[1], confirm_edge[2].get('weight')))
-            # 更新未连通情况：merge当前边后的未连通情况
-            unconnect_form_index_list = new_unconnect_form_index_list
-            # 更新候选边：从候选列表中剔除已经被merge的边
-            sorted_edges_by_number = self.get_candidate_edges(unconnect_form_index_list)
-
-            ## 有可能添加了某个边后子图连通性未发生任何变化！！！！！！
-
-
-        nx_graph_merged_matrix = nx.to_numpy_array(nx_graph)
-        print(highlight_edges)
-
-        end = time.time()
-        print(f"merge_edge time: {end-start}")
-
-        return nx_graph_merged_matrix, highlight_edges
-
-
-
-
-
-
-
-
-
+            u, v, weight = confirm_edge
+            merged_matrix[u, v] = merged_matrix[v, u] = weight
+            candidates.add_edge(u, v)
+            highlight_edges.append((u, v, weight))
+            # 更新未连通情况：merge当前边后新连通的form不再参与候选边计数
+            for form in components.add_edge(u, v):
+                candidates.form_connected(form)
+            if progress is not None and len(highlight_edges) % MERGE_PROGRESS_INTERVAL == 0:
+                progress('merged_edges', len(highlight_edges))
+
+        count('merge_iterations', len(highlight_edges))
+
+        return merged_matrix, highlight_edges
@@ -1,14 +1,66 @@
-from flask import Flask, request, jsonify, send_from_directory
-from SMM import SemanticMap
-from utils import port
+from flask import Flask, request, jsonify, send_from_directory, Response, stream_with_context, g
+from flask import json as flask_json
+from SMM import SemanticMap, CANDIDATE_MODES
+from session import SessionCache, DatasetSession, get_content_key
+from result_cache import ResultCache, get_result_key
+from jobs import JobManager, FINAL_STATES
+from evaluation import EvaluationPool
+from tables import read_upload
+from incremental import IncrementalMetrics
+from instrumentation import configure, span, start_trace, end_trace, current_trace, REGISTRY, SamplingProfiler
+from utils import port, session_cache_size, session_ttl, result_cache_dir, result_cache_size
+from utils import job_workers, job_history, job_poll_interval, eval_workers, eval_parallel_min_size, max_candidates
+from utils import max_upload_size, instrumentation_enabled, profile_slow_requests, profile_interval, profile_dir
+from utils import max_search_budget
 
 import numpy as np
 import pandas as pd
-import uuid
 import traceback
 import time
+import glob
+import os
+import copy
 
 app = Flask(__name__, static_folder='./')
+app.config['MAX_CONTENT_LENGTH'] = max_upload_size
+# prepared datasets of the uploaded tables, shared by the merge and edit requests
+sessions = SessionCache(session_cache_size, session_ttl)
+app_dir = os.path.dirname(os.path.abspath(__file__))
+# candidate maps and metrics of the processed tables, shared across users and restarts
+results = ResultCache(os.path.join(app_dir, result_cache_dir), result_cache_size)
+# background jobs for the long-running requests
+jobs = JobManager(job_workers, job_history)
+# worker processes evaluating the large batches of candidate maps, shared by all the requests
+evaluation_pool = EvaluationPool(eval_workers, eval_parallel_min_size)
+# spans and counters of the pipeline stages
+configure(instrumentation_enabled)
+
+
+@app.before_request
+def start_request_trace():
+    """
+    Time the stages of every request, and sample its stack when slow requests are profiled.
+    """
+    g.start = time.perf_counter()
+    if instrumentation_enabled:
+        g.trace, g.trace_token = start_trace()
+    if profile_slow_requests is not None:
+        g.profiler = SamplingProfiler(profile_interval).start()
+
+
+@app.teardown_request
+def end_request_trace(error=None):
+    seconds = time.perf_counter() - g.get('start', time.perf_counter())
+    # a streamed response tears the request down a second time once the stream is done
+    trace_token = g.pop('trace_token', None)
+    if trace_token is not None:
+        end_trace(trace_token)
+        REGISTRY.observe('request', request.endpoint or 'unknown', seconds)
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.stop()
+        if seconds >= profile_slow_requests:
+            save_profile(profiler, seconds)
 
 
 @app.route('/')
@@ -21,6 +73,15 @@ def serve_static(path):
     return send_from_directory('./', path)
 
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Latency histograms of the requests and of the pipeline stages, and the counter totals, in the Prometheus
+    text format.
+    """
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.route('/api/process-excel', methods=['POST'])
 def process_excel():
     """
@@ -28,67 +89,58 @@ def process_excel():
     """
     try:
         # Fetch request data
-        data = request.json.get('data', [])
-        label= request.json.get('label', [])
-
-        # Check data.
-        if not data or not isinstance(data, list):
-            return jsonify({'error': 'Invalid data format.'}), 400
-        if not isinstance(label, list):
-            label = []
-
-        # Convert the data into a DataFrame.
-        df = pd.DataFrame(data)
-        df_label = pd.DataFrame(label)
-
-        # Check whether the data is standardized.
-        v_result = validate_data(df)
-        # Validation failed; return error code.
-        if v_result != 'standard':
-            return jsonify({'error': v_result}), 400
-
-        # Process and standardize the data.
-        features, forms, co_occurrence_matrix = process_data(df)
-        ground_truth = process_label(df_label, features)
+        diagnostics = bool(request.json.get('diagnostics', False))
 
-        # Generate the adjacency matrix corresponding to the candidate tree.
-        semantic_maps = SemanticMap(co_occurrence_matrix, features, forms, None, ground_truth, 0, calc_type='G')
-        matrix_data = semantic_maps.get_all_matrix()
-
-        # Convert from matrix to graph format as required by the frontend.
-        graph_data = list()
-        node_labels = semantic_maps.unique_featNames
-
-        # origin_matrix_data = matrix_data.get('origin_matrix')
-        # origin_matrix_data = process_symmetric_matrix(origin_matrix_data)
-        # origin_graph_data = convert_to_graph_data('Initial fully connected conceptual space ', origin_matrix_data, node_labels)
-        # # 评价当前图
-        # origin_evaluation_metric = semantic_maps.get_evaluation_metric(origin_matrix_data, range(len(semantic_maps.formNames)))
-        # origin_graph_data['evaluation_metric'] = origin_evaluation_metric
-        # graph_data.append(origin_graph_data)
-
-        trees_matrix_data = matrix_data.get('trees')
-        start_evaluation = time.time()
-        for index, tree_matrix in enumerate(trees_matrix_data):
-            # Process the symmetric adjacency matrix.
-            tree_matrix = process_symmetric_matrix(tree_matrix)
-            tree_graph_data = convert_to_graph_data('Candidate semantic map '+str(index+1), tree_matrix, node_labels)
-            # Evaluate the current semantic map.
-            tree_evaluation_metric = semantic_maps.get_evaluation_metric(tree_matrix, range(len(semantic_maps.formNames)))
-            tree_graph_data['evaluation_metric'] = tree_evaluation_metric
-            graph_data.append(tree_graph_data)
-        end_evaluation = time.time()
-        print('Evaluation time elapsed: ', (end_evaluation-start_evaluation)*1000)
-
-        # Retrieve the forms and the corresponding nodes for each form in the semantic map.
-        feature_map = semantic_maps.tfM
-        forms_with_nodes = get_forms_with_nodes(df, feature_map)
-
-        ret = {
-            'graph_data': graph_data,
-            'forms_with_nodes': forms_with_nodes
-        }
-        return jsonify(ret)
+        options, error = parse_candidate_options(request.json)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        # Parse the table, or reuse the prepared dataset of an identical upload.
+        handle, session, error = load_session(request.json)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        # Generate the candidate trees and their evaluation, or fetch them from the result cache.
+        candidate_maps = get_candidate_maps(session, diagnostics, options=options)
+        with span('serialize'):
+            ret = build_process_response(handle, session, candidate_maps, diagnostics, is_columnar(request.json))
+        return jsonify(add_timing(request.json, ret))
+
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/api/upload', methods=['POST'])
+def upload_table():
+    """
+    Parse an uploaded .xlsx, .xls or .csv file on the server and prepare its dataset.
+    The multipart form holds the table as 'file' and, for a csv table, the ground truth as an optional 'label' file
+    (the ground truth of a workbook is its second sheet). The returned handle is then sent to the other endpoints
+    in place of the 'data' and 'label' rows.
+    """
+    try:
+        file = request.files.get('file')
+        if file is None or not file.filename:
+            return jsonify({'error': 'No file was uploaded.'}), 400
+        label_file = request.files.get('label')
+        if label_file is not None and not label_file.filename:
+            label_file = None
+
+        try:
+            with span('parse_table'):
+                table, error = read_upload(file.stream, file.filename,
+                                           label_file.stream if label_file else None,
+                                           label_file.filename if label_file else None)
+        except Exception as e:
+            print(traceback.format_exc())
+            return jsonify({'error': f'The backend failed to read the file: {e}'}), 400
+        if error:
+            return jsonify({'error': error}), 400
+
+        handle, session = load_table(table)
+        ret = {'handle': handle, 'forms': len(table['forms']), 'features': len(table['features'])}
+        return jsonify(add_timing(request.form, ret))
 
     except Exception as e:
         print(traceback.format_exc())
@@ -101,101 +153,561 @@ def merge_edges():
     Automatically add edges to make the semantic map fully connected.
     """
     try:
-        # Fetch request data
-        data = request.json.get('data', [])
-        label = request.json.get('label', [])
-        graph = request.json.get('graph', {})
+        # Fetch the dataset, by handle or from the full table.
+        handle, session, error = load_session(request.json)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+        semantic_maps = session.semantic_map
 
-        if not data or not graph:
-            return jsonify({'error': 'The backend failed to parse the data. Please check the file format and content.'}), 400
+        # Parse the current map information.
+        adjacency_matrix, error = load_graph(request.json, session)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
 
-        # Convert the data into a DataFrame.
-        df = pd.DataFrame(data)
-        df_label = pd.DataFrame(label)
+        # Merge edges and evaluate the merged semantic map.
+        merge_result = run_merge(semantic_maps, adjacency_matrix)
+        with span('serialize'):
+            ret = build_merge_response(handle, session, merge_result, is_columnar(request.json))
+        return jsonify(add_timing(request.json, ret))
 
-        # Check whether the data is standardized.
-        v_result = validate_data(df)
-        if v_result != 'standard':
-            return jsonify({'error': v_result}), 400
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
 
-        # Process and standardize the data.
-        features, forms, co_occurrence_matrix = process_data(df)
-        ground_truth = process_label(df_label, features)
+
+@app.route('/api/edge-modify', methods=['POST'])
+def edge_modify_evaluate():
+    """
+    Evaluation of the artificially modified semantic map.
+    """
+    try:
+        # Fetch the dataset, by handle or from the full table.
+        handle, session, error = load_session(request.json)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+        semantic_maps = session.semantic_map
 
         # Parse the current map information.
-        adjacency_matrix, map_name = process_graph(graph)
-        adjacency_matrix = process_symmetric_matrix(adjacency_matrix)
+        adjacency_matrix, error = load_graph(request.json, session)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
 
-        # Merge edges
-        semantic_maps = SemanticMap(co_occurrence_matrix, features, forms, None, ground_truth, 0, calc_type='G')
-        adjacency_matrix_merged, merged_edges_info = semantic_maps.merge_edge(adjacency_matrix)
+        # Evaluate the modified semantic map.
+        evaluation_metric = semantic_maps.get_evaluation_metric(adjacency_matrix, range(len(semantic_maps.formNames)))
 
-        # Convert from edges to graph format as required by the frontend.
-        graph_data = dict()
-        edges = convert_to_graph_data_merged(merged_edges_info)
-        graph_data['edges'] = edges
+        return jsonify(add_timing(request.json, evaluation_metric))
 
-        # Evaluate the merged semantic map.
-        evaluation_metric = semantic_maps.get_evaluation_metric(adjacency_matrix_merged, range(len(forms)))
-        graph_data['evaluation_metric'] = evaluation_metric
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
 
-        # Retrieve the forms and the corresponding nodes for each form in the semantic map.
-        feature_map = semantic_maps.tfM # tfm and co_occurrence_matrix are not the same—deduplication may have been applied.
-        forms_with_nodes = get_forms_with_nodes(df, feature_map)
 
-        ret = {
-            'graph_data': graph_data,
-            'forms_with_nodes': forms_with_nodes
-        }
-        return jsonify(ret)
+
+@app.route('/api/edge-edit', methods=['POST'])
+def edge_edit_evaluate():
+    """
+    Incremental evaluation of a map edited one or a few edges at a time.
+    The request holds the 'state_id' returned by the previous edit of the map and the 'edits' made since
+    ([{op: 'add' | 'update' | 'remove', from, to, value}]). Without a known state, the map after the edits is
+    read from 'map_id' and 'delta' (or 'graph') and evaluated from scratch.
+    """
+    try:
+        # Fetch the dataset, by handle or from the full table.
+        handle, session, error = load_session(request.json)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+        semantic_maps = session.semantic_map
+
+        edits, error = parse_edits(request.json.get('edits', []), len(semantic_maps.unique_featNames))
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        state_id = request.json.get('state_id')
+        evaluator = session.pop_evaluator(state_id) if state_id else None
+        with span('edit_map'):
+            if evaluator is not None:
+                evaluator.apply(edits)
+            else:
+                # The map after the edits.
+                adjacency_matrix, error = load_graph(request.json, session)
+                if error:
+                    return jsonify({'error': error[0]}), error[1]
+                evaluator = IncrementalMetrics(semantic_maps, adjacency_matrix)
+            evaluation_metric = evaluator.get_metrics()
+        ret = {'state_id': session.add_evaluator(evaluator), 'evaluation_metric': evaluation_metric}
+        return jsonify(add_timing(request.json, ret))
 
     except Exception as e:
         print(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/api/edge-modify', methods=['POST'])
-def edge_modify_evaluate():
+
+@app.route('/api/jobs/process-excel', methods=['POST'])
+def submit_process_job():
     """
-    Evaluation of the artificially modified semantic map.
+    Generate the semantic maps in a background job, see /api/process-excel.
     """
     try:
-        # Fetch request data
-        data = request.json.get('data', [])
-        label = request.json.get('label', [])
-        graph = request.json.get('graph', {})
+        diagnostics = bool(request.json.get('diagnostics', False))
+        options, error = parse_candidate_options(request.json)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        # The table is parsed and validated right away, errors are returned without creating a job.
+        handle, session, error = load_session(request.json)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        # The worker gets its own copy of the SemanticMap.
+        with session.lock:
+            semantic_maps = copy.copy(session.semantic_map)
+        columnar = is_columnar(request.json)
+        job_id = jobs.submit(run_candidate_job, semantic_maps, diagnostics, options,
+                             finalize=lambda candidate_maps: build_process_response(handle, session, candidate_maps,
+                                                                                    diagnostics, columnar))
+        return jsonify({'job_id': job_id, 'handle': handle}), 202
 
-        if not data or not graph:
-            return jsonify({'error': 'The backend failed to parse the data. Please check the file format and content.'}), 400
-
-        # Convert the data into a DataFrame.
-        df = pd.DataFrame(data)
-        df_label = pd.DataFrame(label)
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
 
-        # Check whether the data is standardized.
-        v_result = validate_data(df)
-        if v_result != 'standard':
-            return jsonify({'error': v_result}), 400
 
-        # Process and standardize the data.
-        columns, forms, np_data = process_data(df)
-        ground_truth = process_label(df_label, columns)
+@app.route('/api/jobs/merge-edges', methods=['POST'])
+def submit_merge_job():
+    """
+    Merge edges in a background job, see /api/merge-edges.
+    """
+    try:
+        handle, session, error = load_session(request.json)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+        adjacency_matrix, error = load_graph(request.json, session)
+        if error:
+            return jsonify({'error': error[0]}), error[1]
+
+        # Build the shared state once, so that the workers do not rebuild it for every job.
+        with session.lock:
+            if session.semantic_map.adjM is None:
+                session.semantic_map.connected_graph()
+            session.semantic_map.get_pair_index()
+            semantic_maps = copy.copy(session.semantic_map)
+        columnar = is_columnar(request.json)
+        job_id = jobs.submit(run_merge, semantic_maps, adjacency_matrix,
+                             finalize=lambda merge_result: build_merge_response(handle, session, merge_result,
+                                                                                columnar))
+        return jsonify({'job_id': job_id, 'handle': handle}), 202
 
-        # Parse the current map information.
-        adjacency_matrix, map_name = process_graph(graph)
-        adjacency_matrix = process_symmetric_matrix(adjacency_matrix)
+    except Exception as e:
+        print(traceback.format_exc())
+        return jsonify({'error': str(e)}), 500
 
-        # Evaluate the modified semantic map.
-        semantic_maps = SemanticMap(np_data, columns, forms, None, ground_truth, 0, calc_type='G')
-        evaluation_metric = semantic_maps.get_evaluation_metric(adjacency_matrix, range(len(forms)))
 
-        return jsonify(evaluation_metric)
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    State and progress of a job, with its result once it is done.
+    """
+    try:
+        status = get_job_status(job_id)
+        if status is None:
+            return jsonify({'error': 'Unknown job.'}), 404
+        return jsonify(status)
 
     except Exception as e:
         print(traceback.format_exc())
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """
+    Cancel a job.
+    """
+    if not jobs.cancel(job_id):
+        return jsonify({'error': 'Unknown job.'}), 404
+    return jsonify(jobs.status(job_id))
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def stream_job(job_id):
+    """
+    Stream the state and the progress of a job as Server-Sent Events, until it is finished.
+    """
+    if jobs.status(job_id) is None:
+        return jsonify({'error': 'Unknown job.'}), 404
+
+    def generate():
+        last_status = None
+        while True:
+            try:
+                status = get_job_status(job_id)
+            except Exception as e:
+                print(traceback.format_exc())
+                status = {'id': job_id, 'state': 'failed', 'error': str(e)}
+            if status is None:
+                break
+            if status != last_status:
+                yield f"data: {flask_json.dumps(status)}\n\n"
+                last_status = status
+            if status['state'] in FINAL_STATES:
+                break
+            time.sleep(job_poll_interval)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+
+def get_job_status(job_id):
+    status = jobs.status(job_id)
+    if status is not None and status['state'] == 'done':
+        status['result'] = jobs.result(job_id)
+        # stages of the job, timed in the worker process
+        status['timing'] = jobs.timing(job_id)
+    return status
+
+
+
+def add_timing(payload, ret):
+    """
+    Add the timing breakdown of the current request to a response when the request asks for it ('timing': true).
+    """
+    trace = current_trace()
+    if trace is not None and payload.get('timing') not in [None, False, '', 'false', '0']:
+        ret['timing'] = trace.as_dict()
+    return ret
+
+
+
+def save_profile(profiler, seconds):
+    """
+    Write the stack samples of a slow request in the folded format of flame graph tools.
+    """
+    directory = os.path.join(app_dir, profile_dir)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint or 'unknown'}-"
+                                   f"{int(seconds * 1000)}ms.folded")
+    with open(path, 'w') as f:
+        f.write(profiler.folded())
+    print(f"Slow request {request.path} ({seconds:.2f} s), profile written to {path}")
+
+
+
+def is_columnar(payload):
+    """
+    Whether a request asks for the compact columnar payload ('format': 'columnar').
+    """
+    return payload.get('format') == 'columnar'
+
+
+
+def parse_candidate_options(payload):
+    """
+    Read the candidate generation settings of a request, unset ones take their default value.
+    :return: dict of SemanticMap attributes, error (message, status code) or None
+    """
+    n_candidates = payload.get('n_candidates', 5)
+    if isinstance(n_candidates, bool) or not isinstance(n_candidates, int) or not 1 <= n_candidates <= max_candidates:
+        return None, (f"The number of candidates must be an integer between 1 and {max_candidates}.", 400)
+    diversity = payload.get('diversity')
+    if diversity not in [None, 'jaccard']:
+        return None, ("The diversity criterion must be null or 'jaccard'.", 400)
+    candidate_mode = payload.get('candidate_mode', 'optimal')
+    if candidate_mode not in CANDIDATE_MODES:
+        return None, ("The candidate mode must be one of " + ", ".join(f"'{m}'" for m in CANDIDATE_MODES) + ".", 400)
+    options = {'n_candidates': n_candidates, 'diversity': diversity, 'candidate_mode': candidate_mode}
+    # tolerance band of the 'near_optimal' mode
+    for name, default in [('tolerance', 0.0), ('relative_tolerance', 1e-9)]:
+        value = payload.get(name, default)
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value < float('inf'):
+            return None, (f"The {name.replace('_', ' ')} must be a non-negative number.", 400)
+        options[name] = float(value)
+    # seed of the optimal tree sampler
+    seed = payload.get('seed', 0)
+    if isinstance(seed, bool) or not isinstance(seed, int) or seed < 0:
+        return None, ("The seed must be a non-negative integer.", 400)
+    options['seed'] = seed
+    # time budget of the 'min_std' search
+    search_budget = payload.get('search_budget', 10.0)
+    if isinstance(search_budget, bool) or not isinstance(search_budget, (int, float)) or \
+            not 0 < search_budget <= max_search_budget:
+        return None, (f"The search budget must be a number of seconds between 0 and {max_search_budget}.", 400)
+    options['search_budget'] = float(search_budget)
+    return options, None
+
+
+
+def parse_edits(edits, n_nodes):
+    """
+    Read the edge edits of a request.
+    :return: list of (op, u, v, weight), error (message, status code) or None
+    """
+    if not isinstance(edits, list):
+        return None, ('The edits must be a list.', 400)
+    parsed = []
+    for edit in edits:
+        try:
+            op, u, v = edit['op'], int(edit['from']), int(edit['to'])
+            weight = float(edit.get('value', 1)) if op != 'remove' else 0.0
+        except (KeyError, TypeError, ValueError):
+            return None, ('Every edit needs an op, a from node, a to node and a numeric value.', 400)
+        if op not in ['add', 'update', 'remove']:
+            return None, ("The op of an edit must be 'add', 'update' or 'remove'.", 400)
+        if not (0 <= u < n_nodes and 0 <= v < n_nodes):
+            return None, ('The nodes of an edit are not in the map.', 400)
+        parsed.append((op, u, v, weight))
+    return parsed, None
+
+
+
+def load_session(payload):
+    """
+    Return the prepared dataset of a request.
+    The dataset is looked up by its handle, or parsed from the 'data' and 'label' rows and cached under the hash
+    of its content, so that the same table always gets the same handle.
+    :return: handle, DatasetSession, error (message, status code) or None
+    """
+    handle = payload.get('handle')
+    data = payload.get('data', [])
+    label = payload.get('label', [])
+    if handle:
+        session = sessions.get(handle)
+        if session is not None:
+            return handle, session, None
+        if not data:
+            return None, None, ('The dataset session has expired. Please upload the file again.', 404)
+
+    # Check data.
+    if not data or not isinstance(data, list):
+        return None, None, ('Invalid data format.', 400)
+    if not isinstance(label, list):
+        label = []
+
+    # Convert the data into a DataFrame.
+    df = pd.DataFrame(data)
+    df_label = pd.DataFrame(label)
+
+    # Check whether the data is standardized.
+    v_result = validate_data(df)
+    # Validation failed; return error code.
+    if v_result != 'standard':
+        return None, None, (v_result, 400)
+
+    # Process and standardize the data.
+    with span('parse_table'):
+        features, forms, co_occurrence_matrix = process_data(df)
+        ground_truth = process_label(df_label, features)
+
+    handle, session = create_session(df, features, forms, co_occurrence_matrix, ground_truth)
+    return handle, session, None
+
+
+
+def create_session(df, features, forms, co_occurrence_matrix, ground_truth):
+    """
+    Return the cached dataset of a processed table, or prepare it.
+    :param df: table whose first two columns are the languages and the forms
+    :return: handle, DatasetSession
+    """
+    handle = get_content_key(features, forms, co_occurrence_matrix, ground_truth)
+    session = sessions.get(handle)
+    if session is None:
+        with span('prepare_dataset'):
+            semantic_maps = SemanticMap(co_occurrence_matrix, features, forms, None, ground_truth, 0, calc_type='G')
+            # Retrieve the forms and the corresponding nodes for each form in the semantic map.
+            member = semantic_maps.tfM.member()
+            forms_with_nodes = get_forms_with_nodes(df, member)
+            forms_columns = get_forms_with_nodes(df, member, columnar=True)
+        session = sessions.put(handle, DatasetSession(semantic_maps, forms_with_nodes, forms_columns))
+    return handle, session
+
+
+
+def load_table(table):
+    """
+    Return the dataset of a table parsed by tables.read_upload.
+    :return: handle, DatasetSession
+    """
+    df = pd.DataFrame({'languages': table['languages'], 'forms': table['form_names']})
+    ground_truth = process_label(table['label'], table['features'])
+    return create_session(df, table['features'], table['forms'], table['matrix'], ground_truth)
+
+
+
+def load_graph(payload, session):
+    """
+    Return the upper triangular adjacency matrix of the map of a request, given either as a whole 'graph' or as
+    a 'map_id' returned by /api/process-excel plus an edge 'delta' against that map.
+    :return: adjacency matrix, error (message, status code) or None
+    """
+    map_id = payload.get('map_id')
+    if map_id:
+        try:
+            adjacency_matrix = session.get_map(map_id, payload.get('delta'))
+        except ValueError as e:
+            return None, (str(e), 400)
+        if adjacency_matrix is None:
+            return None, ('The map is no longer cached. Please send the whole graph.', 404)
+        return adjacency_matrix, None
+
+    graph = payload.get('graph', {})
+    if not graph:
+        return None, ('The backend failed to parse the data. Please check the file format and content.', 400)
+    adjacency_matrix, map_name = process_graph(graph)
+    return process_symmetric_matrix(adjacency_matrix), None
+
+
+
+def get_candidate_maps(session, diagnostics=False, progress=None, options=None):
+    """
+    Return the candidate trees of a dataset with their evaluation metrics.
+    Results are read from the on-disk result cache when the same table was processed with the same settings
+    before, otherwise they are computed and stored.
+    :param progress: progress(name, value) callback, see jobs.JobManager
+    :param options: candidate generation settings, see parse_candidate_options
+    :return: list of upper triangular adjacency matrices, list of metric dicts, diagnostics dict
+    """
+    semantic_maps = session.semantic_map
+    # Candidate generation changes the state of the shared SemanticMap.
+    with session.lock:
+        for name, value in (options or {}).items():
+            setattr(semantic_maps, name, value)
+        with span('result_cache_get'):
+            result_key = get_result_key(semantic_maps)
+            cached = results.get(result_key)
+        # diagnostics are only stored when they were requested
+        if cached is not None and (cached['diagnostics'] or not diagnostics):
+            return cached['trees'], cached['metrics'], cached['diagnostics']
+
+        # Generate the adjacency matrix corresponding to the candidate tree.
+        semantic_maps.diagnostics = diagnostics
+        semantic_maps.diagnostics_info = {}
+        semantic_maps.progress = progress
+        try:
+            matrix_data = semantic_maps.get_all_matrix()
+        finally:
+            semantic_maps.progress = None
+
+    # origin_matrix_data = matrix_data.get('origin_matrix')
+    # origin_matrix_data = process_symmetric_matrix(origin_matrix_data)
+    # origin_graph_data = convert_to_graph_data('Initial fully connected conceptual space ', origin_matrix_data, node_labels)
+    # # 评价当前图
+    # origin_evaluation_metric = semantic_maps.get_evaluation_metric(origin_matrix_data, range(len(semantic_maps.formNames)))
+    # origin_graph_data['evaluation_metric'] = origin_evaluation_metric
+    # graph_data.append(origin_graph_data)
+
+    # Process the symmetric adjacency matrix.
+    trees_matrix_data = [process_symmetric_matrix(tree_matrix) for tree_matrix in matrix_data.get('trees')]
+    # Evaluate the candidate semantic maps, in parallel for large tables.
+    with span('evaluate_candidates'):
+        evaluation_metrics = evaluation_pool.evaluate(semantic_maps, trees_matrix_data, progress)
+
+    # a result cut short by a time budget depends on the machine load, it is computed again by the next request
+    if not matrix_data.get('time_capped'):
+        with span('result_cache_put'):
+            results.put(result_key, trees_matrix_data, evaluation_metrics, matrix_data.get('diagnostics'))
+    return trees_matrix_data, evaluation_metrics, matrix_data.get('diagnostics')
+
+
+
+def run_candidate_job(semantic_maps, diagnostics, options, progress=None):
+    """
+    Background job generating the candidate maps of a copy of a dataset's SemanticMap.
+    """
+    return get_candidate_maps(DatasetSession(semantic_maps, None), diagnostics, progress, options)
+
+
+
+def build_process_response(handle, session, candidate_maps, diagnostics=False, columnar=False):
+    """
+    Convert the candidate maps of a dataset into the response of /api/process-excel.
+    :param columnar: return the compact columnar payload, see convert_to_graph_data
+    """
+    trees_matrix_data, evaluation_metrics, diagnostics_info = candidate_maps
+
+    # Convert from matrix to graph format as required by the frontend.
+    graph_data = list()
+    node_labels = session.semantic_map.unique_featNames
+    for index, (tree_matrix, tree_evaluation_metric) in enumerate(zip(trees_matrix_data, evaluation_metrics)):
+        tree_graph_data = convert_to_graph_data('Candidate semantic map '+str(index+1), tree_matrix, node_labels,
+                                                columnar)
+        tree_graph_data['evaluation_metric'] = tree_evaluation_metric
+        # Later edits of this map can be sent as a delta against its id.
+        tree_graph_data['map_id'] = session.add_map(tree_matrix)
+        graph_data.append(tree_graph_data)
+
+    ret = {
+        'handle': handle,
+        'graph_data': graph_data,
+        # The forms and the corresponding nodes for each form in the semantic map.
+        'forms_with_nodes': session.forms_columns if columnar else session.forms_with_nodes
+    }
+    if columnar:
+        ret['format'] = 'columnar'
+    # Diagnostics are only computed and returned on request.
+    if diagnostics:
+        ret['metadata'] = diagnostics_info
+    return ret
+
+
+
+def run_merge(semantic_maps, adjacency_matrix, progress=None):
+    """
+    Merge edges into a map and evaluate the merged map.
+    :return: list of added edges (u, v, weight), evaluation metric of the merged map
+    """
+    # the progress reports during the merge also let a cancelled job stop there
+    adjacency_matrix_merged, merged_edges_info = semantic_maps.merge_edge(adjacency_matrix, progress)
+    if progress is not None:
+        progress('merged_edges', len(merged_edges_info))
+    evaluation_metric = semantic_maps.get_evaluation_metric(adjacency_matrix_merged, range(len(semantic_maps.formNames)))
+    return merged_edges_info, evaluation_metric
+
+
+
+def build_merge_response(handle, session, merge_result, columnar=False):
+    """
+    Convert the result of run_merge into the response of /api/merge-edges.
+    :param columnar: return the compact columnar payload, see convert_to_graph_data
+    """
+    merged_edges_info, evaluation_metric = merge_result
+
+    # Convert from edges to graph format as required by the frontend.
+    graph_data = dict()
+    edges = convert_to_graph_data_merged(merged_edges_info, columnar)
+    graph_data['edges'] = edges
+    graph_data['evaluation_metric'] = evaluation_metric
+
+    ret = {
+        'handle': handle,
+        'graph_data': graph_data,
+        # tfm and co_occurrence_matrix are not the same—deduplication may have been applied.
+        'forms_with_nodes': session.forms_columns if columnar else session.forms_with_nodes
+    }
+    if columnar:
+        ret['format'] = 'columnar'
+    return ret
+
+
+
+def warm_result_cache():
+    """
+    Process the bundled example tables, so that the first users loading them are served from the result cache.
+    """
+    for path in sorted(glob.glob(os.path.join(app_dir, 'data', '*.xlsx'))):
+        try:
+            with open(path, 'rb') as f:
+                table, error = read_upload(f, path)
+            if error:
+                print(f"Skipped warming the result cache with {path}: {error}")
+                continue
+            handle, session = load_table(table)
+            get_candidate_maps(session, options=parse_candidate_options({})[0])
+        except Exception as e:
+            print(f"Failed to warm the result cache with {path}: {e}")
+
+
 
 def validate_data(df):
     """
@@ -283,35 +795,41 @@ def process_data(df):
 def process_graph(graph):
     """
     Create an adjacency matrix based on the map information.
+    The edges are either a list of {from, to, value} objects, or the compact columns {from, to, weight} holding
+    node positions.
     """
     nodes = graph.get("nodes", [])
     edges = graph.get("edges", [])
     name = graph.get("map_name", "")
 
-    num_nodes = len(nodes)
+    # columnar nodes only hold the labels
+    num_nodes = len(nodes["label"]) if isinstance(nodes, dict) else len(nodes)
 
-    if not nodes:
+    if not num_nodes:
         return None, name
     elif not edges:
         return np.zeros((num_nodes, num_nodes), dtype=float), name
 
-    # Create a mapping from node IDs to indices.
-    node_id_to_index = {node["id"]: idx for idx, node in enumerate(nodes)}
-
     # Initialize the adjacency matrix.
     adj_matrix = np.zeros((num_nodes, num_nodes), dtype=float)
 
-    # Populate the adjacency matrix.
-    for edge in edges:
-        from_id = edge["from"]
-        to_id = edge["to"]
-        value = edge["value"]  # Use float type as edge weights.
-
-        if from_id in node_id_to_index and to_id in node_id_to_index:
-            i = node_id_to_index[from_id]
-            j = node_id_to_index[to_id]
-            adj_matrix[i][j] = value  # If it's a directed graph, assign the weight in only one direction.
-            # adj_matrix[j][i] = value
+    if isinstance(edges, dict):
+        rows = np.asarray(edges["from"], dtype=np.int64)
+        cols = np.asarray(edges["to"], dtype=np.int64)
+        values = np.asarray(edges["weight"], dtype=float)
+    else:
+        # Create a mapping from node IDs to indices.
+        node_id_to_index = {node["id"]: idx for idx, node in enumerate(nodes)}
+        known = [edge for edge in edges if edge["from"] in node_id_to_index and edge["to"] in node_id_to_index]
+        rows = np.array([node_id_to_index[edge["from"]] for edge in known], dtype=np.int64)
+        cols = np.array([node_id_to_index[edge["to"]] for edge in known], dtype=np.int64)
+        # Use float type as edge weights.
+        values = np.array([edge["value"] for edge in known], dtype=float)
+
+    # Populate the adjacency matrix, a later edge overwrites an earlier one between the same nodes.
+    # If it's a directed graph, the weight is assigned in only one direction.
+    valid = (rows >= 0) & (rows < num_nodes) & (cols >= 0) & (cols < num_nodes)
+    adj_matrix[rows[valid], cols[valid]] = values[valid]
 
     return adj_matrix, name
 
@@ -338,60 +856,61 @@ def process_symmetric_matrix(matrix):
 
 
 
-def convert_to_graph_data_merged(edges:list):
+def get_edge_ids(rows, cols):
+    """
+    Deterministic edge ids, built from the node positions.
+    """
+    return [f'e{i}_{j}' for i, j in zip(rows, cols)]
+
+
+
+def get_graph_edges(rows, cols, weights, columnar=False):
+    """
+    Edges in the format required for frontend visualization, or as compact columns of node positions.
+    """
+    rows, cols, weights = np.asarray(rows).tolist(), np.asarray(cols).tolist(), np.asarray(weights, dtype=float).tolist()
+    if columnar:
+        return {'from': rows, 'to': cols, 'weight': weights}
+    return [{'id': edge_id, 'from': str(i), 'to': str(j), 'label': str(weight), 'value': weight}
+            for edge_id, i, j, weight in zip(get_edge_ids(rows, cols), rows, cols, weights)]
+
+
+
+def convert_to_graph_data_merged(edges:list, columnar=False):
     """
     Convert the edge list into the format required for frontend visualization.
     """
-    graph_edges = list()
-    for edge in edges:
-        graph_edges.append({
-            'id': f'e{uuid.uuid4().hex[:8]}',
-            'from': str(edge[0]),
-            'to': str(edge[1]),
-            'label': str(edge[2]),
-            'value': float(edge[2])
-        })
-    return graph_edges
+    rows = [edge[0] for edge in edges]
+    cols = [edge[1] for edge in edges]
+    weights = [edge[2] for edge in edges]
+    return get_graph_edges(rows, cols, weights, columnar)
 
 
 
-def convert_to_graph_data(map_name, adjacency_matrix, node_labels):
+def convert_to_graph_data(map_name, adjacency_matrix, node_labels, columnar=False):
     """
     Convert the adjacency matrix into the format required for frontend visualization.
+    With columnar, the nodes are the list of labels and the edges are columns of node positions and weights.
     """
-    nodes = []
-    edges = []
-
+    node_labels = [str(label) for label in node_labels]
+    adjacency_matrix = np.asarray(adjacency_matrix)
+    # Edges, in row-major order.
+    rows, cols = np.nonzero(adjacency_matrix > 0)
+    edges = get_graph_edges(rows, cols, adjacency_matrix[rows, cols], columnar)
+
+    if columnar:
+        return {'map_name': map_name, 'nodes': {'label': node_labels}, 'edges': edges}
     # Create nodes.
-    for i, label in enumerate(node_labels):
-        nodes.append({
-            'id': str(i),
-            'label': str(label),
-            'title': str(label)
-        })
-
-    # Create edges.
-    for i in range(len(adjacency_matrix)):
-        for j in range(len(adjacency_matrix[i])):
-            weight = adjacency_matrix[i][j]
-            if weight > 0:
-                edge_id = f'e{uuid.uuid4().hex[:8]}'
-                edges.append({
-                    'id': edge_id,
-                    'from': str(i),
-                    'to': str(j),
-                    'label': str(weight),
-                    'value': float(weight)
-                })
-
+    nodes = [{'id': str(i), 'label': label, 'title': label} for i, label in enumerate(node_labels)]
     return {'map_name': map_name, 'nodes': nodes, 'edges': edges}
 
 
 
-def get_forms_with_nodes(df, feature_map):
+def get_forms_with_nodes(df, feature_map, columnar=False):
     """
     Get all forms with the given feature_map.
     feature_map is the deduplicated form-feature matrix, not the original co-occurrence matrix.
+    With columnar, the result holds the columns language, form and nodes (lists of node positions).
     """
     # Get the column names of the first two columns.
     col1 = df.columns[0] # languages
@@ -401,24 +920,21 @@ def get_forms_with_nodes(df, feature_map):
     languages = df[col1].tolist()
     forms = df[col2].tolist()
 
-    all_forms_with_nodes = list()
-
-    # Iterate over each row.
-    for row in range(feature_map.shape[0]):
-        form = forms[row]
-        language = languages[row]
-        related_cols = list()
-        # Iterate over each column.
-        for col in range(feature_map.shape[1]):
-            if feature_map[row, col] > 0:
-                # The column index serves as the node_id.
-                related_cols.append(str(col))
-        all_forms_with_nodes.append({'language': language, 'form': form, 'nodes': related_cols})
+    # The column index serves as the node_id.
+    rows, cols = np.nonzero(feature_map > 0)
+    bounds = np.searchsorted(rows, np.arange(feature_map.shape[0] + 1)).tolist()
+    cols = cols.tolist()
+    related_cols = [cols[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
 
-    return all_forms_with_nodes
+    if columnar:
+        return {'language': languages, 'form': forms, 'nodes': related_cols}
+    node_ids = [str(col) for col in range(feature_map.shape[1])]
+    return [{'language': language, 'form': form, 'nodes': [node_ids[col] for col in nodes]}
+            for language, form, nodes in zip(languages, forms, related_cols)]
 
 
 
 
 if __name__ == '__main__':
+    warm_result_cache()
     app.run(debug=True, host='0.0.0.0', port=port)
\ No newline at end of file
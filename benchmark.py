@@ -0,0 +1,221 @@
+"""
+Benchmarks of the SemanticMap pipeline on synthetic scaling tables and on the bundled example tables.
+
+    python benchmark.py --output benchmark.json
+    python benchmark.py --quick --compare benchmark.json
+
+Every stage is timed separately and the results are written as JSON, so that two commits can be compared with
+--compare.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+from itertools import combinations
+
+import numpy as np
+
+from SMM import SemanticMap
+from spanning import count_optimal_trees, edges_to_matrix
+from tables import read_upload
+
+BENCHMARK_VERSION = 1
+
+# form count, feature count, density, size of the equal-weight feature clique
+SCALING_CASES = [
+    dict(n_forms=50, n_features=20, density=0.15, tie_size=0),
+    dict(n_forms=50, n_features=20, density=0.15, tie_size=6),
+    dict(n_forms=200, n_features=50, density=0.1, tie_size=0),
+    dict(n_forms=200, n_features=50, density=0.1, tie_size=8),
+    dict(n_forms=1000, n_features=100, density=0.05, tie_size=0),
+    dict(n_forms=1000, n_features=100, density=0.05, tie_size=10),
+    dict(n_forms=5000, n_features=200, density=0.02, tie_size=0),
+]
+
+QUICK_CASES = SCALING_CASES[:4]
+
+STAGES = ['merge_feat', 'calculate_semantic_relations', 'get_optimal_SpanningTrees', 'get_evaluation_metric',
+          'merge_edge']
+
+
+def make_table(n_forms, n_features, density, tie_size=0, seed=0):
+    """
+    Generate a random form-feature table.
+    Every feature belongs to a form with probability density. With tie_size >= 2, a clique of tie_size features
+    gets edges of equal weight: one form per pair of clique features holds exactly that pair, and the random
+    forms keep at most one clique feature. Equal weights make tie classes, and the number of optimal spanning
+    trees grows like tie_size ** (tie_size - 2).
+    :return: (N, D) 0/1 matrix, feature names, forms
+    """
+    rng = np.random.default_rng(seed)
+    matrix = (rng.random((n_forms, n_features)) < density).astype(np.float64)
+    if tie_size >= 2:
+        clique = rng.choice(n_features, tie_size, replace=False)
+        # the random forms keep a single clique feature, so that the clique edges only come from the pair forms
+        in_clique = matrix[:, clique] > 0
+        keep = np.argmax(in_clique * rng.random(in_clique.shape), axis=1)
+        matrix[:, clique] = 0
+        matrix[np.arange(n_forms), clique[keep]] = in_clique[np.arange(n_forms), keep]
+        pairs = list(combinations(clique.tolist(), 2))[:n_forms]
+        for row, (u, v) in zip(range(n_forms - len(pairs), n_forms), pairs):
+            matrix[row] = 0
+            matrix[row, [u, v]] = 1
+    features = [f'feature_{i}' for i in range(n_features)]
+    forms = [{'language': f'language_{i % 10}', 'form': f'form_{i}'} for i in range(n_forms)]
+    return matrix, features, forms
+
+
+
+def load_example(path):
+    """
+    Read a bundled table the way /api/upload does.
+    :return: (N, D) matrix, feature names, forms, ground truth or None
+    """
+    # process_label lives in app.py, which starts the server caches on import
+    from app import process_label
+    with open(path, 'rb') as f:
+        table, error = read_upload(f, path)
+    if error:
+        raise ValueError(f'{path}: {error}')
+    return table['matrix'], table['features'], table['forms'], process_label(table['label'], table['features'])
+
+
+
+def time_call(func, repeat):
+    """
+    Run func repeat times, the pipeline's own prints are silenced.
+    :return: timing dict (seconds), result of the last call
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            result = func()
+            timings.append(time.perf_counter() - start)
+    return {'min': min(timings), 'median': float(np.median(timings)), 'mean': float(np.mean(timings))}, result
+
+
+
+def benchmark_table(matrix, features, forms, ground_truth=None, repeat=3, calc_type='G'):
+    """
+    Time every stage of the pipeline on one table.
+    :return: dict with the table statistics and the timings of every stage
+    """
+    timings = dict()
+    new_map = lambda: SemanticMap(matrix.copy(), features, forms, None, ground_truth, 0, calc_type=calc_type)
+    # the constructor only deduplicates the features
+    timings['merge_feat'], semantic_map = time_call(new_map, repeat)
+    timings['calculate_semantic_relations'], _ = time_call(
+        lambda: semantic_map.calculate_semantic_relations(semantic_map.tfM, calc_type), repeat)
+    timings['get_optimal_SpanningTrees'], _ = time_call(semantic_map.get_optimal_SpanningTrees, repeat)
+
+    trees = [edges_to_matrix(tree, semantic_map.adjM) for tree in semantic_map.trees]
+    selected_ins = range(len(forms))
+    stats = {
+        'n_forms': len(forms),
+        'n_features': len(features),
+        'n_unique_features': len(semantic_map.unique_featNames),
+        'density': float(np.count_nonzero(matrix) / matrix.size) if matrix.size else 0.0,
+        'log10_optimal_trees': float(count_optimal_trees(semantic_map.adjM) / np.log(10)),
+        'n_candidates': len(trees),
+    }
+    if trees:
+        timings['get_evaluation_metric'], _ = time_call(
+            lambda: semantic_map.get_evaluation_metric(trees[0], selected_ins), repeat)
+        timings['merge_edge'], (_, added_edges) = time_call(lambda: semantic_map.merge_edge(trees[0]), repeat)
+        stats['n_merged_edges'] = len(added_edges)
+    stats['timings'] = timings
+    return stats
+
+
+
+def get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+
+def run(cases, examples, repeat=3, seed=0):
+    """
+    :param cases: list of make_table keyword arguments
+    :param examples: paths of example tables
+    :return: JSON-serializable benchmark report
+    """
+    results = []
+    for case in cases:
+        name = 'synthetic_{n_forms}x{n_features}_d{density}_t{tie_size}'.format(**case)
+        print(f'{name} ...', flush=True)
+        result = benchmark_table(*make_table(seed=seed, **case), repeat=repeat)
+        results.append(dict(name=name, kind='synthetic', params=case, **result))
+    for path in examples:
+        name = os.path.splitext(os.path.basename(path))[0]
+        print(f'{name} ...', flush=True)
+        result = benchmark_table(*load_example(path), repeat=repeat)
+        results.append(dict(name=name, kind='example', params={'path': os.path.basename(path)}, **result))
+    return {
+        'version': BENCHMARK_VERSION,
+        'commit': get_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'seed': seed,
+        'results': results,
+    }
+
+
+
+def compare(report, baseline):
+    """
+    Print the median time of every stage against a previous report, for the tables present in both.
+    """
+    previous = {result['name']: result for result in baseline['results']}
+    print(f"{'table':<45}{'stage':<32}{'before (ms)':>12}{'after (ms)':>12}{'ratio':>8}")
+    for result in report['results']:
+        if result['name'] not in previous:
+            continue
+        for stage in STAGES:
+            before = previous[result['name']]['timings'].get(stage)
+            after = result['timings'].get(stage)
+            if before is None or after is None:
+                continue
+            ratio = after['median'] / before['median'] if before['median'] > 0 else float('nan')
+            print(f"{result['name']:<45}{stage:<32}{before['median'] * 1000:>12.2f}"
+                  f"{after['median'] * 1000:>12.2f}{ratio:>8.2f}")
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output', default='benchmark.json', help='JSON report path')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of every stage, the median is compared')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic tables')
+    parser.add_argument('--quick', action='store_true', help='only the small synthetic tables')
+    parser.add_argument('--no-examples', action='store_true', help='skip the bundled data/*.xlsx tables')
+    parser.add_argument('--compare', help='previous JSON report to compare with')
+    args = parser.parse_args()
+
+    examples = [] if args.no_examples else sorted(
+        glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', '*.xlsx')))
+    report = run(QUICK_CASES if args.quick else SCALING_CASES, examples, args.repeat, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
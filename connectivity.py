@@ -0,0 +1,355 @@
+import numpy as np
+import heapq
+
+from packed import PackedMatrix
+
+
+def get_batched_components(n_rows, n_nodes, rows, u, v):
+    """
+    Label the connected components of many graphs over the same nodes at once.
+    Batched array union-find: every round hooks the larger root of each active edge onto the smaller one,
+    for all graphs together, then compresses the parent pointers by pointer jumping.
+    :param n_rows: number of graphs
+    :param n_nodes: number of nodes of every graph
+    :param rows: (M,) graph of every edge
+    :param u: (M,) first node of every edge
+    :param v: (M,) second node of every edge
+    :return: (n_rows, n_nodes) component labels (the smallest node index of the component)
+    """
+    parent = np.tile(np.arange(n_nodes), (n_rows, 1))
+    if len(rows) == 0:
+        return parent
+    offsets = np.asarray(rows, dtype=np.int64) * n_nodes
+    flat_parent = parent.reshape(-1)
+    while True:
+        pu, pv = flat_parent[offsets + u], flat_parent[offsets + v]
+        differ = pu != pv
+        if not differ.any():
+            break
+        low, high = np.minimum(pu, pv)[differ], np.maximum(pu, pv)[differ]
+        np.minimum.at(flat_parent, offsets[differ] + high, low)
+        # pointer jumping until every node points at its root
+        while True:
+            jumped = np.take_along_axis(parent, parent, axis=1)
+            if np.array_equal(jumped, parent):
+                break
+            parent[:] = jumped
+    return parent
+
+
+
+def get_membership(form_feature):
+    """
+    (N, D) boolean form-feature membership of a dense or bit-packed form-feature matrix.
+    """
+    if isinstance(form_feature, PackedMatrix):
+        return form_feature.member()
+    return np.asarray(form_feature) > 0
+
+
+
+def get_form_components(edges, form_feature):
+    """
+    Label the connected components of every form's induced subgraph at once.
+    :param edges: (E, 2) int edge array over the features
+    :param form_feature: (N, D) form-feature matrix, a feature belongs to a form when its value is > 0
+    :return: (N, D) component labels (the smallest feature index of the component), (N, D) membership mask
+    """
+    member = get_membership(form_feature)
+    n_forms, n_features = member.shape
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    u, v = edges[:, 0], edges[:, 1]
+    # (form, edge) pairs whose two endpoints both belong to the form
+    rows, edge_ix = np.nonzero(member[:, u] & member[:, v])
+    return get_batched_components(n_forms, n_features, rows, u[edge_ix], v[edge_ix]), member
+
+
+
+def check_forms_connectivity(edges, form_feature):
+    """
+    Check for every form whether the subgraph induced by its features is connected.
+    A form with at most one feature is connected.
+    :param edges: (E, 2) int edge array over the features
+    :param form_feature: (N, D) form-feature matrix
+    :return: (N,) boolean connectivity vector, indices of the unconnected forms
+    """
+    labels, member = get_form_components(edges, form_feature)
+    n_features = member.shape[1]
+    # connected when the smallest and the largest component label of the form's features coincide
+    low = np.where(member, labels, n_features).min(axis=1)
+    high = np.where(member, labels, -1).max(axis=1)
+    connected = (high <= low)
+    return connected, np.flatnonzero(~connected)
+
+
+
+class PairFormIndex(object):
+    """
+    Inverted index from feature pairs to the forms containing both features, stored CSR-style:
+    the forms of the pair keys[p] are forms[indptr[p]:indptr[p + 1]], in increasing order.
+    """
+
+    def __init__(self, form_feature):
+        member = get_membership(form_feature)
+        n_forms, n_features = member.shape
+        # (N, ceil(D / 8)) form-feature membership bits
+        self.bits = np.packbits(member, axis=1)
+        self.n_features = n_features
+        pair_keys = []
+        pair_forms = []
+        for form in range(n_forms):
+            feats = np.flatnonzero(member[form])
+            if len(feats) < 2:
+                continue
+            i, j = np.triu_indices(len(feats), 1)
+            pair_keys.append(feats[i] * n_features + feats[j])
+            pair_forms.append(np.full(len(i), form, dtype=np.int64))
+        if pair_keys:
+            pair_keys = np.concatenate(pair_keys)
+            pair_forms = np.concatenate(pair_forms)
+        else:
+            pair_keys = pair_forms = np.zeros(0, dtype=np.int64)
+        # forms stay in increasing order inside every pair
+        order = np.argsort(pair_keys, kind='stable')
+        pair_keys, self.forms = pair_keys[order], pair_forms[order]
+        # (P,) sorted pair keys u * D + v with u < v
+        self.keys, starts = np.unique(pair_keys, return_index=True)
+        self.indptr = np.append(starts, len(pair_keys)).astype(np.int64)
+        # (P, 2) feature pairs
+        self.pairs = np.stack([self.keys // n_features, self.keys % n_features], axis=1)
+
+
+
+    def get_position(self, u, v):
+        """
+        Position of the pair (u, v) in the index, -1 if no form contains both features.
+        """
+        key = min(u, v) * self.n_features + max(u, v)
+        p = int(np.searchsorted(self.keys, key))
+        if p < len(self.keys) and self.keys[p] == key:
+            return p
+        return -1
+
+
+
+    def get_forms(self, u, v):
+        p = self.get_position(u, v)
+        if p < 0:
+            return self.forms[:0]
+        return self.forms[self.indptr[p]:self.indptr[p + 1]]
+
+
+
+    def get_features(self, form):
+        """
+        Features of a form, in increasing order.
+        """
+        return np.flatnonzero(np.unpackbits(self.bits[form], count=self.n_features))
+
+
+
+    def get_form_positions(self, feats):
+        """
+        Positions of all the pairs of a form's features.
+        """
+        i, j = np.triu_indices(len(feats), 1)
+        return np.searchsorted(self.keys, feats[i] * self.n_features + feats[j])
+
+
+
+class FormComponents(object):
+    """
+    Per-form component structure of a feature graph that only grows, for greedy edge insertion.
+    The effect of a candidate edge (u, v) is read from the forms containing both u and v, and committing
+    an edge relabels the components of those forms in place.
+    """
+
+    def __init__(self, edges, form_feature, pair_index=None):
+        labels, member = get_form_components(edges, form_feature)
+        # (N, D) component label of every feature of every form
+        self.labels = labels
+        # (N, D) form-feature membership
+        self.member = member
+        # number of components of every form, 0 for a form without features
+        self.n_components = np.count_nonzero(member & (labels == np.arange(member.shape[1])), axis=1)
+        # feature pair -> forms containing both features
+        self.pair_index = pair_index if pair_index is not None else PairFormIndex(form_feature)
+        # (D, D) number of forms connected by every edge, built on first use
+        self.join_counts = None
+
+
+
+    def get_pair_forms(self, u, v):
+        return self.pair_index.get_forms(u, v)
+
+
+
+    def unconnected_forms(self):
+        return np.flatnonzero(self.n_components > 1)
+
+
+
+    def _get_sides(self, form):
+        """
+        The two components of a form that has exactly two.
+        """
+        feats = np.flatnonzero(self.member[form])
+        labels = self.labels[form, feats]
+        low = labels.min()
+        return feats[labels == low], feats[labels != low]
+
+
+
+    def count_connected_by(self):
+        """
+        Number of forms that become connected when the edge (u, v) is added, for all feature pairs at once.
+        Only a form with exactly two components can become connected, by an edge between its two components.
+        The matrix is built once and then kept up to date by add_edge.
+        :return: (D, D) symmetric count matrix
+        """
+        if self.join_counts is None:
+            near = np.flatnonzero(self.n_components == 2)
+            labels, member = self.labels[near], self.member[near]
+            low = np.where(member, labels, labels.shape[1]).min(axis=1)
+            high = np.where(member, labels, -1).max(axis=1)
+            side_a = (member & (labels == low[:, None])).astype(np.float64)
+            side_b = (member & (labels == high[:, None])).astype(np.float64)
+            counts = side_a.T @ side_b
+            self.join_counts = np.rint(counts + counts.T).astype(np.int64)
+        return self.join_counts
+
+
+
+    def _update_join_counts(self, form, delta):
+        side_a, side_b = self._get_sides(form)
+        self.join_counts[np.ix_(side_a, side_b)] += delta
+        self.join_counts[np.ix_(side_b, side_a)] += delta
+
+
+
+    def add_edge(self, u, v):
+        """
+        Add the edge (u, v) and update the components of the forms containing both features.
+        :return: indices of the forms that became connected
+        """
+        forms = self.get_pair_forms(u, v)
+        label_u, label_v = self.labels[forms, u], self.labels[forms, v]
+        joins = label_u != label_v
+        for form, lu, lv in zip(forms[joins], label_u[joins], label_v[joins]):
+            if self.join_counts is not None and self.n_components[form] == 2:
+                self._update_join_counts(form, -1)
+            row = self.labels[form]
+            # keep the smallest feature index as the label
+            row[row == max(lu, lv)] = min(lu, lv)
+            self.n_components[form] -= 1
+            if self.join_counts is not None and self.n_components[form] == 2:
+                self._update_join_counts(form, 1)
+        connected = forms[joins]
+        return connected[self.n_components[connected] == 1]
+
+
+
+
+class CandidateEdgeQueue(object):
+    """
+    Candidate edges for merging, ordered like the sorted candidate list: by the number of unconnected forms
+    containing the pair (descending), its weight (descending), then by first appearance (the first unconnected
+    form containing the pair, then the pair itself).
+    Connecting forms only ever moves a pair later in this order, so outdated heap entries are re-keyed lazily
+    when they reach the head of the queue.
+    """
+
+    def __init__(self, pair_index, weight_matrix, unconnected, graph_edges):
+        self.pair_index = pair_index
+        # forms that are still unconnected    np.array(bool)  (N,)
+        self.unconnected = np.array(unconnected, dtype=bool)
+        pairs, indptr, forms = pair_index.pairs, pair_index.indptr, pair_index.forms
+        n_pairs = len(pairs)
+        # candidate weight: the weight of the edge in the fully connected graph, 0.00001 if there is none
+        u, v = pairs[:, 0], pairs[:, 1]
+        weights = np.where(weight_matrix[v, u] != 0, weight_matrix[v, u], weight_matrix[u, v])
+        self.weights = np.where(weights != 0, weights, 0.00001)
+        # pairs that are already edges of the map
+        self.in_graph = np.zeros(n_pairs, dtype=bool)
+        for u, v in graph_edges:
+            p = pair_index.get_position(u, v)
+            if p >= 0:
+                self.in_graph[p] = True
+        # number of unconnected forms containing every pair
+        self.counts = np.zeros(n_pairs, dtype=np.int64)
+        # cursor on the first unconnected form of every pair, moved forward lazily
+        self.first = indptr[:-1].copy()
+        if n_pairs:
+            active = self.unconnected[forms]
+            self.counts = np.add.reduceat(active.astype(np.int64), indptr[:-1])
+            positions = np.where(active, np.arange(len(forms)), len(forms))
+            self.first = np.minimum.reduceat(positions, indptr[:-1])
+        self.heap = [self._entry(p) for p in np.flatnonzero((self.counts > 0) & ~self.in_graph)]
+        heapq.heapify(self.heap)
+
+
+
+    def _first_form(self, p):
+        """
+        The first unconnected form containing the pair p.
+        """
+        indptr, forms = self.pair_index.indptr, self.pair_index.forms
+        cursor = self.first[p]
+        while cursor < indptr[p + 1] - 1 and not self.unconnected[forms[cursor]]:
+            cursor += 1
+        self.first[p] = cursor
+        return int(forms[cursor])
+
+
+
+    def _entry(self, p):
+        u, v = self.pair_index.pairs[p]
+        return (-int(self.counts[p]), -float(self.weights[p]), self._first_form(p), int(u), int(v), int(p))
+
+
+
+    def select(self, join_counts):
+        """
+        Return the candidate that connects the most forms, the earliest one in the queue order on ties.
+        When no candidate connects any form, this is the head of the queue.
+        :param join_counts: (D, D) number of forms connected by every edge, see FormComponents.count_connected_by
+        :return: (u, v, weight) or None if there is no candidate
+        """
+        upper = np.triu(join_counts, 1)
+        best_count = upper.max() if upper.size else 0
+        if best_count > 0:
+            # pairs joining two components are never edges of the map, and always candidates
+            u, v = np.nonzero(upper == best_count)
+            positions = np.searchsorted(self.pair_index.keys, u * self.pair_index.n_features + v)
+            first_forms = [self._first_form(p) for p in positions]
+            order = np.lexsort((v, u, first_forms, -self.weights[positions], -self.counts[positions]))
+            p = positions[order[0]]
+            return int(u[order[0]]), int(v[order[0]]), float(self.weights[p])
+        while self.heap:
+            entry = self.heap[0]
+            p = entry[-1]
+            if self.in_graph[p] or self.counts[p] == 0:
+                heapq.heappop(self.heap)
+                continue
+            current = self._entry(p)
+            if current == entry:
+                return entry[3], entry[4], -entry[1]
+            heapq.heapreplace(self.heap, current)
+        return None
+
+
+
+    def add_edge(self, u, v):
+        p = self.pair_index.get_position(u, v)
+        if p >= 0:
+            self.in_graph[p] = True
+
+
+
+    def form_connected(self, form):
+        """
+        Remove a newly connected form from the counts of all its pairs.
+        """
+        self.unconnected[form] = False
+        feats = self.pair_index.get_features(form)
+        self.counts[self.pair_index.get_form_positions(feats)] -= 1
@@ -0,0 +1,222 @@
+import heapq
+import itertools
+import time
+
+import numpy as np
+
+from spanning import UnionFind, get_edge_arrays, get_tie_classes
+
+
+def get_degree_bound(degree, capacity, units):
+    """
+    Lower bound on the sum of squared degrees once units more degree units are added, each node taking at most
+    its capacity: the units are poured on the lowest degrees first (water filling). The remaining edges of a tree
+    add one unit to each of their two endpoints, so this relaxation never exceeds any completion of the tree.
+    :param degree: (D,) current degrees
+    :param capacity: (D,) number of remaining candidate edges incident to every node
+    :param units: twice the number of edges still to choose
+    :return: bound (int), inf when the capacity cannot take all the units
+    """
+    total = int(np.sum(degree.astype(np.int64) ** 2))
+    if units == 0:
+        return total
+    if int(capacity.sum()) < units:
+        return float('inf')
+    fill = lambda level: int(np.clip(level - degree, 0, capacity).sum())
+    # smallest level whose filling takes all the units
+    low, high = int(degree.min()), int((degree + capacity).max())
+    while low < high:
+        mid = (low + high) // 2
+        if fill(mid) >= units:
+            high = mid
+        else:
+            low = mid + 1
+    level = low
+    # every node raised to level - 1, the rest of the units raise some of them to level
+    raised = degree + np.clip(level - 1 - degree, 0, capacity)
+    rest = units - fill(level - 1)
+    return int(np.sum(raised.astype(np.int64) ** 2)) + rest * (2 * level - 1)
+
+
+
+def _to_std(square_sum, n, n_edges):
+    """
+    Degree std of a forest from the sum of its squared degrees.
+    """
+    return float(np.sqrt(max(0.0, square_sum / n - (2 * n_edges / n) ** 2)))
+
+
+
+def get_bridges(local_edges, open_edges, uf):
+    """
+    Bridges of the open edges of a block, between the components of uf: every spanning tree completing the
+    block takes them. Parallel edges are never bridges.
+    :param local_edges: (k, 2) block-local edge array
+    :param open_edges: positions of the open edges
+    :param uf: UnionFind of the block nodes joined by the chosen edges
+    :return: list of edge positions
+    """
+    adjacency = dict()
+    for p in open_edges:
+        u, v = uf.find(int(local_edges[p, 0])), uf.find(int(local_edges[p, 1]))
+        adjacency.setdefault(u, []).append((v, p))
+        adjacency.setdefault(v, []).append((u, p))
+    # iterative Tarjan, the edge to the parent is skipped by position so that parallel edges close a cycle
+    order, low = dict(), dict()
+    bridges = []
+    for root in adjacency:
+        if root in order:
+            continue
+        order[root] = low[root] = len(order)
+        stack = [(root, -1, iter(adjacency[root]))]
+        while stack:
+            node, parent_edge, neighbors = stack[-1]
+            for adjacent, p in neighbors:
+                if p == parent_edge:
+                    continue
+                if adjacent in order:
+                    low[node] = min(low[node], order[adjacent])
+                else:
+                    order[adjacent] = low[adjacent] = len(order)
+                    stack.append((adjacent, p, iter(adjacency[adjacent])))
+                    break
+            else:
+                stack.pop()
+                if stack:
+                    parent = stack[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                    if low[node] > order[parent]:
+                        bridges.append(parent_edge)
+    return bridges
+
+
+
+def find_min_std_tree(adj_matrix, time_budget=None):
+    """
+    Branch-and-bound search of the maximum-weight spanning tree (forest) with the smallest degree std.
+    Every optimal tree has the fixed edges of the tie classes and a spanning tree of every block (see
+    get_tie_classes), and the same number of edges, so the degree std is minimal when the sum of squared degrees
+    is. The blocks are completed one after the other. At every step the bridges of the open edges of the current
+    block are taken, then the open edge with the lowest endpoint degrees is either included or excluded, the
+    included branch being explored first. A branch is cut when the water filling bound of get_degree_bound is no
+    better than the best tree found.
+    :param adj_matrix: (D, D) adjacency matrix, zero entries are missing edges
+    :param time_budget: stop after this many seconds, None for an exhaustive search
+    :return: dict(tree: (m, 2) int edge array, deg_std, lower_bound: lowest std that any unexplored branch could
+             reach, certified: whether the tree is proven optimal, nodes: number of explored branches)
+    """
+    n = adj_matrix.shape[0]
+    edges, weights = get_edge_arrays(adj_matrix)
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    fixed, blocks = get_tie_classes(n, edges, weights)
+    n_edges = len(fixed) + sum(block_n - 1 for block_n, _, _ in blocks)
+
+    base_degree = np.bincount(edges[fixed].ravel(), minlength=n).astype(np.int64)
+    # original endpoints of the block edges
+    block_ends = [edges[edge_indices] for _, _, edge_indices in blocks]
+    # the bridges of a whole block are in every tree: degrees they add, edges left to choose and incident open
+    # edge counts in the blocks after every block
+    later_degree = [np.zeros(n, dtype=np.int64) for _ in range(len(blocks) + 1)]
+    later_edges = [0] * (len(blocks) + 1)
+    later_capacity = [np.zeros(n, dtype=np.int64) for _ in range(len(blocks) + 1)]
+    for j in range(len(blocks) - 1, -1, -1):
+        block_n, local_edges, _ = blocks[j]
+        bridges = get_bridges(local_edges, range(len(local_edges)), UnionFind(block_n))
+        rest = np.setdiff1d(np.arange(len(local_edges)), bridges)
+        later_degree[j] = later_degree[j + 1] + np.bincount(block_ends[j][bridges].ravel(), minlength=n)
+        later_edges[j] = later_edges[j + 1] + block_n - 1 - len(bridges)
+        later_capacity[j] = later_capacity[j + 1] + np.bincount(block_ends[j][rest].ravel(), minlength=n)
+
+    def candidates(j, uf, excluded):
+        # edges of block j still open: not excluded and joining two of its components
+        local_edges = blocks[j][1]
+        return [p for p in range(len(local_edges)) if not excluded[p] and
+                uf.find(int(local_edges[p, 0])) != uf.find(int(local_edges[p, 1]))]
+
+    def propagate(j, uf, excluded, degree, chosen):
+        """
+        Take the bridges of the open edges of block j, moving on to the next blocks once a block is spanned.
+        :return: block, union-find, excluded edges, degrees, chosen edges and bound of the propagated branch
+        """
+        while j < len(blocks):
+            if uf is None:
+                uf, excluded = UnionFind(blocks[j][0]), np.zeros(len(blocks[j][1]), dtype=bool)
+            local_edges, edge_indices = blocks[j][1], blocks[j][2]
+            open_edges = candidates(j, uf, excluded)
+            bridges = get_bridges(local_edges, open_edges, uf)
+            if bridges:
+                uf = uf.copy()
+                degree = degree + np.bincount(block_ends[j][bridges].ravel(), minlength=n)
+                chosen = chosen + tuple(edge_indices[bridges].tolist())
+                for p in bridges:
+                    uf.union(int(local_edges[p, 0]), int(local_edges[p, 1]))
+                open_edges = [p for p in open_edges if p not in bridges]
+            if uf.count > 1:
+                ends = block_ends[j][open_edges]
+                capacity = later_capacity[j + 1] + np.bincount(ends.ravel(), minlength=n)
+                bound_degree = degree + later_degree[j + 1]
+                # every component of the block takes an edge: one unit goes to the node of lowest degree among
+                # its open edge endpoints, which costs the least
+                lowest = dict()
+                for p, (u, v) in zip(open_edges, ends.tolist()):
+                    for local, node in zip(local_edges[p].tolist(), (u, v)):
+                        component = uf.find(local)
+                        if component not in lowest or bound_degree[node] < bound_degree[lowest[component]]:
+                            lowest[component] = node
+                covered = np.bincount(list(lowest.values()), minlength=n)
+                value = get_degree_bound(bound_degree + covered, capacity - covered,
+                                         2 * (uf.count - 1 + later_edges[j + 1]) - len(lowest))
+                return j, uf, excluded, degree, chosen, value
+            # the block is spanned, go on with the next one
+            j, uf, excluded = j + 1, None, None
+        return j, None, None, degree, chosen, int(np.sum(degree ** 2))
+
+    best_value, best_chosen = float('inf'), None
+    # open branches (bound, tie breaker, block, union-find of the block, excluded block edges, degrees, chosen
+    # edge indices), the one of lowest bound is dived into first
+    tie_breaker = itertools.count()
+    root = propagate(0, None, None, base_degree, ())
+    heap = [(root[-1], next(tie_breaker), *root[:-1])]
+    explored = 0
+    while heap:
+        # the first dive always runs to a tree
+        if deadline is not None and best_chosen is not None and time.perf_counter() > deadline:
+            break
+        value, _, j, uf, excluded, degree, chosen = heapq.heappop(heap)
+        # dive along the include branches, leaving the exclude branches open
+        while value < best_value:
+            explored += 1
+            if j == len(blocks):
+                best_value, best_chosen = value, chosen
+                break
+
+            local_edges = blocks[j][1]
+            ends = block_ends[j]
+            p = min(candidates(j, uf, excluded), key=lambda p: degree[ends[p, 0]] + degree[ends[p, 1]])
+
+            # exclude branch, the block can still be spanned since p is not a bridge
+            without_p = excluded.copy()
+            without_p[p] = True
+            *child, child_value = propagate(j, uf, without_p, degree, chosen)
+            if child_value < best_value:
+                heapq.heappush(heap, (child_value, next(tie_breaker), *child))
+
+            # include branch
+            with_p = uf.copy()
+            with_p.union(int(local_edges[p, 0]), int(local_edges[p, 1]))
+            child_degree = degree.copy()
+            child_degree[ends[p]] += 1
+            j, uf, excluded, degree, chosen, value = propagate(j, with_p, excluded, child_degree,
+                                                               chosen + (int(blocks[j][2][p]),))
+
+    # the best tree is certified when no branch that could beat it is left
+    open_value = min([branch[0] for branch in heap if branch[0] < best_value], default=best_value)
+    tree = np.concatenate([edges[fixed], edges[list(best_chosen)].reshape(-1, 2)], axis=0) \
+        if best_chosen is not None else None
+    return {
+        'tree': tree,
+        'deg_std': _to_std(best_value, n, n_edges) if best_chosen is not None else None,
+        'lower_bound': _to_std(open_value, n, n_edges) if open_value < float('inf') else None,
+        'certified': best_chosen is not None and open_value >= best_value,
+        'nodes': explored
+    }
@@ -0,0 +1,118 @@
+import multiprocessing
+import os
+import pickle
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from instrumentation import start_trace, end_trace, add_counters
+
+# SemanticMap of the current request in a worker process: (key, map)
+_semantic_map = (None, None)
+
+
+def _load_map(key, name, size):
+    """
+    SemanticMap of a request, unpickled from its shared memory block by the first chunk a worker gets.
+    """
+    global _semantic_map
+    if _semantic_map[0] != key:
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            _semantic_map = (key, pickle.loads(block.buf[:size]))
+        finally:
+            block.close()
+    return _semantic_map[1]
+
+
+
+def _evaluate(key, name, size, start, trees):
+    # the counters of the worker are sent back to the trace of the request
+    semantic_map = _load_map(key, name, size)
+    trace, token = start_trace()
+    try:
+        metrics = semantic_map.get_evaluation_metrics(trees, range(len(semantic_map.formNames)))
+    finally:
+        end_trace(token)
+    return start, metrics, dict(trace.counters)
+
+
+
+class EvaluationPool(object):
+    """
+    Evaluate candidate maps, batched through SemanticMap.get_evaluation_metrics. Large batches are split into
+    chunks evaluated by a pool of worker processes, started once on first use and shared by all the requests;
+    small batches are evaluated in the calling process.
+    The SemanticMap of a request is pickled once into a shared memory block, which every worker reads once, so
+    that the tasks only carry the tree chunks.
+    """
+
+    def __init__(self, max_workers=1, min_parallel_size=0):
+        # number of worker processes, 1 evaluates in the calling process
+        self.max_workers = max_workers
+        # number of candidates times the size of the form-feature matrix below which the candidates are
+        # evaluated in the calling process
+        self.min_parallel_size = min_parallel_size
+        self.lock = threading.Lock()
+        # the pool is only started by the first large batch
+        self.executor = None
+        # process that started the pool: a forked process (a background job) starts its own
+        self.pid = None
+
+
+
+    def _start(self):
+        with self.lock:
+            if self.executor is None or self.pid != os.getpid():
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                    mp_context=multiprocessing.get_context())
+                self.pid = os.getpid()
+            return self.executor
+
+
+
+    def evaluate(self, semantic_map, trees, progress=None):
+        """
+        :param semantic_map: SemanticMap, only read
+        :param trees: list of adjacency matrices
+        :param progress: progress(name, value) callback
+        :return: list of metric dicts, in the order of the trees
+        """
+        if not trees:
+            return []
+        workers = min(self.max_workers, len(trees))
+        if workers <= 1 or len(trees) * semantic_map.tfM.size < self.min_parallel_size:
+            metrics = semantic_map.get_evaluation_metrics(trees, range(len(semantic_map.formNames)))
+            if progress is not None:
+                progress('candidates_evaluated', len(metrics))
+            return metrics
+
+        metrics = [None] * len(trees)
+        bounds = np.linspace(0, len(trees), workers + 1).astype(int)
+        executor = self._start()
+        data = pickle.dumps(semantic_map, protocol=pickle.HIGHEST_PROTOCOL)
+        block = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+        futures = []
+        try:
+            block.buf[:len(data)] = data
+            key = uuid.uuid4().hex
+            futures = [executor.submit(_evaluate, key, block.name, len(data), start, trees[start:end])
+                       for start, end in zip(bounds[:-1], bounds[1:])]
+            done = 0
+            for future in as_completed(futures):
+                start, chunk_metrics, counters = future.result()
+                add_counters(counters)
+                metrics[start:start + len(chunk_metrics)] = chunk_metrics
+                done += len(chunk_metrics)
+                if progress is not None:
+                    progress('candidates_evaluated', done)
+        finally:
+            # a cancelled job drops the chunks that have not started, the pool stays up for the next requests
+            for future in futures:
+                future.cancel()
+            block.close()
+            block.unlink()
+        return metrics
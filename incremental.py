@@ -0,0 +1,288 @@
+import math
+
+import numpy as np
+
+from connectivity import check_forms_connectivity, get_batched_components
+from metrics import get_stack_edges
+from subgraphs import count_connected_subgraphs
+
+
+class IncrementalMetrics(object):
+    """
+    Evaluation metrics of a map being edited one edge at a time, the same ones as
+    SemanticMap.get_evaluation_metric over all the forms.
+    The edge count, the weight sum, the degree moments and the ground truth confusion counts are updated in
+    O(1) per edit. The connected components are relabelled on the smaller side of a union or a split, a split
+    being detected by searching from both endpoints at once.
+    Only the forms containing both endpoints of an edited edge have their connectivity checked again.
+    The productivity counts the connected subgraphs of the whole map, the sum of the counts of its components:
+    only the components changed by an edit are counted again. SemanticMap.count_limit bounds the connected sets
+    of the 2-core enumerated over all the components, as it does for the whole map.
+    """
+
+    def __init__(self, semantic_map, adj_matrix):
+        self.semantic_map = semantic_map
+        n = len(semantic_map.unique_featNames)
+        self.n_nodes = n
+        # the same edges and weights as get_evaluation_metrics reads from the matrix
+        _, u, v, w = get_stack_edges(np.asarray(adj_matrix, dtype=np.float64)[None])
+        u, v, w = u.tolist(), v.tolist(), w.tolist()
+        # (u, v) with u < v -> weight
+        self.weights = dict(zip(zip(u, v), w))
+        self.neighbors = [set() for _ in range(n)]
+        for a, b in zip(u, v):
+            self.neighbors[a].add(b)
+            self.neighbors[b].add(a)
+        self.degree = [len(adjacent) for adjacent in self.neighbors]
+        self.degree_square_sum = sum(d * d for d in self.degree)
+        self.weight_sum = float(sum(w))
+
+        # component label of every node and the nodes of every component
+        labels = get_batched_components(1, n, np.zeros(len(u), dtype=np.int64), np.array(u, dtype=np.int64),
+                                        np.array(v, dtype=np.int64))[0].tolist()
+        self.labels = labels
+        self.components = dict()
+        for node, label in enumerate(labels):
+            self.components.setdefault(label, set()).add(node)
+        self.next_label = n
+
+        # connectivity of every form
+        self.pair_index = semantic_map.get_pair_index()
+        edges = np.array(list(self.weights), dtype=np.int64).reshape(-1, 2)
+        self.connected, _ = check_forms_connectivity(edges, semantic_map.tfM)
+        self.n_connected = int(np.count_nonzero(self.connected))
+
+        self._init_gt()
+        # component label -> (number of its connected subgraphs, None over the count limit, and number of
+        # connected sets of its 2-core enumerated), dropped once an edit changes the component
+        self.subgraph_counts = dict()
+
+
+
+    def _init_gt(self):
+        """
+        Confusion counts against the ground truth on the original features, as get_gt_metrics counts them: a
+        deduplicated edge (u, v) predicts every pair between the features merged into u and into v, the features
+        merged together are connected to each other, and every pair is counted in both directions.
+        """
+        semantic_map = self.semantic_map
+        self.gt_block = None
+        if semantic_map.GT_adj is None:
+            return
+        gt_edges = semantic_map.get_gt_edges()
+        n_features = gt_edges.shape[0]
+        index = semantic_map.unmerged_index if semantic_map.merge_feat_info else np.arange(n_features)
+        one_hot = np.zeros((n_features, self.n_nodes))
+        one_hot[np.arange(n_features), index] = 1
+        # (D, D) ground truth pairs between the features of every two deduplicated features
+        self.gt_block = np.rint(one_hot.T @ gt_edges.astype(np.float64) @ one_hot).astype(np.int64)
+        # (D,) number of original features of every deduplicated feature
+        self.group_size = np.bincount(index, minlength=self.n_nodes).astype(np.int64)
+        self.n_features = n_features
+        self.n_truth = int(np.count_nonzero(gt_edges))
+        # the pairs of features merged together
+        self.tp = int(np.trace(self.gt_block))
+        self.fp = int(np.sum(self.group_size * (self.group_size - 1))) - self.tp
+        for (u, v) in self.weights:
+            self._update_gt(u, v, 1)
+
+
+
+    def _update_gt(self, u, v, sign):
+        if self.gt_block is None:
+            return
+        tp = 2 * int(self.gt_block[u, v])
+        self.tp += sign * tp
+        self.fp += sign * (2 * int(self.group_size[u] * self.group_size[v]) - tp)
+
+
+
+    def _form_connected(self, form):
+        feats = self.pair_index.get_features(form)
+        if len(feats) <= 1:
+            return True
+        feats = set(feats.tolist())
+        start = next(iter(feats))
+        seen = {start}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for adjacent in self.neighbors[node]:
+                if adjacent in feats and adjacent not in seen:
+                    seen.add(adjacent)
+                    stack.append(adjacent)
+        return len(seen) == len(feats)
+
+
+
+    def _recheck_forms(self, u, v, was_connected):
+        """
+        Check again the forms containing both u and v that were (un)connected before the edit.
+        """
+        for form in self.pair_index.get_forms(u, v):
+            if self.connected[form] != was_connected:
+                continue
+            connected = self._form_connected(form)
+            if connected != was_connected:
+                self.connected[form] = connected
+                self.n_connected += 1 if connected else -1
+
+
+
+    def _split_side(self, u, v):
+        """
+        After removing the edge (u, v), search from u and from v in turn. If one search runs out of nodes before
+        reaching the other endpoint, u and v are disconnected and its nodes (the smaller side) are returned.
+        :return: set of nodes of the smaller side, None if u and v are still connected
+        """
+        seen = [{u}, {v}]
+        frontier = [[u], [v]]
+        while True:
+            for side in (0, 1):
+                if not frontier[side]:
+                    return seen[side]
+                node = frontier[side].pop()
+                for adjacent in self.neighbors[node]:
+                    if adjacent in seen[1 - side]:
+                        return None
+                    if adjacent not in seen[side]:
+                        seen[side].add(adjacent)
+                        frontier[side].append(adjacent)
+
+
+
+    def add_edge(self, u, v, weight):
+        """
+        Insert the edge (u, v), or change its weight if it already exists. A zero weight is a missing edge, as in
+        the adjacency matrix: the edge is removed if it exists, nothing happens otherwise.
+        """
+        u, v = min(u, v), max(u, v)
+        if u == v:
+            return
+        if weight == 0:
+            self.remove_edge(u, v)
+            return
+        if (u, v) in self.weights:
+            self.weight_sum += weight - self.weights[(u, v)]
+            self.weights[(u, v)] = weight
+            return
+        self.weights[(u, v)] = weight
+        self.weight_sum += weight
+        for node, adjacent in ((u, v), (v, u)):
+            self.neighbors[node].add(adjacent)
+            self.degree_square_sum += 2 * self.degree[node] + 1
+            self.degree[node] += 1
+        self._update_gt(u, v, 1)
+
+        label_u, label_v = self.labels[u], self.labels[v]
+        self.subgraph_counts.pop(label_u, None)
+        self.subgraph_counts.pop(label_v, None)
+        if label_u != label_v:
+            # relabel the smaller component
+            if len(self.components[label_u]) < len(self.components[label_v]):
+                label_u, label_v = label_v, label_u
+            moved = self.components.pop(label_v)
+            for node in moved:
+                self.labels[node] = label_u
+            self.components[label_u] |= moved
+        self._recheck_forms(u, v, False)
+
+
+
+    def remove_edge(self, u, v):
+        u, v = min(u, v), max(u, v)
+        if (u, v) not in self.weights:
+            return
+        self.weight_sum -= self.weights.pop((u, v))
+        for node, adjacent in ((u, v), (v, u)):
+            self.neighbors[node].discard(adjacent)
+            self.degree[node] -= 1
+            self.degree_square_sum -= 2 * self.degree[node] + 1
+        self._update_gt(u, v, -1)
+
+        label = self.labels[u]
+        self.subgraph_counts.pop(label, None)
+        side = self._split_side(u, v)
+        if side is not None:
+            self.components[label] -= side
+            self.components[self.next_label] = side
+            for node in side:
+                self.labels[node] = self.next_label
+            self.next_label += 1
+        self._recheck_forms(u, v, True)
+
+
+
+    def _count_subgraphs(self, label):
+        """
+        Number of connected subgraphs of a component with 2 to D - 1 nodes (None over the count limit), and number
+        of connected sets of its 2-core enumerated.
+        """
+        nodes = sorted(self.components[label])
+        if len(nodes) < 2:
+            return 0, 0
+        position = {node: i for i, node in enumerate(nodes)}
+        edges = np.array([(position[node], position[adjacent]) for node in nodes
+                          for adjacent in self.neighbors[node] if node < adjacent], dtype=np.int64).reshape(-1, 2)
+        size_counts, n_sets = count_connected_subgraphs(len(nodes), edges, self.semantic_map.count_limit,
+                                                        return_sets=True)
+        return (None if size_counts is None else int(sum(size_counts[2:self.n_nodes]))), n_sets
+
+
+
+    def apply(self, edits):
+        """
+        :param edits: list of (op, u, v, weight), op being 'add', 'update' or 'remove'
+        """
+        for op, u, v, weight in edits:
+            if op == 'remove':
+                self.remove_edge(u, v)
+            else:
+                self.add_edge(u, v, weight)
+
+
+
+    def get_metrics(self):
+        """
+        :return: metric dict, see SemanticMap.get_evaluation_metrics
+        """
+        n = self.n_nodes
+        n_edges = len(self.weights)
+        n_forms = len(self.connected)
+
+        gt = dict(acc=None, prec=None, recall=None, F1=None)
+        if self.gt_block is not None:
+            fn = self.n_truth - self.tp
+            precision = self.tp / (self.tp + self.fp) if self.tp + self.fp > 0 else 0.0
+            recall = self.tp / (self.tp + fn) if self.tp + fn > 0 else 0.0
+            f1 = 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+            gt = dict(acc=1 - (self.fp + fn) / float(self.n_features ** 2), prec=precision, recall=recall, F1=f1)
+
+        if n:
+            deg_mean = 2 * n_edges / n
+            deg_std = math.sqrt(max(0, n * self.degree_square_sum - (2 * n_edges) ** 2)) / n
+        else:
+            deg_mean = deg_std = float('nan')
+
+        for label in self.components:
+            if label not in self.subgraph_counts:
+                self.subgraph_counts[label] = self._count_subgraphs(label)
+        counts, n_sets = zip(*self.subgraph_counts.values()) if self.subgraph_counts else ((), ())
+        # unavailable when the map is over the count limit
+        limit = self.semantic_map.count_limit
+        truncated = None in counts or (limit is not None and sum(n_sets) > limit)
+        num_poss_subgraph = None if truncated else sum(counts)
+        productivity = self.n_connected / num_poss_subgraph if num_poss_subgraph else None
+
+        form_names = self.semantic_map.formNames
+        return {
+            **gt,
+            "weight_sum": float(self.weight_sum),
+            "deg_mean": float(deg_mean),
+            "deg_std": float(deg_std),
+            "productivity": productivity,
+            "productivity_truncated": truncated,
+            "coverage": float(self.n_connected / n_forms) if n_forms else float('nan'),
+            "unconnected_forms": [form_names[form] for form in np.flatnonzero(~self.connected)],
+            "num_edges": n_edges
+        }
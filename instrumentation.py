@@ -0,0 +1,312 @@
+import bisect
+import contextvars
+import functools
+import sys
+import threading
+import time
+from collections import Counter
+
+# whether spans and counters are recorded, see configure
+ENABLED = True
+
+# upper bounds in seconds of the latency histogram buckets
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf')]
+
+# histogram family -> name of its label
+LABELS = {'stage': 'stage', 'request': 'endpoint'}
+
+# trace of the request (or job) running in the current thread, None outside of a trace
+_current_trace = contextvars.ContextVar('trace', default=None)
+
+
+def configure(enabled=True):
+    """
+    Turn the instrumentation on or off. When it is off, span and count return at once.
+    """
+    global ENABLED
+    ENABLED = enabled
+
+
+
+class Trace(object):
+    """
+    Timing breakdown of one request: total seconds per span name and counter values.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        # span name -> [seconds, calls]
+        self.spans = dict()
+        self.counters = Counter()
+
+
+
+    def add_span(self, name, seconds):
+        entry = self.spans.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+
+    def as_dict(self):
+        """
+        :return: dict(total_ms, stages_ms, counters), JSON-serializable
+        """
+        return {
+            'total_ms': round((time.perf_counter() - self.start) * 1000, 3),
+            'stages_ms': {name: round(seconds * 1000, 3) for name, (seconds, _) in self.spans.items()},
+            'counters': dict(self.counters)
+        }
+
+
+
+class Histogram(object):
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+
+class Registry(object):
+    """
+    Process-wide latency histograms (per family and label) and counter totals, rendered for /metrics.
+    """
+
+    def __init__(self):
+        # (family, label) -> Histogram
+        self.histograms = dict()
+        self.counters = Counter()
+        self.lock = threading.Lock()
+
+
+
+    def observe(self, family, label, seconds):
+        with self.lock:
+            histogram = self.histograms.get((family, label))
+            if histogram is None:
+                histogram = self.histograms[(family, label)] = Histogram()
+            histogram.observe(seconds)
+
+
+
+    def add(self, name, value):
+        with self.lock:
+            self.counters[name] += value
+
+
+
+    def render(self, prefix='xism'):
+        """
+        Prometheus text exposition format: one histogram family per span kind, one counter per counter name.
+        """
+        lines = []
+        with self.lock:
+            families = sorted(set(family for family, _ in self.histograms))
+            for family in families:
+                name = f'{prefix}_{family}_seconds'
+                key = LABELS.get(family, 'name')
+                lines.append(f'# TYPE {name} histogram')
+                for (hist_family, label), histogram in sorted(self.histograms.items()):
+                    if hist_family != family:
+                        continue
+                    cumulative = 0
+                    for bound, bucket_count in zip(BUCKETS, histogram.counts):
+                        cumulative += bucket_count
+                        le = '+Inf' if bound == float('inf') else repr(float(bound))
+                        lines.append(f'{name}_bucket{{{key}="{label}",le="{le}"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{key}="{label}"}} {histogram.sum!r}')
+                    lines.append(f'{name}_count{{{key}="{label}"}} {histogram.count}')
+            for counter, value in sorted(self.counters.items()):
+                name = f'{prefix}_{counter}_total'
+                lines.append(f'# TYPE {name} counter')
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+
+# histograms and counters of this process
+REGISTRY = Registry()
+
+
+class _Span(object):
+
+    __slots__ = ['name', 'start']
+
+    def __init__(self, name):
+        self.name = name
+
+
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_span(self.name, seconds)
+        REGISTRY.observe('stage', self.name, seconds)
+        return False
+
+
+
+class _NullSpan(object):
+
+    __slots__ = []
+
+    def __enter__(self):
+        return self
+
+
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name):
+    """
+    Context manager timing a pipeline stage into the current trace and the stage histogram.
+    """
+    if not ENABLED:
+        return _NULL_SPAN
+    return _Span(name)
+
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function as the span name.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+
+def count(name, value=1):
+    """
+    Add to a counter of the current trace and to its process-wide total.
+    """
+    if not ENABLED:
+        return
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.counters[name] += value
+    REGISTRY.add(name, value)
+
+
+
+def add_counters(counters):
+    """
+    Add the counters recorded in another process (a pool worker) to the current trace and the totals.
+    """
+    for name, value in counters.items():
+        count(name, value)
+
+
+
+def observe_trace(timing):
+    """
+    Add the stages and counters of a trace recorded in another process (a job) to the histograms and totals.
+    :param timing: Trace.as_dict() of the other process
+    """
+    if not ENABLED or not timing:
+        return
+    for name, milliseconds in timing['stages_ms'].items():
+        REGISTRY.observe('stage', name, milliseconds / 1000)
+    for name, value in timing['counters'].items():
+        REGISTRY.add(name, value)
+
+
+
+def start_trace():
+    """
+    Start the trace of a request in the current context.
+    :return: Trace, token for end_trace
+    """
+    trace = Trace()
+    return trace, _current_trace.set(trace)
+
+
+
+def end_trace(token):
+    try:
+        _current_trace.reset(token)
+    except ValueError:
+        # ended from another context than the one it was started in (a streamed response)
+        _current_trace.set(None)
+
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+
+class SamplingProfiler(object):
+    """
+    Opt-in sampling profiler of one thread: a background thread records the stack of the profiled thread every
+    interval seconds. The samples are written in the folded format of flame graph tools ("f1;f2;f3 count").
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        # profiled thread, the calling thread by default
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        # folded stack -> number of samples
+        self.samples = Counter()
+        self.stopped = threading.Event()
+        self.thread = None
+
+
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self.thread.start()
+        return self
+
+
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.samples[';'.join(reversed(stack))] += 1
+
+
+
+    def folded(self):
+        return '\n'.join(f'{stack} {samples}' for stack, samples in self.samples.most_common()) + '\n'
@@ -0,0 +1,187 @@
+import multiprocessing
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from instrumentation import start_trace, end_trace, observe_trace
+
+# states after which a job does not change anymore
+FINAL_STATES = ['done', 'failed', 'cancelled']
+
+
+class JobCancelled(Exception):
+    pass
+
+
+
+def _run_job(func, args, progress, cancel):
+    """
+    Entry point of a job in the worker process.
+    The job function receives a progress(name, value) callback as keyword argument, which records a counter and
+    stops the job once it has been cancelled.
+    :return: result of the job function, timing breakdown of the job (see instrumentation.Trace)
+    """
+    if cancel.is_set():
+        raise JobCancelled()
+    progress['state'] = 'running'
+
+    def report(name, value):
+        if cancel.is_set():
+            raise JobCancelled()
+        progress[name] = value
+
+    trace, token = start_trace()
+    try:
+        result = func(*args, progress=report)
+    finally:
+        end_trace(token)
+    return result, trace.as_dict()
+
+
+
+class Job(object):
+
+    def __init__(self, job_id, future, progress, cancel, finalize=None):
+        self.id = job_id
+        self.future = future
+        # counters reported by the worker, shared with the worker process
+        self.progress = progress
+        # cancellation flag, shared with the worker process
+        self.cancel = cancel
+        # turns the worker result into the response, run once in the server process
+        self.finalize = finalize
+        self.result = None
+        # timing breakdown recorded in the worker process
+        self.timing = None
+        self.finalized = False
+        self.lock = threading.Lock()
+
+
+
+class JobManager(object):
+    """
+    Long-running work in a bounded process pool, with progress counters, cancellation and a bounded history of
+    finished jobs. Everything stays local: the queue is the pool's own, progress goes through a manager process.
+    """
+
+    def __init__(self, max_workers=2, max_jobs=256):
+        # number of worker processes
+        self.max_workers = max_workers
+        # number of jobs kept, the oldest finished ones are dropped first
+        self.max_jobs = max_jobs
+        # job id -> Job
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        # the pool and the manager are only started by the first job
+        self.executor = None
+        self.manager = None
+
+
+
+    def _start(self):
+        if self.executor is None:
+            context = multiprocessing.get_context()
+            self.manager = context.Manager()
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context)
+
+
+
+    def submit(self, func, *args, finalize=None):
+        """
+        Run func(*args, progress=...) in a worker process.
+        :param func: module-level function, so that it can be sent to the worker
+        :param finalize: function of the worker result returning the job result, run in the server process
+        :return: job id
+        """
+        with self.lock:
+            self._start()
+            progress = self.manager.dict(state='queued')
+            cancel = self.manager.Event()
+            future = self.executor.submit(_run_job, func, args, progress, cancel)
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = Job(job_id, future, progress, cancel, finalize)
+            self._forget()
+        return job_id
+
+
+
+    def _forget(self):
+        finished = [job_id for job_id, job in self.jobs.items() if job.future.done()]
+        for job_id in finished[:max(0, len(self.jobs) - self.max_jobs)]:
+            self.jobs.pop(job_id)
+
+
+
+    def get_state(self, job):
+        if job.future.cancelled():
+            return 'cancelled'
+        if job.future.done():
+            error = job.future.exception()
+            if isinstance(error, JobCancelled):
+                return 'cancelled'
+            return 'failed' if error is not None else 'done'
+        try:
+            return job.progress.get('state', 'queued')
+        except (OSError, EOFError):
+            return 'queued'
+
+
+
+    def status(self, job_id):
+        """
+        :return: dict(id, state, progress, error), None for an unknown job
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return None
+        state = self.get_state(job)
+        try:
+            progress = {name: value for name, value in job.progress.items() if name != 'state'}
+        except (OSError, EOFError):
+            progress = {}
+        status = {'id': job_id, 'state': state, 'progress': progress}
+        if state == 'failed':
+            status['error'] = str(job.future.exception())
+        return status
+
+
+
+    def result(self, job_id):
+        """
+        Result of a finished job, finalized on first access. None while the job is not done.
+        """
+        job = self.jobs.get(job_id)
+        if job is None or self.get_state(job) != 'done':
+            return None
+        with job.lock:
+            if not job.finalized:
+                result, job.timing = job.future.result()
+                # the stages of the worker process go into the histograms of the server process
+                observe_trace(job.timing)
+                job.result = job.finalize(result) if job.finalize is not None else result
+                job.finalized = True
+        return job.result
+
+
+
+    def timing(self, job_id):
+        """
+        Timing breakdown of a finished job, available once its result has been accessed.
+        """
+        job = self.jobs.get(job_id)
+        return job.timing if job is not None else None
+
+
+
+    def cancel(self, job_id):
+        """
+        Cancel a queued job, or stop a running one at its next progress report.
+        :return: False for an unknown job
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        if not job.future.cancel():
+            job.cancel.set()
+        return True
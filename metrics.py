@@ -0,0 +1,86 @@
+import numpy as np
+
+from connectivity import get_batched_components
+
+
+def get_stack_edges(adj_stack):
+    """
+    Extract the undirected edges of a stack of adjacency matrices, the way nx.from_numpy_array reads each of
+    them: an entry in either triangle is an edge, the lower triangle giving its weight when both are set.
+    The diagonal is ignored.
+    :param adj_stack: (K, D, D) adjacency matrices
+    :return: graph index (M,), u (M,), v (M,) with u < v, weights (M,)
+    """
+    upper = np.triu(adj_stack, 1)
+    lower = np.swapaxes(np.tril(adj_stack, -1), 1, 2)
+    weights = np.where(lower != 0, lower, upper)
+    graph, u, v = np.nonzero(weights)
+    return graph, u, v, weights[graph, u, v].astype(np.float64)
+
+
+
+def get_graph_metrics(adj_stack):
+    """
+    Structural metrics of K maps at once.
+    The number of independent cycles (the size of a cycle basis) is E - V + C, C counting the isolated nodes.
+    :param adj_stack: (K, D, D) adjacency matrices
+    :return: dict of (K,) arrays: num_edges, weight_sum, deg_mean, deg_std, num_components, num_cycles
+    """
+    adj_stack = np.asarray(adj_stack)
+    n_maps, n_nodes = adj_stack.shape[0], adj_stack.shape[1]
+    graph, u, v, weights = get_stack_edges(adj_stack)
+
+    num_edges = np.bincount(graph, minlength=n_maps)
+    weight_sum = np.bincount(graph, weights=weights, minlength=n_maps)
+    deg = np.zeros((n_maps, n_nodes), dtype=np.int64)
+    np.add.at(deg, (graph, u), 1)
+    np.add.at(deg, (graph, v), 1)
+    if n_nodes:
+        deg_mean, deg_std = deg.mean(axis=1), deg.std(axis=1)
+    else:
+        deg_mean = deg_std = np.full(n_maps, np.nan)
+
+    labels = get_batched_components(n_maps, n_nodes, graph, u, v)
+    num_components = np.count_nonzero(labels == np.arange(n_nodes), axis=1)
+    return {
+        'num_edges': num_edges,
+        'weight_sum': weight_sum,
+        'deg_mean': deg_mean,
+        'deg_std': deg_std,
+        'num_components': num_components,
+        'num_cycles': num_edges - n_nodes + num_components
+    }
+
+
+
+def get_gt_metrics(adj_stack, gt_edges, unmerged_index=None):
+    """
+    Compare K maps with the ground truth at once, on the original (not deduplicated) features.
+    A restored feature has the edges of the feature it was merged into, and the features merged together are
+    connected to each other (see SemanticMap.get_unmerged_matrix).
+    :param adj_stack: (K, D, D) adjacency matrices over the deduplicated features
+    :param gt_edges: (D0, D0) boolean symmetric ground truth edge matrix with an empty diagonal
+    :param unmerged_index: (D0,) deduplicated feature of every original feature, None if nothing was merged
+    :return: dict of (K,) arrays: acc, precision, recall, f1
+    """
+    adj_stack = np.asarray(adj_stack)
+    n_maps = adj_stack.shape[0]
+    pred = (adj_stack != 0) | (np.swapaxes(adj_stack, 1, 2) != 0)
+    if unmerged_index is not None:
+        pred = pred[:, unmerged_index[:, None], unmerged_index[None, :]]
+        pred |= unmerged_index[:, None] == unmerged_index[None, :]
+    n_features = gt_edges.shape[0]
+    pred[:, np.arange(n_features), np.arange(n_features)] = False
+
+    pred = pred.reshape(n_maps, -1)
+    truth = gt_edges.reshape(-1)
+    # counted over the whole matrix, every edge twice
+    tp = np.count_nonzero(pred & truth, axis=1)
+    fp = np.count_nonzero(pred & ~truth, axis=1)
+    fn = np.count_nonzero(truth) - tp
+    acc = 1 - (fp + fn) / float(n_features ** 2)
+
+    precision = np.divide(tp, tp + fp, out=np.zeros(n_maps), where=(tp + fp) > 0)
+    recall = np.divide(tp, tp + fn, out=np.zeros(n_maps), where=(tp + fn) > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(n_maps), where=(precision + recall) > 0)
+    return {'acc': acc, 'precision': precision, 'recall': recall, 'f1': f1}
@@ -0,0 +1,113 @@
+import numpy as np
+
+try:
+    import scipy.sparse as sp
+except ImportError:
+    sp = None
+
+# upper bound in bytes on the dense float64 rows unpacked at a time by the co-occurrence product
+PRODUCT_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+class PackedMatrix(object):
+    """
+    Form-feature matrix stored as bit rows (np.packbits), one bit per form and feature: a feature belongs to a
+    form when its value is > 0. A presence/absence table is only kept as bits; a weighted table (any other
+    value) also keeps its values, dense or CSR for a sparse input, from which its co-occurrence is computed.
+    A sparse input is packed by blocks of rows, without building the dense matrix.
+    """
+
+    ndim = 2
+
+    def __init__(self, matrix):
+        if sp is not None and sp.issparse(matrix):
+            matrix = sp.csr_matrix(matrix, dtype=np.float64)
+            self.shape = matrix.shape
+            step = max(1, PRODUCT_CHUNK_BYTES // max(1, 8 * self.shape[1]))
+            blocks = [np.packbits(matrix[start:start + step].toarray() > 0, axis=1)
+                      for start in range(0, self.shape[0], step)]
+            self.bits = np.concatenate([np.packbits(np.zeros((0, self.shape[1]), dtype=bool), axis=1)] + blocks)
+            self.values = None if np.all((matrix.data == 0) | (matrix.data == 1)) else matrix
+            return
+        matrix = np.asarray(matrix, dtype=np.float64)
+        # (N, D)
+        self.shape = matrix.shape
+        # (N, ceil(D / 8)) membership bits
+        self.bits = np.packbits(matrix > 0, axis=1)
+        # (N, D) values of a weighted table, None for a presence/absence table
+        self.values = None if np.all((matrix == 0) | (matrix == 1)) else matrix
+
+
+
+    @property
+    def size(self):
+        return self.shape[0] * self.shape[1]
+
+
+
+    @property
+    def is_binary(self):
+        return self.values is None
+
+
+
+    @property
+    def nbytes(self):
+        if self.values is None:
+            return self.bits.nbytes
+        if sp is not None and sp.issparse(self.values):
+            return self.bits.nbytes + self.values.data.nbytes + self.values.indices.nbytes + self.values.indptr.nbytes
+        return self.bits.nbytes + self.values.nbytes
+
+
+
+    def member(self, rows=None):
+        """
+        Boolean membership of the forms.
+        :param rows: form indices, None for all the forms
+        :return: (len(rows), D) boolean array
+        """
+        bits = self.bits if rows is None else self.bits[np.asarray(rows, dtype=np.int64)]
+        return np.unpackbits(bits, axis=1, count=self.shape[1]).view(bool)
+
+
+
+    def get_features(self, row):
+        """
+        Features of a form, in increasing order.
+        """
+        return np.flatnonzero(np.unpackbits(self.bits[row], count=self.shape[1]))
+
+
+
+    def toarray(self, rows=None):
+        """
+        Dense float64 form-feature matrix, the values of a weighted table or 0/1.
+        """
+        if self.values is not None:
+            values = self.values if rows is None else self.values[np.asarray(rows, dtype=np.int64)]
+            if sp is not None and sp.issparse(values):
+                return values.toarray()
+            return values.copy() if rows is None else values
+        return self.member(rows).astype(np.float64)
+
+
+
+    def get_cooccurrence(self):
+        """
+        Co-occurrence matrix and feature frequencies of a presence/absence table, by the dense product of blocks
+        of rows unpacked one at a time, so that the whole table is never held as floats. The product runs in
+        BLAS and is faster than a popcount of the bit columns at every table size.
+        :return: cooccurrence (D, D), feature_freq (D,)
+        """
+        if self.values is not None:
+            raise ValueError("the co-occurrence of a weighted table is computed from its values")
+        n_forms, n_features = self.shape
+        cooccurrence = np.zeros((n_features, n_features), dtype=np.float64)
+        step = max(1, PRODUCT_CHUNK_BYTES // max(1, 8 * n_features))
+        for start in range(0, n_forms, step):
+            block = self.toarray(np.arange(start, min(n_forms, start + step)))
+            cooccurrence += block.T @ block
+        # a feature co-occurs with itself in every form containing it
+        feature_freq = np.diagonal(cooccurrence).copy()
+        return cooccurrence, feature_freq
@@ -0,0 +1,129 @@
+import numpy as np
+
+from packed import PackedMatrix
+
+try:
+    import scipy.sparse as sp
+except ImportError:
+    sp = None
+
+
+# calculation type -> association measure
+RELATIONS = dict()
+
+# below this density a dense form-feature matrix is multiplied in sparse form
+SPARSE_DENSITY = 0.05
+
+
+def register_relation(calc_type):
+    """
+    Register an association measure under a calculation type.
+    The measure receives the co-occurrence matrix (D, D), the feature frequencies (D,), the number of forms
+    and the zeroOcc scale, and returns the (D, D) weight matrix using broadcast operations only.
+    """
+    def decorator(func):
+        RELATIONS[calc_type] = func
+        return func
+    return decorator
+
+
+
+def is_sparse(matrix):
+    return sp is not None and sp.issparse(matrix)
+
+
+
+def get_cooccurrence(matrix):
+    """
+    Compute the co-occurrence matrix and the feature frequencies of a dense, sparse or bit-packed form-feature
+    matrix.
+    :param matrix: (N, D) form-feature matrix
+    :return: cooccurrence (D, D), feature_freq (D,)
+    """
+    if isinstance(matrix, PackedMatrix):
+        if matrix.is_binary:
+            return matrix.get_cooccurrence()
+        matrix = matrix.values
+    if not is_sparse(matrix) and sp is not None and matrix.size and np.count_nonzero(matrix) < SPARSE_DENSITY * matrix.size:
+        matrix = sp.csr_matrix(matrix)
+    if is_sparse(matrix):
+        matrix = matrix.tocsr().astype(np.float64)
+        cooccurrence = (matrix.T @ matrix).toarray()
+        feature_freq = np.asarray(matrix.sum(axis=0)).ravel()
+    else:
+        matrix = np.asarray(matrix, dtype=np.float64)
+        cooccurrence = matrix.T @ matrix
+        feature_freq = np.sum(matrix, axis=0)
+    return cooccurrence, feature_freq
+
+
+
+def _safe_divide(numerator, denominator):
+    """
+    Element-wise division that yields 0 where the denominator is not positive.
+    """
+    out = np.zeros(np.broadcast(numerator, denominator).shape)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+
+@register_relation('G')
+def general_cooccurrence(cooccurrence, feature_freq, n_forms, zeroOcc=0):
+    # Co-occurrence frequency, plus the scaled frequency of joint absence
+    # (1 - M).T @ (1 - M) = N - freq(A) - freq(B) + co-occurrence
+    joint_absence = n_forms - feature_freq[:, None] - feature_freq[None, :] + cooccurrence
+    return cooccurrence * (1 - zeroOcc) + joint_absence * zeroOcc
+
+
+
+@register_relation('J')
+def jaccard(cooccurrence, feature_freq, n_forms, zeroOcc=0):
+    # Jaccard similarity = |Intersection| / |Union|, mixed with the co-occurrence frequency
+    # |Union| = freq(A) + freq(B) - co-occurrence frequency
+    union = feature_freq[:, None] + feature_freq[None, :] - cooccurrence
+    adj_matrix = 0.1 * _safe_divide(cooccurrence, union) + cooccurrence * 0.9
+    adj_matrix[union <= 0] = 0.0
+    np.fill_diagonal(adj_matrix, 0.0)
+    return adj_matrix
+
+
+
+@register_relation('D')
+def dice(cooccurrence, feature_freq, n_forms, zeroOcc=0):
+    # Dice coefficient = 2 * |Intersection| / (|A| + |B|)
+    total = feature_freq[:, None] + feature_freq[None, :]
+    adj_matrix = _safe_divide(2 * cooccurrence, total)
+    np.fill_diagonal(adj_matrix, 0.0)
+    return adj_matrix
+
+
+
+@register_relation('P')
+def positive_pmi(cooccurrence, feature_freq, n_forms, zeroOcc=0):
+    # Positive pointwise mutual information = max(0, log(P(A, B) / (P(A) P(B))))
+    ratio = _safe_divide(cooccurrence * n_forms, feature_freq[:, None] * feature_freq[None, :])
+    adj_matrix = np.zeros_like(ratio)
+    np.log(ratio, out=adj_matrix, where=ratio > 1)
+    np.fill_diagonal(adj_matrix, 0.0)
+    return adj_matrix
+
+
+
+@register_relation('C')
+def cosine(cooccurrence, feature_freq, n_forms, zeroOcc=0):
+    # Cosine similarity = <A, B> / (|A| |B|), the norms are on the diagonal of the co-occurrence matrix
+    norms = np.sqrt(np.diag(cooccurrence))
+    adj_matrix = _safe_divide(cooccurrence, norms[:, None] * norms[None, :])
+    np.fill_diagonal(adj_matrix, 0.0)
+    return adj_matrix
+
+
+
+@register_relation('O')
+def overlap(cooccurrence, feature_freq, n_forms, zeroOcc=0):
+    # Overlap coefficient = |Intersection| / min(|A|, |B|)
+    smaller = np.minimum(feature_freq[:, None], feature_freq[None, :])
+    adj_matrix = _safe_divide(cooccurrence, smaller)
+    np.fill_diagonal(adj_matrix, 0.0)
+    return adj_matrix
@@ -0,0 +1,138 @@
+import hashlib
+import io
+import json
+import os
+import threading
+
+import numpy as np
+
+# bump when the stored results change, so that older entries are ignored
+RESULT_VERSION = 5
+
+
+def get_result_key(semantic_map):
+    """
+    Hash everything the candidate maps and their metrics depend on: the deduplicated form-feature matrix, the
+    ground truth, the feature and form names, the relation settings, the tree sampler settings and the limit of
+    the productivity count.
+    :param semantic_map: SemanticMap
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    settings = [RESULT_VERSION, semantic_map.unique_featNames, semantic_map.formNames, semantic_map.calc_type,
+                semantic_map.zeroOcc, semantic_map.max_trees, semantic_map.time_budget,
+                semantic_map.n_candidates, semantic_map.diversity, semantic_map.candidate_mode,
+                semantic_map.tolerance, semantic_map.relative_tolerance, semantic_map.seed,
+                semantic_map.search_budget, semantic_map.count_limit]
+    digest.update(json.dumps(settings, default=str, ensure_ascii=False).encode('utf-8'))
+    for array in [semantic_map.tfM.toarray(), semantic_map.GT_adj]:
+        if array is None:
+            digest.update(b'none')
+            continue
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        digest.update(str(array.shape).encode('utf-8'))
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+
+def _to_json(value):
+    # numpy scalars in the metrics
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+
+class ResultCache(object):
+    """
+    On-disk cache of candidate maps and their evaluation metrics: one .npz file per result key, evicted in
+    least recently used order once the directory grows beyond max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024):
+        # cache directory
+        self.directory = directory
+        # upper bound on the total size of the cached files
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+
+
+    def get(self, key):
+        """
+        Load a cached result and mark it as recently used.
+        :return: dict(trees: list of (D, D) adjacency matrices, metrics: list of dict, diagnostics: dict), or None
+        """
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as archive:
+                meta = json.loads(str(archive['meta']))
+                n = meta['n_nodes']
+                trees = []
+                for i in range(len(meta['metrics'])):
+                    edges, weights = archive[f'edges_{i}'], archive[f'weights_{i}']
+                    tree = np.zeros((n, n), dtype=float)
+                    tree[edges[:, 0], edges[:, 1]] = weights
+                    trees.append(tree)
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            return None
+        return {'trees': trees, 'metrics': meta['metrics'], 'diagnostics': meta['diagnostics']}
+
+
+
+    def put(self, key, trees, metrics, diagnostics=None):
+        """
+        Store the candidate maps of a result with their metrics, then evict the least recently used results.
+        :param trees: list of (D, D) adjacency matrices
+        :param metrics: list of metric dicts, one per tree
+        :param diagnostics: diagnostics dict
+        """
+        arrays = dict()
+        for i, tree in enumerate(trees):
+            rows, cols = np.nonzero(tree)
+            arrays[f'edges_{i}'] = np.stack([rows, cols], axis=1).astype(np.int64)
+            arrays[f'weights_{i}'] = tree[rows, cols].astype(np.float64)
+        n_nodes = trees[0].shape[0] if trees else 0
+        meta = {'n_nodes': n_nodes, 'metrics': metrics, 'diagnostics': diagnostics or {}}
+        arrays['meta'] = np.array(json.dumps(meta, default=_to_json, ensure_ascii=False))
+
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **arrays)
+        path = self._path(key)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with self.lock:
+            with open(tmp_path, 'wb') as f:
+                f.write(buffer.getvalue())
+            # readers never see a partially written file
+            os.replace(tmp_path, path)
+            self._evict()
+
+
+
+    def _evict(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.npz'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
@@ -7,7 +7,12 @@ let selectedNodes = [];
 let selectedEdges = [];
 let currentFormsData = []; // 存储当前的forms数据
 let highlightedNodes = []; // 存储当前高亮的节点
-let originalExcelData = []; // 存储原始Excel数据
+let originalExcelData = []; // 存储上传的原始文件及其数据集handle
+let datasetHandle = null; // 后端缓存的数据集handle，merge和校验时代替完整表格
+let mapIds = []; // 每个地图在后端缓存中的id
+let baseEdgeDatasets = []; // 后端返回的每个地图的原始边，用于计算边增量
+let evaluationStates = []; // 每个地图在后端的增量评价状态id，编辑边时只发送本次修改的边
+let currentProcessJobId = null; // 正在生成语义地图的后台任务id
 
 let isBeautified = false; // 跟踪图形美化状态
 
@@ -447,8 +452,8 @@ async function handleFileUpload() {
     fileInfo.textContent = `Selected file: ${file.name}`;
     
     try {
-        // 读取Excel文件
-        const data = await readExcelFile(file);
+        // 上传Excel文件，由后端解析
+        const data = await uploadExcelFile(file);
         
         // 保存原始Excel数据供merge edges功能使用
         originalExcelData = data;
@@ -520,8 +525,8 @@ async function handleExampleUpload() {
         // 更新文件信息显示
         fileInfo.textContent = `Loaded example file: ${file.name}`;
         
-        // 读取Excel文件
-        const data = await readExcelFile(file);
+        // 上传Excel文件，由后端解析
+        const data = await uploadExcelFile(file);
         
         // 保存原始Excel数据供merge edges功能使用
         originalExcelData = data;
@@ -593,8 +598,8 @@ async function handleExampleUpload2() {
         // 更新文件信息显示
         fileInfo.textContent = `Loaded example file: ${file.name}`;
         
-        // 读取Excel文件
-        const data = await readExcelFile(file);
+        // 上传Excel文件，由后端解析
+        const data = await uploadExcelFile(file);
         
         // 保存原始Excel数据供merge edges功能使用
         originalExcelData = data;
@@ -666,8 +671,8 @@ async function handleExampleUpload3() {
         // 更新文件信息显示
         fileInfo.textContent = `Loaded example file: ${file.name}`;
         
-        // 读取Excel文件
-        const data = await readExcelFile(file);
+        // 上传Excel文件，由后端解析
+        const data = await uploadExcelFile(file);
         
         // 保存原始Excel数据供merge edges功能使用
         originalExcelData = data;
@@ -823,6 +828,9 @@ function updateEvaluationMetrics(slideIndex, evaluationMetric) {
             if (value !== undefined && value !== null) {
                 // 格式化数值，保留三位小数
                 valueElement.textContent = typeof value === 'number' ? value.toFixed(3) : value;
+            } else if (key === 'productivity' && evaluationMetric.productivity_truncated) {
+                // 地图的环太多，连通子图超出计数上限
+                valueElement.textContent = 'N/A (too many cycles)';
             } else {
                 valueElement.textContent = 'N/A';
             }
@@ -960,17 +968,7 @@ async function mergeEdges() {
         document.getElementById('merge-edge-btn').disabled = true;
         
         // 调用后端merge edges接口
-        const response = await fetch('/api/merge-edges', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                data: originalExcelData.data,
-                label: originalExcelData.label,
-                graph: currentGraph
-            })
-        });
+        const response = await postGraphRequest('/api/jobs/merge-edges', currentIndex, currentGraph);
         
         if (!response.ok) {
             // 尝试解析后端返回的错误信息
@@ -986,7 +984,14 @@ async function mergeEdges() {
             }
         }
         
-        const result = await response.json();
+        // 等待后台merge任务完成
+        const job = await response.json();
+        const jobResult = await waitForJob(job.job_id);
+        if (!jobResult.ok) {
+            console.error(`Merge edges 错误: ${jobResult.error}`);
+            throw new Error(jobResult.error);
+        }
+        const result = expandColumnarResult(jobResult.data);
         console.log('Merge edges 返回结果:', result);
         
         // 处理新增的边数据 - graph_data现在是一个dict包含edges和evaluation_metric
@@ -1073,6 +1078,8 @@ async function mergeEdges() {
                 evaluationMetricsData[currentIndex] = result.graph_data.evaluation_metric;
                 updateEvaluationMetrics(currentIndex, result.graph_data.evaluation_metric);
             }
+            // merge改变了地图的边，增量评价状态失效
+            evaluationStates[currentIndex] = null;
             
             // 更新forms数据
             if (result.forms_with_nodes) {
@@ -1132,6 +1139,7 @@ function restoreMerge() {
             evaluationMetricsData[currentIndex] = JSON.parse(JSON.stringify(backupEvaluationMetricsArray[currentIndex]));
             updateEvaluationMetrics(currentIndex, backupEvaluationMetricsArray[currentIndex]);
         }
+        evaluationStates[currentIndex] = null;
         
         // 还原未连接表单
         if (backupUnconnectedFormsArray[currentIndex]) {
@@ -1194,60 +1202,44 @@ function updateGraphTitles(fileName, graphDataArray) {
     });
 }
 
-// 读取Excel文件
-function readExcelFile(file) {
-    return new Promise((resolve, reject) => {
-        const reader = new FileReader();
-        
-        reader.onload = function(e) {
-            try {
-                const data = e.target.result;
-                const workbook = XLSX.read(data, { type: 'array' });
-                
-                // 获取第一个工作表
-                const firstSheetName = workbook.SheetNames[0];
-                const firstWorksheet = workbook.Sheets[firstSheetName];
-                
-                // 将第一个工作表转换为JSON
-                const firstSheetData = XLSX.utils.sheet_to_json(firstWorksheet, { defval: null });
-                
-                // 获取第二个工作表（如果存在）
-                let secondSheetData = [];
-                if (workbook.SheetNames.length > 1) {
-                    const secondSheetName = workbook.SheetNames[1];
-                    const secondWorksheet = workbook.Sheets[secondSheetName];
-                    secondSheetData = XLSX.utils.sheet_to_json(secondWorksheet, { defval: null });
-                }
-                
-                // 返回包含两个sheet数据的对象
-                resolve({
-                    data: firstSheetData,
-                    label: secondSheetData
-                });
-            } catch (error) {
-                reject(error);
-            }
-        };
-        
-        reader.onerror = function(error) {
-            reject(error);
-        };
-        
-        reader.readAsArrayBuffer(file);
+// 上传Excel文件
+async function uploadExcelFile(file) {
+    // 上传原始文件，由后端解析表格(第二个工作表为ground truth)，返回数据集handle
+    const formData = new FormData();
+    formData.append('file', file);
+    const response = await fetch('/api/upload', {
+        method: 'POST',
+        body: formData
     });
+    const result = await response.json().catch(() => ({}));
+    if (!response.ok) {
+        const alertMsg = (typeof result.error === 'string' && result.error.trim()) || 'Request failed. Please try again later.';
+        alert(alertMsg);
+        throw new Error(alertMsg);
+    }
+    return {
+        file: file,
+        handle: result.handle
+    };
 }
 
 // 发送数据到后端
 async function sendDataToBackend(excelData) {
+    const fileInfo = document.getElementById('file-info');
+    const fileInfoText = fileInfo ? fileInfo.textContent : '';
     try {
-        const response = await fetch('/api/process-excel', {
+        // 新的上传取代尚未完成的任务
+        if (currentProcessJobId) {
+            cancelJob(currentProcessJobId);
+        }
+        const response = await fetch('/api/jobs/process-excel', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({ 
-                data: excelData.data,
-                label: excelData.label 
+                handle: excelData.handle,
+                format: 'columnar'
             })
         });
         
@@ -1266,7 +1258,31 @@ async function sendDataToBackend(excelData) {
             throw new Error(alertMsg);
         }
         
-        return await response.json();
+        // 等待后台任务完成，并显示进度
+        const job = await response.json();
+        currentProcessJobId = job.job_id;
+        const jobResult = await waitForJob(job.job_id, status => {
+            if (fileInfo && status.state === 'running') {
+                const progress = status.progress || {};
+                fileInfo.textContent = `Generating semantic maps: ${progress.trees_enumerated || 0} trees enumerated, ` +
+                    `${progress.candidates_evaluated || 0} candidates evaluated`;
+            }
+        });
+        if (currentProcessJobId === job.job_id) {
+            currentProcessJobId = null;
+        }
+        if (!jobResult.ok) {
+            // 被新的上传取消时不再提示
+            if (!jobResult.cancelled) {
+                alert(jobResult.error);
+            }
+            throw new Error(jobResult.error);
+        }
+        
+        const result = expandColumnarResult(jobResult.data);
+        // 记录数据集handle，后续请求只需发送地图的边增量
+        datasetHandle = result.handle || null;
+        return result;
     } catch (error) {
         console.error('发送数据到后端时出错:', error);
         
@@ -1277,9 +1293,69 @@ async function sendDataToBackend(excelData) {
         
         // Re-throw so caller can handle without duplicating alerts
         throw error;
+    } finally {
+        if (fileInfo) {
+            fileInfo.textContent = fileInfoText;
+        }
     }
 }
 
+// 等待后台任务结束：优先通过Server-Sent Events接收进度，不支持或连接中断时轮询任务状态
+function waitForJob(jobId, onProgress) {
+    const finalStates = ['done', 'failed', 'cancelled'];
+    const finish = status => {
+        if (status.state === 'done') {
+            return { ok: true, data: status.result };
+        }
+        const cancelled = status.state === 'cancelled';
+        return { ok: false, cancelled: cancelled, error: status.error || (cancelled ? 'The job was cancelled.' : 'Request failed. Please try again later.') };
+    };
+    const poll = async () => {
+        while (true) {
+            const response = await fetch(`/api/jobs/${jobId}`);
+            const status = await response.json();
+            if (!response.ok) {
+                return { state: 'failed', error: status.error };
+            }
+            if (onProgress) {
+                onProgress(status);
+            }
+            if (finalStates.includes(status.state)) {
+                return status;
+            }
+            await new Promise(resolve => setTimeout(resolve, 500));
+        }
+    };
+    return new Promise((resolve, reject) => {
+        if (!window.EventSource) {
+            poll().then(status => resolve(finish(status)), reject);
+            return;
+        }
+        const source = new EventSource(`/api/jobs/${jobId}/events`);
+        source.onmessage = event => {
+            const status = JSON.parse(event.data);
+            if (onProgress) {
+                onProgress(status);
+            }
+            if (finalStates.includes(status.state)) {
+                source.close();
+                resolve(finish(status));
+            }
+        };
+        source.onerror = () => {
+            source.close();
+            poll().then(status => resolve(finish(status)), reject);
+        };
+    });
+}
+
+// 取消后台任务
+function cancelJob(jobId) {
+    return fetch(`/api/jobs/${jobId}`, { method: 'DELETE' }).catch(error => {
+        console.error('取消任务时出错:', error);
+    });
+}
+
 
 
 // 更新图形
@@ -1300,6 +1376,9 @@ function updateGraph(graphDataArray) {
     nodeDatasets = [];
     edgeDatasets = [];
     evaluationMetricsData = [];
+    mapIds = [];
+    baseEdgeDatasets = [];
+    evaluationStates = [];
     
     // 初始化merge相关的状态数组
     isMergedStates = [];
@@ -1346,6 +1425,10 @@ function updateGraph(graphDataArray) {
         nodeDatasets[i] = new vis.DataSet(nodes);
         edgeDatasets[i] = new vis.DataSet(edges);
         
+        // 记录后端返回的原始地图，用于计算边增量
+        mapIds[i] = graphData.map_id || null;
+        baseEdgeDatasets[i] = edges.map(edge => ({ from: edge.from, to: edge.to, value: parseFloat(edge.value) }));
+        
         // 获取容器
         const container = document.getElementById(`graph-container-${i+1}`);
         
@@ -1529,7 +1612,7 @@ async function addEdge() {
         updateEdgeWidths(currentSlideIndex);
         
         // 调用后端接口进行校验
-        await validateGraphWithBackend();
+        await validateGraphWithBackend([{ op: 'add', from: fromNode, to: toNode, value: value }]);
     }
 }
 
@@ -1541,6 +1624,7 @@ async function deleteSelectedEdge() {
         // 确认删除
         if (confirm(`确定要删除选中的 ${selectedEdges.length} 条边吗？`)) {
             // 只从当前地图中删除边
+            const removedEdges = edgeDatasets[currentSlideIndex].get(selectedEdges);
             edgeDatasets[currentSlideIndex].remove(selectedEdges);
             selectedEdges = [];
             
@@ -1550,7 +1634,7 @@ async function deleteSelectedEdge() {
             }
             
             // 调用后端接口进行校验
-            await validateGraphWithBackend();
+            await validateGraphWithBackend(removedEdges.map(edge => ({ op: 'remove', from: edge.from, to: edge.to })));
         }
     } else {
         alert('请先选择要删除的边');
@@ -1635,7 +1719,7 @@ async function updateEdge() {
     updateEdgeWidths(currentSlideIndex);
     
     // 调用后端接口进行校验
-    await validateGraphWithBackend();
+    await validateGraphWithBackend([{ op: 'update', from: edge.from, to: edge.to, value: value }]);
 }
 
 // 将当前显示的网络图居中
@@ -1828,7 +1912,143 @@ function downloadGraph() {
 }
 
 // 调用后端接口校验语义地图质量
-async function validateGraphWithBackend() {
+// 计算地图当前的边相对于后端返回的原始地图的增量
+function getGraphDelta(index) {
+    const edgeKey = edge => {
+        const a = parseInt(edge.from), b = parseInt(edge.to);
+        return a < b ? `${a}-${b}` : `${b}-${a}`;
+    };
+    const baseEdges = new Map(baseEdgeDatasets[index].map(edge => [edgeKey(edge), edge]));
+    const currentEdges = new Map(edgeDatasets[index].get().map(edge => [edgeKey(edge), edge]));
+    const add = [];
+    const remove = [];
+    currentEdges.forEach((edge, key) => {
+        const value = parseFloat(edge.value) || 1;
+        const base = baseEdges.get(key);
+        if (!base || base.value !== value) {
+            add.push({ from: edge.from, to: edge.to, value: value });
+        }
+    });
+    baseEdges.forEach((edge, key) => {
+        if (!currentEdges.has(key)) {
+            remove.push({ from: edge.from, to: edge.to });
+        }
+    });
+    return { add: add, remove: remove };
+}
+
+// 发送地图到后端：优先发送数据集handle和边增量，后端缓存过期时重新上传文件并发送完整地图
+async function postGraphRequest(url, index, graph) {
+    const post = payload => fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify(payload)
+    });
+    if (datasetHandle && mapIds[index]) {
+        const response = await post({
+            handle: datasetHandle,
+            map_id: mapIds[index],
+            delta: getGraphDelta(index),
+            format: 'columnar'
+        });
+        if (response.status !== 404) {
+            return response;
+        }
+    }
+    // 后端缓存过期：重新上传原始文件获取新的handle
+    const upload = await uploadExcelFile(originalExcelData.file);
+    originalExcelData.handle = upload.handle;
+    datasetHandle = upload.handle;
+    // 旧的map_id和评价状态属于过期的数据集，之后改为发送完整地图
+    mapIds = mapIds.map(() => null);
+    evaluationStates = evaluationStates.map(() => null);
+    return post({
+        handle: upload.handle,
+        graph: graph,
+        format: 'columnar'
+    });
+}
+
+// 将紧凑的列式边数据(from/to/weight三列)展开为vis.js使用的边对象
+function expandColumnarEdges(edges) {
+    return edges.from.map((from, i) => {
+        const to = edges.to[i];
+        const weight = edges.weight[i];
+        return {
+            id: `e${from}_${to}`,
+            from: String(from),
+            to: String(to),
+            // 与后端str(float)一致，整数权重显示为1.0
+            label: Number.isInteger(weight) ? weight.toFixed(1) : String(weight),
+            value: weight
+        };
+    });
+}
+
+// 将列式返回结果展开为原有的详细格式，其余代码不需要区分两种格式
+function expandColumnarResult(result) {
+    if (!result || result.format !== 'columnar') {
+        return result;
+    }
+    const expanded = Object.assign({}, result);
+    const graphs = Array.isArray(result.graph_data) ? result.graph_data : [result.graph_data];
+    const expandedGraphs = graphs.map(graph => {
+        const expandedGraph = Object.assign({}, graph);
+        if (graph.nodes && !Array.isArray(graph.nodes)) {
+            expandedGraph.nodes = graph.nodes.label.map((label, i) => ({ id: String(i), label: label, title: label }));
+        }
+        if (graph.edges && !Array.isArray(graph.edges)) {
+            expandedGraph.edges = expandColumnarEdges(graph.edges);
+        }
+        return expandedGraph;
+    });
+    expanded.graph_data = Array.isArray(result.graph_data) ? expandedGraphs : expandedGraphs[0];
+    const forms = result.forms_with_nodes;
+    if (forms && !Array.isArray(forms)) {
+        expanded.forms_with_nodes = forms.form.map((form, i) => ({
+            language: forms.language[i],
+            form: form,
+            nodes: forms.nodes[i].map(String)
+        }));
+    }
+    delete expanded.format;
+    return expanded;
+}
+
+// 增量校验：发送本次修改的边和上次校验返回的状态id，后端只更新受影响的指标
+// 没有状态id时后端按map_id和边增量重建状态；后端缓存过期时返回null，改用完整校验
+async function postEdgeEdits(index, edits) {
+    if (!datasetHandle || !mapIds[index]) {
+        return null;
+    }
+    const response = await fetch('/api/edge-edit', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({
+            handle: datasetHandle,
+            state_id: evaluationStates[index] || null,
+            edits: edits,
+            map_id: mapIds[index],
+            delta: getGraphDelta(index)
+        })
+    });
+    if (response.status === 404) {
+        evaluationStates[index] = null;
+        return null;
+    }
+    if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    const result = await response.json();
+    evaluationStates[index] = result.state_id;
+    return result.evaluation_metric;
+}
+
+async function validateGraphWithBackend(edits) {
     try {
         // 检查是否有原始Excel数据
         if (!originalExcelData || originalExcelData.length === 0) {
@@ -1836,6 +2056,15 @@ async function validateGraphWithBackend() {
             return;
         }
         
+        if (edits) {
+            const evaluationResult = await postEdgeEdits(currentSlideIndex, edits);
+            if (evaluationResult) {
+                evaluationMetricsData[currentSlideIndex] = evaluationResult;
+                updateEvaluationMetrics(currentSlideIndex, evaluationResult);
+                return;
+            }
+        }
+        
         // 构建当前地图的图数据
         const currentNodes = nodeDatasets[currentSlideIndex].get();
         const currentEdges = edgeDatasets[currentSlideIndex].get();
@@ -1851,17 +2080,7 @@ async function validateGraphWithBackend() {
         };
         
         // 调用后端接口
-        const response = await fetch('/api/edge-modify', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                data: originalExcelData.data,
-                label: originalExcelData.label,
-                graph: graphData
-            })
-        });
+        const response = await postGraphRequest('/api/edge-modify', currentSlideIndex, graphData);
         
         if (!response.ok) {
             throw new Error(`HTTP error! status: ${response.status}`);
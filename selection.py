@@ -0,0 +1,140 @@
+import numpy as np
+
+
+class TreeSelector(object):
+    """
+    Streaming selection of candidate trees by score (the degree std), in constant memory.
+    Trees are grouped into score buckets that hold a count and a small uniform reservoir, and the best and the
+    worst tree are kept apart so that they stay exact once buckets are merged. The buckets form an exact histogram while the number of distinct scores stays below max_buckets
+    (always the case for the degree std of trees, which takes few values) and are merged pairwise beyond that.
+    """
+
+    def __init__(self, n_candidates=5, diversity=None, reservoir_size=8, max_buckets=512, seed=0):
+        if diversity not in [None, 'jaccard']:
+            raise ValueError("the diversity criterion must be None or 'jaccard'")
+        # number of returned candidates
+        self.n_candidates = n_candidates
+        # diversity criterion between the picked trees
+        self.diversity = diversity
+        # the reservoir must hold every tree when there are at most n_candidates of them
+        self.reservoir_size = max(reservoir_size, n_candidates)
+        # upper bound on the number of buckets
+        self.max_buckets = max_buckets
+        self.rng = np.random.default_rng(seed)
+        # score -> [count, reservoir]
+        self.buckets = dict()
+        # (score, tree) of the best tree, the first seen on ties, and of the worst tree, the last seen on ties
+        self.best = None
+        self.worst = None
+        # number of trees seen
+        self.count = 0
+
+
+
+    def add(self, tree, score):
+        """
+        Add a tree with its score, lower is better.
+        """
+        self.count += 1
+        key = round(float(score), 12)
+        if self.best is None or key < self.best[0]:
+            self.best = (key, tree)
+        if self.worst is None or key >= self.worst[0]:
+            self.worst = (key, tree)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            self.buckets[key] = [1, [tree]]
+            if len(self.buckets) > self.max_buckets:
+                self._merge_closest()
+            return
+        bucket[0] += 1
+        reservoir = bucket[1]
+        if len(reservoir) < self.reservoir_size:
+            reservoir.append(tree)
+        else:
+            # reservoir sampling keeps a uniform sample of the bucket
+            ix = self.rng.integers(bucket[0])
+            if ix < self.reservoir_size:
+                reservoir[ix] = tree
+
+
+
+    def _merge_closest(self):
+        """
+        Merge the two buckets with the closest scores (streaming histogram).
+        """
+        keys = sorted(self.buckets)
+        gaps = np.diff(keys)
+        ix = int(np.argmin(gaps))
+        low, high = keys[ix], keys[ix + 1]
+        b_low, b_high = self.buckets.pop(low), self.buckets.pop(high)
+        count = b_low[0] + b_high[0]
+        key = round((low * b_low[0] + high * b_high[0]) / count, 12)
+        # weighted subsample of both reservoirs
+        pool = b_low[1] + b_high[1]
+        p = np.array([b_low[0] / len(b_low[1])] * len(b_low[1]) + [b_high[0] / len(b_high[1])] * len(b_high[1]))
+        size = min(self.reservoir_size, len(pool))
+        picked = self.rng.choice(len(pool), size=size, replace=False, p=p / p.sum())
+        reservoir = [pool[i] for i in sorted(picked)]
+        merged = [count, reservoir]
+        if key in self.buckets:
+            other = self.buckets.pop(key)
+            merged = [count + other[0], (reservoir + other[1])[:self.reservoir_size]]
+        self.buckets[key] = merged
+
+
+
+    def edge_jaccard_distance(self, tree_a, tree_b):
+        """
+        Jaccard distance between the edge sets of two trees.
+        """
+        set_a = {tuple(sorted(e)) for e in tree_a.tolist()}
+        set_b = {tuple(sorted(e)) for e in tree_b.tolist()}
+        union = len(set_a | set_b)
+        if union == 0:
+            return 0.0
+        return 1 - len(set_a & set_b) / union
+
+
+
+    def select(self):
+        """
+        Pick the best tree, the worst tree and evenly spaced quantiles in between, ordered by score.
+        :return: list of at most n_candidates trees
+        """
+        keys = sorted(self.buckets)
+        if self.count <= self.n_candidates:
+            # every tree is still held by the reservoirs
+            return [tree for key in keys for tree in self.buckets[key][1]]
+
+        ranks = [0]
+        if self.n_candidates > 2:
+            ranks += np.linspace(1, self.count - 2, self.n_candidates - 2, dtype=int).tolist()
+        if self.n_candidates > 1:
+            ranks.append(self.count - 1)
+
+        counts = np.array([self.buckets[key][0] for key in keys])
+        bucket_ix = np.searchsorted(np.cumsum(counts), np.array(ranks), side='right')
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+        picked = []
+        picked_ids = set()
+        for rank, b in zip(ranks, bucket_ix):
+            count, reservoir = self.buckets[keys[b]]
+            if rank == 0:
+                options = [self.best[1]]
+            elif rank == self.count - 1:
+                options = [self.worst[1]] + reservoir if self.diversity else [self.worst[1]]
+            else:
+                # position of the rank inside the bucket, mapped onto the reservoir
+                pos = (rank - starts[b]) * len(reservoir) // count
+                options = reservoir[pos:] + reservoir[:pos]
+            options = [tree for tree in options if id(tree) not in picked_ids] or options
+            if self.diversity == 'jaccard' and picked:
+                # the tree farthest from the ones already picked
+                tree = max(options, key=lambda t: min(self.edge_jaccard_distance(t, p) for p in picked))
+            else:
+                tree = options[0]
+            picked.append(tree)
+            picked_ids.add(id(tree))
+        return picked
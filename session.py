@@ -0,0 +1,198 @@
+import hashlib
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+
+def get_content_key(features, forms, matrix, ground_truth=None):
+    """
+    Hash the processed content of a dataset, so that the same table always maps onto the same handle.
+    :param features: feature names
+    :param forms: list of dict(language, form)
+    :param matrix: (N, D) form-feature matrix
+    :param ground_truth: (D, D) ground truth adjacency matrix or None
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps([features, forms], default=str, ensure_ascii=False).encode('utf-8'))
+    for array in [matrix, ground_truth]:
+        if array is None:
+            digest.update(b'none')
+            continue
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        digest.update(str(array.shape).encode('utf-8'))
+        digest.update(array.tobytes())
+    return digest.hexdigest()[:32]
+
+
+
+def get_map_id(adj_matrix):
+    """
+    Content id of a map, computed from its undirected weighted edge set.
+    """
+    upper = np.triu(adj_matrix, 1) + np.tril(adj_matrix, -1).T
+    rows, cols = np.nonzero(upper)
+    digest = hashlib.sha256()
+    digest.update(str(adj_matrix.shape).encode('utf-8'))
+    digest.update(np.stack([rows, cols]).astype(np.int64).tobytes())
+    digest.update(upper[rows, cols].astype(np.float64).tobytes())
+    return digest.hexdigest()[:16]
+
+
+
+class DatasetSession(object):
+    """
+    Prepared state of an uploaded dataset, shared by all the requests on the same table.
+    """
+
+    def __init__(self, semantic_map, forms_with_nodes, forms_columns=None, max_maps=64):
+        # SemanticMap with deduplicated tfM, fully connected adjM, GT matrix and pair index
+        self.semantic_map = semantic_map
+        # forms and their nodes, as returned to the frontend
+        self.forms_with_nodes = forms_with_nodes
+        # the same in the compact columnar format
+        self.forms_columns = forms_columns
+        # map id -> (edges (E, 2), weights (E,)) of the maps returned to the frontend, oldest first
+        self.maps = OrderedDict()
+        self.max_maps = max_maps
+        # state id -> IncrementalMetrics of the maps being edited, oldest first
+        self.evaluators = OrderedDict()
+        # serializes the requests that change the SemanticMap state (candidate generation)
+        self.lock = threading.Lock()
+
+
+
+    def add_map(self, adj_matrix):
+        """
+        Remember a map returned to the frontend, so that later edits can be sent as a delta against it.
+        :return: map id
+        """
+        map_id = get_map_id(adj_matrix)
+        upper = np.triu(adj_matrix, 1) + np.tril(adj_matrix, -1).T
+        rows, cols = np.nonzero(upper)
+        self.maps[map_id] = (np.stack([rows, cols], axis=1), upper[rows, cols])
+        self.maps.move_to_end(map_id)
+        while len(self.maps) > self.max_maps:
+            self.maps.popitem(last=False)
+        return map_id
+
+
+
+    def get_map(self, map_id, delta=None):
+        """
+        Rebuild a remembered map and apply an edge delta to it.
+        :param map_id: id returned by add_map
+        :param delta: dict with 'add' (list of {from, to, value}, also used to change a weight)
+                      and 'remove' (list of {from, to})
+        :return: (D, D) upper triangular adjacency matrix, None if the map is unknown
+        :raises ValueError: when an edge of the delta is malformed or not between two distinct nodes of the map
+        """
+        if map_id not in self.maps:
+            return None
+        n = len(self.semantic_map.unique_featNames)
+        edges, weights = self.maps[map_id]
+        adj_matrix = np.zeros((n, n), dtype=float)
+        adj_matrix[edges[:, 0], edges[:, 1]] = weights
+        delta = delta or {}
+        if not isinstance(delta, dict):
+            raise ValueError('The delta must be an object.')
+
+        def get_edge(edge, with_value):
+            try:
+                i, j = sorted((int(edge['from']), int(edge['to'])))
+                value = float(edge['value']) if with_value else 0.0
+            except (KeyError, TypeError, ValueError):
+                raise ValueError('Every edge of the delta needs a from node, a to node and a numeric value.')
+            if not 0 <= i < j < n:
+                raise ValueError('The edges of the delta must join two distinct nodes of the map.')
+            return i, j, value
+
+        for op in ('remove', 'add'):
+            if not isinstance(delta.get(op, []), list):
+                raise ValueError(f"The '{op}' edges of the delta must be a list.")
+        for edge in delta.get('remove', []):
+            i, j, _ = get_edge(edge, False)
+            adj_matrix[i, j] = 0
+        for edge in delta.get('add', []):
+            i, j, value = get_edge(edge, True)
+            adj_matrix[i, j] = value
+        return adj_matrix
+
+
+
+    def add_evaluator(self, evaluator):
+        """
+        Keep the metric state of an edited map until its next edit.
+        :return: state id
+        """
+        state_id = uuid.uuid4().hex
+        self.evaluators[state_id] = evaluator
+        while len(self.evaluators) > self.max_maps:
+            self.evaluators.popitem(last=False)
+        return state_id
+
+
+
+    def pop_evaluator(self, state_id):
+        """
+        Take the metric state of an edited map, so that two requests never update the same state.
+        :return: IncrementalMetrics, None if the state is unknown
+        """
+        return self.evaluators.pop(state_id, None)
+
+
+
+class SessionCache(object):
+    """
+    Thread-safe LRU cache of dataset sessions keyed by content hash, evicted by size and by idle time.
+    """
+
+    def __init__(self, max_size=32, ttl=3600):
+        # maximum number of sessions
+        self.max_size = max_size
+        # seconds after the last access before a session expires
+        self.ttl = ttl
+        # handle -> (last access time, DatasetSession)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+
+
+    def _expire(self, now):
+        while self.entries:
+            handle, (accessed, _) = next(iter(self.entries.items()))
+            if now - accessed <= self.ttl:
+                break
+            self.entries.pop(handle)
+
+
+
+    def get(self, handle):
+        """
+        Return the session of a handle and refresh it, None if it is unknown or expired.
+        """
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            entry = self.entries.get(handle)
+            if entry is None:
+                return None
+            self.entries[handle] = (now, entry[1])
+            self.entries.move_to_end(handle)
+            return entry[1]
+
+
+
+    def put(self, handle, session):
+        now = time.time()
+        with self.lock:
+            self._expire(now)
+            self.entries[handle] = (now, session)
+            self.entries.move_to_end(handle)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return session
@@ -0,0 +1,662 @@
+import heapq
+import itertools
+import time
+
+import numpy as np
+
+# upper bound in bytes on the temporary (edges, tree edges) gain array of an edge exchange
+EXCHANGE_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+class UnionFind(object):
+    """
+    Array-backed union-find with path halving and union by size.
+    """
+
+    def __init__(self, n):
+        self.parent = list(range(n))
+        self.size = [1] * n
+        # number of disjoint sets
+        self.count = n
+
+    def find(self, x):
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a, b):
+        """
+        Merge the sets of a and b. Return False if they were already in the same set.
+        """
+        ra, rb = self.find(a), self.find(b)
+        if ra == rb:
+            return False
+        if self.size[ra] < self.size[rb]:
+            ra, rb = rb, ra
+        self.parent[rb] = ra
+        self.size[ra] += self.size[rb]
+        self.count -= 1
+        return True
+
+    def copy(self):
+        clone = UnionFind(0)
+        clone.parent, clone.size, clone.count = self.parent[:], self.size[:], self.count
+        return clone
+
+
+
+def get_edge_arrays(adj_matrix):
+    """
+    Extract the undirected edges of an adjacency matrix, the same way nx.from_numpy_array reads it.
+    :param adj_matrix: (D, D) adjacency matrix, usually upper triangular
+    :return: edges (E, 2) int array with u < v, weights (E,) float array
+    """
+    upper = np.triu(adj_matrix, 1)
+    lower = np.tril(adj_matrix, -1).T
+    # an entry in the lower triangle overwrites the upper one in networkx
+    weights = np.where(lower != 0, lower, upper)
+    rows, cols = np.nonzero(weights)
+    edges = np.stack([rows, cols], axis=1).astype(np.int64)
+    return edges, weights[rows, cols].astype(np.float64)
+
+
+
+def edges_to_matrix(tree_edges, adj_matrix):
+    """
+    Build the symmetric weighted adjacency matrix of a tree given as an edge array.
+    :param tree_edges: (m, 2) int array of node indices
+    :param adj_matrix: adjacency matrix the weights are taken from
+    :return: (D, D) symmetric adjacency matrix
+    """
+    n = adj_matrix.shape[0]
+    matrix = np.zeros((n, n), dtype=np.float64)
+    if len(tree_edges) == 0:
+        return matrix
+    u, v = tree_edges[:, 0], tree_edges[:, 1]
+    weights = np.where(adj_matrix[v, u] != 0, adj_matrix[v, u], adj_matrix[u, v])
+    matrix[u, v] = weights
+    matrix[v, u] = weights
+    return matrix
+
+
+
+def get_tie_classes(n, edges, weights):
+    """
+    Run Kruskal over groups of equal-weight edges (heaviest first) and split every group into blocks.
+    Every maximum-weight spanning tree (forest) takes a spanning tree of each block, independently of the
+    others, and all blocks that are already trees are always taken entirely.
+    :param n: number of nodes
+    :param edges: (E, 2) int edge array
+    :param weights: (E,) weight array
+    :return: fixed edge indices, list of blocks (number of block nodes, (k, 2) block-local edges, (k,) edge indices)
+    """
+    order = np.argsort(-weights, kind='stable')
+    sorted_weights = weights[order]
+    # boundaries of the equal-weight classes
+    bounds = np.flatnonzero(np.diff(sorted_weights)) + 1
+    bounds = np.concatenate(([0], bounds, [len(order)]))
+
+    uf = UnionFind(n)
+    fixed = []
+    blocks = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        # map the class edges onto the components built by the heavier classes
+        class_edges = []
+        for edge_index in order[start:end]:
+            ru, rv = uf.find(int(edges[edge_index, 0])), uf.find(int(edges[edge_index, 1]))
+            if ru != rv:
+                class_edges.append((ru, rv, int(edge_index)))
+        if not class_edges:
+            continue
+
+        # connected pieces of the quotient multigraph are independent blocks
+        class_uf = UnionFind(n)
+        for ru, rv, _ in class_edges:
+            class_uf.union(ru, rv)
+        pieces = dict()
+        for ru, rv, edge_index in class_edges:
+            pieces.setdefault(class_uf.find(ru), []).append((ru, rv, edge_index))
+
+        for piece in pieces.values():
+            labels = dict()
+            for ru, rv, _ in piece:
+                labels.setdefault(ru, len(labels))
+                labels.setdefault(rv, len(labels))
+            if len(piece) == len(labels) - 1:
+                # the block is a tree: no choice to make
+                fixed.extend(edge_index for _, _, edge_index in piece)
+            else:
+                local_edges = np.array([(labels[ru], labels[rv]) for ru, rv, _ in piece], dtype=np.int64)
+                edge_indices = np.array([edge_index for _, _, edge_index in piece], dtype=np.int64)
+                blocks.append((len(labels), local_edges, edge_indices))
+
+        for ru, rv, _ in class_edges:
+            uf.union(ru, rv)
+
+    return np.array(fixed, dtype=np.int64), blocks
+
+
+
+def _is_spanning(n, local_edges, chosen, start):
+    """
+    Check whether the chosen edges plus the edges from position start onwards connect all n block nodes.
+    """
+    uf = UnionFind(n)
+    for i in chosen:
+        uf.union(local_edges[i][0], local_edges[i][1])
+    for u, v in local_edges[start:]:
+        if uf.union(u, v) and uf.count == 1:
+            return True
+    return uf.count == 1
+
+
+
+def iter_block_trees(n, local_edges, deadline=None):
+    """
+    Lazily enumerate every spanning tree of a connected multigraph block.
+    Depth-first over the edges, including an edge before excluding it, so the first tree is Kruskal's choice.
+    :param n: number of block nodes
+    :param local_edges: (k, 2) block-local edge array
+    :param deadline: time.perf_counter() value after which the enumeration stops
+    :return: generator of tuples of positions in local_edges
+    """
+    local_edges = local_edges.tolist()
+    m = len(local_edges)
+    # (next edge position, union-find parents, chosen edge positions, components left)
+    stack = [(0, list(range(n)), (), n)]
+    steps = 0
+    while stack:
+        steps += 1
+        if deadline is not None and steps % 256 == 0 and time.perf_counter() > deadline:
+            return
+        i, parent, chosen, n_comp = stack.pop()
+        if n_comp == 1:
+            yield chosen
+            continue
+        if i == m:
+            continue
+
+        u, v = local_edges[i]
+        ru, rv = u, v
+        while parent[ru] != ru:
+            ru = parent[ru]
+        while parent[rv] != rv:
+            rv = parent[rv]
+        if ru == rv:
+            # the edge closes a cycle, it can only be excluded
+            stack.append((i + 1, parent, chosen, n_comp))
+            continue
+        # exclude branch, explored after the include branch
+        if _is_spanning(n, local_edges, chosen, i + 1):
+            stack.append((i + 1, parent, chosen, n_comp))
+        new_parent = parent[:]
+        new_parent[rv] = ru
+        stack.append((i + 1, new_parent, chosen + (i,), n_comp - 1))
+
+
+
+def _diagonal_product(iterators):
+    """
+    Cartesian product over lazy iterators, ordered by the sum of the picked positions.
+    Tuples that stay close to the first item of every factor come first, so any prefix varies all factors
+    instead of only the last ones. Items are cached only up to the largest position reached.
+    :param iterators: list of iterators, consumed on demand
+    """
+    n_factors = len(iterators)
+    caches = [[] for _ in range(n_factors)]
+    exhausted = [False] * n_factors
+
+    def has(i, k):
+        while len(caches[i]) <= k and not exhausted[i]:
+            try:
+                caches[i].append(next(iterators[i]))
+            except StopIteration:
+                exhausted[i] = True
+        return len(caches[i]) > k
+
+    def compositions(i, remaining, max_rest):
+        # positions for factors i.. summing to remaining
+        if remaining > max_rest[i]:
+            return
+        if i == n_factors - 1:
+            if has(i, remaining):
+                yield (remaining,)
+            return
+        for k in range(remaining + 1):
+            if not has(i, k):
+                break
+            for rest in compositions(i + 1, remaining - k, max_rest):
+                yield (k,) + rest
+
+    if n_factors == 0:
+        yield ()
+        return
+    total = 0
+    while True:
+        # largest position sum still reachable by the factors i.., known once they are exhausted
+        max_rest = [float('inf')] * (n_factors + 1)
+        max_rest[n_factors] = 0
+        for i in range(n_factors - 1, -1, -1):
+            if exhausted[i]:
+                max_rest[i] = max_rest[i + 1] + len(caches[i]) - 1
+        for positions in compositions(0, total, max_rest):
+            yield tuple(caches[i][k] for i, k in enumerate(positions))
+        if all(exhausted) and total >= max_rest[0]:
+            return
+        total += 1
+
+
+
+def iter_optimal_trees(adj_matrix, max_trees=None, time_budget=None):
+    """
+    Lazily enumerate the maximum-weight spanning trees (all tied optima) of the graph of an adjacency matrix.
+    A disconnected graph yields its maximum-weight spanning forests.
+    :param adj_matrix: (D, D) adjacency matrix, zero entries are missing edges
+    :param max_trees: stop after this many trees
+    :param time_budget: stop after this many seconds
+    :return: generator of (m, 2) int edge arrays
+    """
+    n = adj_matrix.shape[0]
+    edges, weights = get_edge_arrays(adj_matrix)
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    fixed, blocks = get_tie_classes(n, edges, weights)
+    fixed_edges = edges[fixed]
+
+    count = 0
+    block_trees = [iter_block_trees(block_n, local_edges, deadline) for block_n, local_edges, _ in blocks]
+    for choice in _diagonal_product(block_trees):
+        if max_trees is not None and count >= max_trees:
+            return
+        if deadline is not None and time.perf_counter() > deadline:
+            return
+        parts = [fixed_edges]
+        for (_, _, edge_indices), positions in zip(blocks, choice):
+            parts.append(edges[edge_indices[list(positions)]])
+        count += 1
+        yield np.concatenate(parts, axis=0)
+
+
+
+def _iter_randoms(rng, buffer_size=4096):
+    """
+    Endless stream of uniform floats in [0, 1), drawn from rng in batches.
+    """
+    while True:
+        yield from rng.random(buffer_size).tolist()
+
+
+
+def _wilson_tree(n, local_edges, incident, randoms):
+    """
+    Uniform random spanning tree of a connected multigraph block with Wilson's algorithm: loop-erased random
+    walks from every node to the tree grown so far. The walks pick an incident edge (not a neighbor) uniformly, so
+    parallel edges are distinct choices.
+    :param local_edges: list of the block-local (u, v) edges
+    :param incident: list of the edge positions incident to every node
+    :param randoms: iterator of uniform floats, see _iter_randoms
+    :return: tuple of edge positions
+    """
+    in_tree = [False] * n
+    in_tree[0] = True
+    next_edge = [-1] * n
+    for start in range(1, n):
+        node = start
+        while not in_tree[node]:
+            edges = incident[node]
+            position = edges[int(next(randoms) * len(edges))]
+            # overwriting the exit of a revisited node erases the loop
+            next_edge[node] = position
+            u, v = local_edges[position]
+            node = v if u == node else u
+        node = start
+        while not in_tree[node]:
+            in_tree[node] = True
+            u, v = local_edges[next_edge[node]]
+            node = v if u == node else u
+    return tuple(sorted(next_edge[1:]))
+
+
+
+def iter_uniform_trees(adj_matrix, n_samples, seed=0, time_budget=None, stats=None, log_count=None):
+    """
+    Lazily draw maximum-weight spanning trees (forests) uniformly at random. Every optimal tree is the fixed
+    edges of the tie classes plus one spanning tree of every block, chosen independently (see get_tie_classes),
+    so a uniform spanning tree of every block quotient graph, drawn with Wilson's algorithm, gives a uniform
+    optimal tree. A draw costs O(D) walk steps on graphs of the usual size, whatever the number of optimal trees.
+    Repeated draws are yielded once. When there are no more optimal trees than samples, they are all enumerated
+    instead.
+    :param adj_matrix: (D, D) adjacency matrix, zero entries are missing edges
+    :param n_samples: number of draws, None to enumerate every optimal tree
+    :param seed: seed of the random generator
+    :param time_budget: stop after this many seconds
+    :param stats: dict receiving 'draws', the number of draws made so far, None when the trees are enumerated
+    :param log_count: count_optimal_trees(adj_matrix) when the caller already has it
+    :return: generator of (m, 2) int edge arrays
+    """
+    stats = dict() if stats is None else stats
+    stats['draws'] = None
+    if n_samples is not None and log_count is None:
+        log_count = count_optimal_trees(adj_matrix)
+    if n_samples is None or log_count <= np.log(n_samples):
+        yield from iter_optimal_trees(adj_matrix, n_samples, time_budget)
+        return
+    n = adj_matrix.shape[0]
+    edges, weights = get_edge_arrays(adj_matrix)
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    fixed, blocks = get_tie_classes(n, edges, weights)
+    fixed_edges = edges[fixed]
+    randoms = _iter_randoms(np.random.default_rng(seed))
+
+    samplers = []
+    for block_n, local_edges, edge_indices in blocks:
+        local = local_edges.tolist()
+        incident = [[] for _ in range(block_n)]
+        for position, (u, v) in enumerate(local):
+            incident[u].append(position)
+            incident[v].append(position)
+        samplers.append((block_n, local, incident, edge_indices))
+
+    seen = set()
+    stats['draws'] = 0
+    for _ in range(n_samples):
+        if deadline is not None and time.perf_counter() > deadline:
+            return
+        stats['draws'] += 1
+        choice = tuple(_wilson_tree(block_n, local, incident, randoms) for block_n, local, incident, _ in samplers)
+        if choice in seen:
+            continue
+        seen.add(choice)
+        parts = [fixed_edges]
+        for (_, _, _, edge_indices), positions in zip(samplers, choice):
+            parts.append(edges[edge_indices[list(positions)]])
+        yield np.concatenate(parts, axis=0)
+
+
+
+def count_optimal_trees(adj_matrix):
+    """
+    Count the maximum-weight spanning trees by the matrix-tree theorem on every tie block.
+    The count is the product of the block counts, so it is accumulated as a sum of log-determinants.
+    :param adj_matrix: (D, D) adjacency matrix
+    :return: natural logarithm of the number of optimal trees
+    """
+    n = adj_matrix.shape[0]
+    edges, weights = get_edge_arrays(adj_matrix)
+    _, blocks = get_tie_classes(n, edges, weights)
+    log_count = 0.0
+    for block_n, local_edges, _ in blocks:
+        # Laplacian of the block multigraph
+        laplacian = np.zeros((block_n, block_n), dtype=np.float64)
+        u, v = local_edges[:, 0], local_edges[:, 1]
+        np.add.at(laplacian, (u, v), -1)
+        np.add.at(laplacian, (v, u), -1)
+        np.add.at(laplacian, (u, u), 1)
+        np.add.at(laplacian, (v, v), 1)
+        # any cofactor counts the spanning trees
+        _, log_det = np.linalg.slogdet(laplacian[1:, 1:])
+        log_count += log_det
+    return log_count
+
+
+
+
+def _max_spanning_forest(n, edges, weights):
+    """
+    Kruskal's maximum-weight spanning forest.
+    :return: sorted edge indices of the forest
+    """
+    tree = []
+    uf = UnionFind(n)
+    for edge_index in np.argsort(-weights, kind='stable').tolist():
+        if uf.union(int(edges[edge_index, 0]), int(edges[edge_index, 1])):
+            tree.append(edge_index)
+            if uf.count == 1:
+                break
+    return np.sort(np.array(tree, dtype=np.int64))
+
+
+
+def _best_exchange(n, edges, weights, tree, included, excluded):
+    """
+    Best single edge exchange of a spanning forest: the edge e entering (not in the forest and not excluded) and
+    the edge f leaving (on the forest path between the endpoints of e and not included) that lose the least
+    weight. Tree edge f lies on the path of e = (u, v) when its lower endpoint is an ancestor of exactly one of
+    u and v, so all the pairs are checked on an (n, n) ancestor matrix.
+    :param tree: edge indices of the forest
+    :param included: edge indices that must stay in the forest
+    :param excluded: edge indices that must stay out of the forest
+    :return: weight gain (<= 0 for a maximum forest), entering edge index, leaving edge index; None without any
+             exchange
+    """
+    # root every forest component and order the nodes parents first
+    neighbors = [[] for _ in range(n)]
+    for edge_index in tree.tolist():
+        u, v = int(edges[edge_index, 0]), int(edges[edge_index, 1])
+        neighbors[u].append((v, edge_index))
+        neighbors[v].append((u, edge_index))
+    parent = [-1] * n
+    # tree edge index -> its lower endpoint
+    child = dict()
+    ancestor = np.zeros((n, n), dtype=bool)
+    seen = [False] * n
+    for root in range(n):
+        if seen[root]:
+            continue
+        seen[root] = True
+        queue = [root]
+        for node in queue:
+            if parent[node] >= 0:
+                ancestor[node] = ancestor[parent[node]]
+            ancestor[node, node] = True
+            for adjacent, edge_index in neighbors[node]:
+                if not seen[adjacent]:
+                    seen[adjacent] = True
+                    parent[adjacent] = node
+                    child[edge_index] = adjacent
+                    queue.append(adjacent)
+
+    leaving = tree[~np.isin(tree, included)]
+    candidate = np.ones(len(edges), dtype=bool)
+    candidate[tree] = False
+    candidate[excluded] = False
+    entering = np.flatnonzero(candidate)
+    if len(leaving) == 0 or len(entering) == 0:
+        return None
+    lower = np.array([child[edge_index] for edge_index in leaving.tolist()], dtype=np.int64)
+    leaving_weights = weights[leaving]
+    # (n, leaving) whether the lower endpoint of the leaving edge is an ancestor of the node
+    below = ancestor[:, lower]
+
+    best = None
+    step = max(1, EXCHANGE_CHUNK_BYTES // (8 * len(leaving)))
+    for start in range(0, len(entering), step):
+        chunk = entering[start:start + step]
+        u, v = edges[chunk, 0], edges[chunk, 1]
+        # (chunk, leaving) whether the leaving edge is on the path of the entering edge
+        on_path = below[u] != below[v]
+        gain = np.where(on_path, weights[chunk][:, None] - leaving_weights[None, :], -np.inf)
+        i, j = np.unravel_index(np.argmax(gain), gain.shape)
+        if gain[i, j] > -np.inf and (best is None or gain[i, j] > best[0]):
+            best = (float(gain[i, j]), int(chunk[i]), int(leaving[j]))
+    return best
+
+
+
+def _iter_exchange_trees(n, edges, weights, deadline=None, min_weight=None):
+    """
+    Enumerate the spanning forests by decreasing total weight with edge exchange (Gabow; Katoh, Ibaraki and
+    Mine). Every subproblem is the set of trees that contain some edges and avoid others. Its second best tree is
+    its best tree after the best single exchange (e in, f out), and once that tree is taken the subproblem is
+    split into the trees avoiding e, whose best tree is unchanged, and the trees containing e, whose best tree is
+    the one just taken. The best tree of a subproblem bounds all of its trees, so the enumeration stops as soon
+    as the heaviest pending subproblem falls below min_weight.
+    :param min_weight: lightest total weight enumerated, None for all the forests
+    :return: generator of (edge indices, total weight)
+    """
+    tree = _max_spanning_forest(n, edges, weights)
+    tree_weight = float(weights[tree].sum())
+    if min_weight is not None and tree_weight < min_weight:
+        return
+    yield tree, tree_weight
+
+    # (-weight of the subproblem's second best tree, tie breaker, best tree, its weight, included, excluded, e, f)
+    # the edge sets are index arrays, so that a pending subproblem takes O(D) memory
+    heap = []
+    tie_breaker = itertools.count()
+
+    def push(tree, tree_weight, included, excluded):
+        exchange = _best_exchange(n, edges, weights, tree, included, excluded)
+        if exchange is None:
+            return
+        gain, e, f = exchange
+        if min_weight is not None and tree_weight + gain < min_weight:
+            return
+        heapq.heappush(heap, (-(tree_weight + gain), next(tie_breaker), tree, tree_weight, included, excluded, e, f))
+
+    no_edges = np.zeros(0, dtype=np.int64)
+    push(tree, tree_weight, no_edges, no_edges)
+    while heap:
+        if deadline is not None and time.perf_counter() > deadline:
+            return
+        neg_weight, _, tree, tree_weight, included, excluded, e, f = heapq.heappop(heap)
+        new_tree = np.sort(np.append(tree[tree != f], e))
+        new_weight = -neg_weight
+        yield new_tree, new_weight
+        push(tree, tree_weight, included, np.append(excluded, e))
+        push(new_tree, new_weight, np.append(included, e), excluded)
+
+
+
+def iter_k_best_trees(adj_matrix, k, time_budget=None):
+    """
+    Lazily enumerate the k maximum-weight spanning trees (forests) of the graph of an adjacency matrix, by
+    decreasing total weight, tied trees in any order. Only one forest is built with Kruskal, every following
+    tree costs two exchange searches, see _iter_exchange_trees.
+    :param adj_matrix: (D, D) adjacency matrix, zero entries are missing edges
+    :param k: number of trees
+    :param time_budget: stop after this many seconds
+    :return: generator of (m, 2) int edge arrays
+    """
+    if k < 1:
+        return
+    n = adj_matrix.shape[0]
+    edges, weights = get_edge_arrays(adj_matrix)
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    trees = _iter_exchange_trees(n, edges, weights, deadline)
+    for tree, _ in itertools.islice(trees, k):
+        yield edges[tree]
+
+
+
+def get_band_weight(adj_matrix, tolerance=0.0, relative_tolerance=0.0):
+    """
+    Lightest total weight of the near-optimal trees: the optimum minus the larger of the absolute tolerance and
+    the relative tolerance times the optimum.
+    :return: optimal weight, lightest weight in the band
+    """
+    n = adj_matrix.shape[0]
+    edges, weights = get_edge_arrays(adj_matrix)
+    optimum = float(weights[_max_spanning_forest(n, edges, weights)].sum())
+    return optimum, optimum - max(tolerance, relative_tolerance * abs(optimum))
+
+
+
+def iter_near_optimal_trees(adj_matrix, tolerance=0.0, relative_tolerance=0.0, max_trees=None, time_budget=None):
+    """
+    Lazily enumerate the spanning trees (forests) whose total weight is within the tolerance band of the
+    optimum, see get_band_weight, by decreasing total weight. Unlike iter_optimal_trees, weights that only differ
+    by floating point noise do not need to be exactly equal. Subproblems are pruned by the weight of their best
+    tree, so the work is proportional to the number of trees in the band.
+    :param adj_matrix: (D, D) adjacency matrix, zero entries are missing edges
+    :param tolerance: absolute tolerance on the total weight
+    :param relative_tolerance: tolerance relative to the optimal total weight
+    :param max_trees: stop after this many trees
+    :param time_budget: stop after this many seconds
+    :return: generator of (m, 2) int edge arrays
+    """
+    n = adj_matrix.shape[0]
+    edges, weights = get_edge_arrays(adj_matrix)
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    _, min_weight = get_band_weight(adj_matrix, tolerance, relative_tolerance)
+    trees = _iter_exchange_trees(n, edges, weights, deadline, min_weight)
+    for tree, _ in itertools.islice(trees, max_trees):
+        yield edges[tree]
+
+
+
+def iter_band_samples(adj_matrix, tolerance=0.0, relative_tolerance=0.0, n_samples=1000, seed=0, time_budget=None,
+                      stats=None):
+    """
+    Lazily draw spanning trees (forests) of the tolerance band (see get_band_weight) uniformly at random, for
+    bands too large to enumerate. A random walk starts at the optimal tree; every step removes a uniform tree
+    edge f and puts back a uniform edge e across the cut it leaves, among the ones keeping the tree in the band.
+    The cut and the weight without f are the same from the new tree when e is removed, so the moves are
+    symmetric and the walk is uniform over the band in the limit; every band tree reaches the optimal tree by
+    exchanges that never lose weight, so the walk reaches the whole band. Repeated trees are yielded once.
+    :param adj_matrix: (D, D) adjacency matrix, zero entries are missing edges
+    :param tolerance: absolute tolerance on the total weight
+    :param relative_tolerance: tolerance relative to the optimal total weight
+    :param n_samples: number of trees sampled, one every quarter sweep (a step per 4 tree edges) after a burn-in
+                      of 10 sweeps
+    :param seed: seed of the random generator
+    :param time_budget: stop after this many seconds
+    :param stats: dict receiving 'draws', the number of steps sampled so far
+    :return: generator of (m, 2) int edge arrays
+    """
+    stats = dict() if stats is None else stats
+    stats['draws'] = 0
+    n = adj_matrix.shape[0]
+    edges, weights = get_edge_arrays(adj_matrix)
+    deadline = None if time_budget is None else time.perf_counter() + time_budget
+    _, min_weight = get_band_weight(adj_matrix, tolerance, relative_tolerance)
+    tree = _max_spanning_forest(n, edges, weights).tolist()
+    if not tree:
+        yield edges[tree]
+        stats['draws'] = 1
+        return
+    # node -> {neighbor: edge index} of the tree
+    adjacent = [dict() for _ in range(n)]
+    for edge_index in tree:
+        u, v = edges[edge_index].tolist()
+        adjacent[u][v] = adjacent[v][u] = edge_index
+    randoms = _iter_randoms(np.random.default_rng(seed))
+    side = np.zeros(n, dtype=bool)
+
+    seen = set()
+    burn_in = 10 * len(tree)
+    # consecutive trees differ by one edge at most, only one every thinning steps is sampled
+    thinning = max(1, len(tree) // 4)
+    for step in range(burn_in + n_samples * thinning):
+        if deadline is not None and step % 64 == 0 and time.perf_counter() > deadline:
+            return
+        position = int(next(randoms) * len(tree))
+        leaving = tree[position]
+        u, v = edges[leaving].tolist()
+        # nodes on the side of u once the leaving edge is removed
+        side[:] = False
+        side[u] = True
+        stack = [u]
+        while stack:
+            node = stack.pop()
+            for neighbor in adjacent[node]:
+                if not side[neighbor] and (node, neighbor) not in ((u, v), (v, u)):
+                    side[neighbor] = True
+                    stack.append(neighbor)
+        rest = float(weights[tree].sum()) - weights[leaving]
+        entering = np.flatnonzero((side[edges[:, 0]] != side[edges[:, 1]]) & (rest + weights >= min_weight))
+        entering = int(entering[int(next(randoms) * len(entering))])
+        if entering != leaving:
+            del adjacent[u][v], adjacent[v][u]
+            a, b = edges[entering].tolist()
+            adjacent[a][b] = adjacent[b][a] = entering
+            tree[position] = entering
+        if step < burn_in or (step - burn_in + 1) % thinning:
+            continue
+        stats['draws'] += 1
+        key = frozenset(tree)
+        if key in seen:
+            continue
+        seen.add(key)
+        yield edges[sorted(tree)]
@@ -0,0 +1,128 @@
+import numpy as np
+
+
+def _poly_mul(a, b):
+    # polynomials are object arrays of exact integer coefficients, indexed by the number of nodes
+    return np.convolve(a, b)
+
+
+
+def _poly_add(a, b):
+    if len(a) < len(b):
+        a, b = b, a
+    result = a.copy()
+    result[:len(b)] += b
+    return result
+
+
+
+def _peel_leaves(n, neighbors):
+    """
+    Repeatedly remove the nodes of degree at most one, which leaves the 2-core of the graph.
+    :return: removal order, parent of every removed node (its last neighbor, -1 for none), core mask
+    """
+    degree = np.array([len(nb) for nb in neighbors], dtype=np.int64)
+    removed = np.zeros(n, dtype=bool)
+    parent = np.full(n, -1, dtype=np.int64)
+    order = []
+    stack = [v for v in range(n) if degree[v] <= 1]
+    while stack:
+        v = stack.pop()
+        if removed[v]:
+            continue
+        removed[v] = True
+        order.append(v)
+        for w in neighbors[v]:
+            if not removed[w]:
+                parent[v] = w
+                degree[w] -= 1
+                if degree[w] <= 1:
+                    stack.append(w)
+    return order, parent, ~removed
+
+
+
+def _count_core_subgraphs(core_nodes, neighbors, weights, max_sets=None):
+    """
+    Sum, over the connected induced subgraphs of the core, of the product of the node polynomials.
+    Every connected node set is generated exactly once: from its smallest node, branching on the frontier
+    nodes in order, a node being excluded from the later branches once it has been tried.
+    :param core_nodes: core node list
+    :param neighbors: adjacency bitmask of every core node (python int over core positions)
+    :param weights: polynomial of every core node
+    :param max_sets: largest number of connected sets enumerated, None for unlimited
+    :return: object array of counts by size (None when the core has more than max_sets connected sets), number
+             of connected sets enumerated
+    """
+    total = np.zeros(1, dtype=object)
+    n_sets = 0
+    for start in range(len(core_nodes)):
+        # nodes before start belong to the sets of smaller nodes
+        banned = (1 << (start + 1)) - 1
+        stack = [(weights[start], neighbors[start] & ~banned, banned)]
+        while stack:
+            poly, ext, banned = stack.pop()
+            n_sets += 1
+            if max_sets is not None and n_sets > max_sets:
+                return None, n_sets
+            total = _poly_add(total, poly)
+            while ext:
+                bit = ext & -ext
+                ext ^= bit
+                banned |= bit
+                w = bit.bit_length() - 1
+                stack.append((_poly_mul(poly, weights[w]), ext | (neighbors[w] & ~banned), banned))
+    return total, n_sets
+
+
+
+def count_connected_subgraphs(n, edges, max_sets=None, return_sets=False):
+    """
+    Count the connected induced subgraphs of a graph by number of nodes, without building any subgraph.
+    The trees hanging off the 2-core are handled by a dynamic program: f(v) = x * prod(1 + f(c)) counts the
+    connected sets whose node closest to the core is v, by size. Only the connected sets of the 2-core are
+    enumerated, each weighted by the polynomials of the trees hanging from its nodes, so a forest is counted
+    in polynomial time and the cost of a general graph grows with its cyclic part only.
+    :param n: number of nodes
+    :param edges: (E, 2) int edge array
+    :param max_sets: largest number of connected sets of the 2-core enumerated, None for unlimited. The limit
+                     is on operations rather than time, so that a count is given or not whatever the load.
+    :return: (n + 1,) object array of exact counts, entry k is the number of connected node sets of size k,
+             None when the 2-core has more than max_sets connected sets
+    :param return_sets: also return the number of connected sets of the 2-core enumerated (max_sets + 1 when
+                        the limit stopped the enumeration), which adds up over the components of a graph
+    """
+    neighbors = [[] for _ in range(n)]
+    for u, v in np.asarray(edges, dtype=np.int64).reshape(-1, 2).tolist():
+        if u != v and v not in neighbors[u]:
+            neighbors[u].append(v)
+            neighbors[v].append(u)
+
+    order, parent, core = _peel_leaves(n, neighbors)
+    one = np.array([1], dtype=object)
+    x = np.array([0, 1], dtype=object)
+    # x * product of (1 + f(child)) over the children accumulated so far
+    rooted = [x.copy() for _ in range(n)]
+    total = np.zeros(n + 1, dtype=object)
+    for v in order:
+        # every child of v was removed before v
+        total = _poly_add(total, rooted[v])
+        if parent[v] >= 0:
+            rooted[parent[v]] = _poly_mul(rooted[parent[v]], _poly_add(one, rooted[v]))
+
+    core_nodes = np.flatnonzero(core).tolist()
+    n_sets = 0
+    if core_nodes:
+        position = {v: i for i, v in enumerate(core_nodes)}
+        core_neighbors = []
+        for v in core_nodes:
+            mask = 0
+            for w in neighbors[v]:
+                if w in position:
+                    mask |= 1 << position[w]
+            core_neighbors.append(mask)
+        core_total, n_sets = _count_core_subgraphs(core_nodes, core_neighbors, [rooted[v] for v in core_nodes],
+                                                   max_sets)
+        total = None if core_total is None else _poly_add(total, core_total)
+    total = None if total is None else total[:n + 1]
+    return (total, n_sets) if return_sets else total
@@ -0,0 +1,209 @@
+import codecs
+import csv
+import os
+from itertools import islice
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+# file extensions accepted by read_upload
+TABLE_EXTENSIONS = ['.xlsx', '.xls', '.csv']
+
+
+def _trim_rows(rows):
+    """
+    Rows of a sheet the way the frontend reads them with SheetJS: the first row holds the column names, blank
+    rows are skipped and the columns beyond the last named one are dropped.
+    :param rows: iterator of row tuples
+    :return: header (list), rows (list of tuples of the header length)
+    """
+    rows = iter(rows)
+    header = []
+    for row in rows:
+        if any(cell is not None for cell in row):
+            header = list(row)
+            break
+    while header and header[-1] is None:
+        header.pop()
+    # the column names are text, as SheetJS reads them
+    header = [str(name) if name is not None else f'__EMPTY_{i}' for i, name in enumerate(header)]
+    n = len(header)
+    body = []
+    for row in rows:
+        row = tuple(islice(row, n))
+        if any(cell is not None for cell in row):
+            body.append(row + (None,) * (n - len(row)))
+    return header, body
+
+
+
+def _read_xlsx(stream, max_sheets=2):
+    """
+    Read the first sheets of a workbook with the read-only (streaming) reader.
+    """
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        return [_trim_rows(sheet.iter_rows(values_only=True)) for sheet in workbook.worksheets[:max_sheets]]
+    finally:
+        workbook.close()
+
+
+
+def _xls_cell(cell):
+    # xlrd reads every number as a float, an integer is kept as an int as in an xlsx sheet
+    if cell.ctype in (0, 6):  # xlrd.XL_CELL_EMPTY, xlrd.XL_CELL_BLANK
+        return None
+    if isinstance(cell.value, float) and cell.value.is_integer():
+        return int(cell.value)
+    return cell.value
+
+
+
+def _read_xls(stream, max_sheets=2):
+    """
+    Read the first sheets of a legacy (BIFF) workbook with xlrd, which is only imported for these files.
+    """
+    try:
+        import xlrd
+    except ImportError:
+        raise ValueError("Reading .xls files requires the 'xlrd' package, save the file as .xlsx or .csv.")
+    workbook = xlrd.open_workbook(file_contents=stream.read(), on_demand=True)
+    try:
+        sheets = []
+        for index in range(min(max_sheets, workbook.nsheets)):
+            sheet = workbook.sheet_by_index(index)
+            sheets.append(_trim_rows(tuple(_xls_cell(cell) for cell in sheet.row(i)) for i in range(sheet.nrows)))
+        return sheets
+    finally:
+        workbook.release_resources()
+
+
+
+def _read_csv(stream):
+    """
+    Read a csv file, the empty cells being missing values.
+    """
+    lines = codecs.getreader('utf-8-sig')(stream)
+    rows = (tuple(cell if cell.strip() else None for cell in row) for row in csv.reader(lines))
+    return [_trim_rows(rows)]
+
+
+
+def validate_columns(header, n_rows):
+    """
+    The column rules of validate_data in app.py, checked on the header only.
+    """
+    # Rule 1: First column must be 'languages'
+    if not header or header[0] != 'languages':
+        return "First column must be named 'languages'."
+
+    # Rule 2: Second column must be 'forms'
+    if len(header) < 2 or header[1] != 'forms':
+        return "Second column must be named 'forms'."
+
+    # Rule 3: At least two more columns after the first two
+    if len(header) < 4:
+        return "There must be at least two more columns (features) after 'languages' and 'forms'."
+
+    # Rule 4: At least one row of data
+    if n_rows == 0:
+        return "The file must contain at least one row of data (one form)."
+
+    return 'standard'
+
+
+
+def to_numeric(header, cells, parse_text=False):
+    """
+    Convert the feature cells of a table into a float matrix, checking every column at once.
+    Missing cells become 0.
+    :param header: names of the columns of cells
+    :param cells: (N, D) object array
+    :param parse_text: whether text cells holding numbers are accepted (csv), otherwise only numeric cells are
+    :return: (N, D) float64 matrix, error message or None
+    """
+    missing = np.equal(cells, None)
+    if not parse_text:
+        is_number = np.frompyfunc(lambda cell: isinstance(cell, (int, float)), 1, 1)
+        invalid = ~(missing | is_number(cells).astype(bool))
+        if invalid.any():
+            col = int(np.argmax(invalid.any(axis=0)))
+            return None, f"Feature '{header[col]}' must contain only numeric (integer or float) values."
+
+    values = np.where(missing, np.nan, cells)
+    try:
+        matrix = values.astype(np.float64)
+    except ValueError:
+        # find the column holding the text that is not a number
+        for col, name in enumerate(header):
+            try:
+                values[:, col].astype(np.float64)
+            except ValueError:
+                return None, f"Feature '{name}' must contain only numeric (integer or float) values."
+        raise
+    return np.nan_to_num(matrix, nan=0.0), None
+
+
+
+def read_sheets(stream, file_name):
+    """
+    :return: list of (header, rows) of the sheets of an xlsx, xls or csv file
+    """
+    extension = os.path.splitext(file_name or '')[1].lower()
+    if extension == '.xlsx':
+        return _read_xlsx(stream)
+    if extension == '.xls':
+        return _read_xls(stream)
+    if extension == '.csv':
+        return _read_csv(stream)
+    raise ValueError(f"Unsupported file type '{extension}', expected one of {', '.join(TABLE_EXTENSIONS)}.")
+
+
+
+def read_upload(stream, file_name, label_stream=None, label_name=None):
+    """
+    Parse an uploaded table without going through JSON rows or a DataFrame of the whole table.
+    The ground truth is the second sheet of a workbook, or a separate file for a csv table.
+    :param stream: binary file object of the table
+    :param file_name: name of the uploaded file, its extension selects the reader
+    :param label_stream: binary file object of the ground truth, optional
+    :param label_name: name of the ground truth file
+    :return: dict(features, forms, languages, form_names, matrix, label), label being a DataFrame for
+             process_label; error message or None
+    """
+    sheets = read_sheets(stream, file_name)
+    if label_stream is not None:
+        sheets = sheets[:1] + read_sheets(label_stream, label_name or file_name)[:1]
+    header, rows = sheets[0]
+
+    v_result = validate_columns(header, len(rows))
+    if v_result != 'standard':
+        return None, v_result
+
+    cells = np.empty((len(rows), len(header)), dtype=object)
+    cells[:] = rows
+    matrix, error = to_numeric(header[2:], cells[:, 2:], parse_text=file_name.lower().endswith('.csv'))
+    if error:
+        return None, error
+
+    # Fill in the missing languages and forms.
+    names = np.where(np.equal(cells[:, :2], None), '<unk>', cells[:, :2])
+    languages, forms = names[:, 0].tolist(), names[:, 1].tolist()
+
+    label = pd.DataFrame()
+    if len(sheets) > 1:
+        label_header, label_rows = sheets[1]
+        label = pd.DataFrame(label_rows, columns=label_header)
+        if label_name is not None and label_name.lower().endswith('.csv') and not label.empty:
+            # the values of a csv are text
+            label[label.columns[1:]] = label[label.columns[1:]].apply(pd.to_numeric, errors='coerce')
+
+    return {
+        'features': header[2:],
+        'forms': [{'language': language, 'form': form} for language, form in zip(languages, forms)],
+        'languages': languages,
+        'form_names': forms,
+        'matrix': matrix,
+        'label': label
+    }, None
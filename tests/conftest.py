@@ -0,0 +1,28 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# the modules of the app are flat files at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def random_weighted_graph(rng, n, density=0.6, n_weights=3):
+    """
+    Upper triangular adjacency matrix of a random connected graph with few distinct weights, so that many spanning
+    trees are tied.
+    """
+    adj = np.triu(rng.integers(1, n_weights + 1, size=(n, n)) * (rng.random((n, n)) < density), 1).astype(float)
+    # a random path keeps the graph connected
+    order = rng.permutation(n)
+    for u, v in zip(order[:-1], order[1:]):
+        if adj[min(u, v), max(u, v)] == 0:
+            adj[min(u, v), max(u, v)] = rng.integers(1, n_weights + 1)
+    return adj
+
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
@@ -0,0 +1,132 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+from SMM import SemanticMap
+from connectivity import (check_forms_connectivity, get_form_components, get_batched_components, PairFormIndex,
+                          FormComponents)
+from packed import PackedMatrix
+
+
+def _random_case(rng, n_forms=30, n_features=10, n_edges=12):
+    member = rng.random((n_forms, n_features)) < 0.35
+    pairs = np.array([(u, v) for u in range(n_features) for v in range(u + 1, n_features)])
+    edges = pairs[rng.choice(len(pairs), size=n_edges, replace=False)]
+    return member, edges
+
+
+
+def _induced_components(edges, feats):
+    # oracle: networkx components of the subgraph induced by the features of a form
+    graph = nx.Graph()
+    graph.add_nodes_from(feats)
+    graph.add_edges_from(edges.tolist())
+    return list(nx.connected_components(graph.subgraph(feats)))
+
+
+
+@pytest.mark.parametrize('packed', [False, True])
+def test_forms_connectivity_matches_networkx(rng, packed):
+    for _ in range(10):
+        member, edges = _random_case(rng)
+        form_feature = PackedMatrix(member) if packed else member.astype(float)
+        connected, unconnected = check_forms_connectivity(edges, form_feature)
+        labels, _ = get_form_components(edges, form_feature)
+        for form in range(len(member)):
+            feats = np.flatnonzero(member[form]).tolist()
+            components = _induced_components(edges, feats)
+            # a form with at most one feature is connected
+            assert connected[form] == (len(components) <= 1)
+            for component in components:
+                assert {labels[form, f] for f in component} == {min(component)}
+        assert np.array_equal(unconnected, np.flatnonzero(~connected))
+
+
+
+def test_batched_components_matches_networkx(rng):
+    n_rows, n_nodes = 6, 15
+    rows = rng.integers(n_rows, size=40)
+    u, v = rng.integers(n_nodes, size=40), rng.integers(n_nodes, size=40)
+    labels = get_batched_components(n_rows, n_nodes, rows, u, v)
+    for row in range(n_rows):
+        graph = nx.Graph()
+        graph.add_nodes_from(range(n_nodes))
+        graph.add_edges_from(zip(u[rows == row].tolist(), v[rows == row].tolist()))
+        for component in nx.connected_components(graph):
+            assert {labels[row, node] for node in component} == {min(component)}
+
+
+
+def _joined_forms(member, edges, u, v):
+    # oracle: number of unconnected forms that the edge (u, v) connects
+    count = 0
+    for form in np.flatnonzero(member[:, u] & member[:, v]):
+        feats = np.flatnonzero(member[form]).tolist()
+        if len(_induced_components(edges, feats)) == 2 and \
+                len(_induced_components(np.vstack([edges, [[u, v]]]), feats)) == 1:
+            count += 1
+    return count
+
+
+
+def test_pair_index_matches_brute_force(rng):
+    member, _ = _random_case(rng)
+    index = PairFormIndex(PackedMatrix(member))
+    n_features = member.shape[1]
+    for u in range(n_features):
+        for v in range(n_features):
+            if u == v:
+                continue
+            forms = np.flatnonzero(member[:, u] & member[:, v])
+            assert np.array_equal(index.get_forms(u, v), forms)
+            assert (index.get_position(u, v) >= 0) == (len(forms) > 0)
+    for form in range(len(member)):
+        assert np.array_equal(index.get_features(form), np.flatnonzero(member[form]))
+
+
+
+def test_form_components_counts_match_networkx(rng):
+    member, edges = _random_case(rng, n_edges=6)
+    components = FormComponents(edges, PackedMatrix(member))
+    n_features = member.shape[1]
+    added = edges
+    for _ in range(6):
+        counts = components.count_connected_by()
+        for u in range(n_features):
+            for v in range(u + 1, n_features):
+                if not ((added[:, 0] == u) & (added[:, 1] == v)).any():
+                    assert counts[u, v] == counts[v, u] == _joined_forms(member, added, u, v)
+        # add a random missing edge and check the forms it connected
+        missing = [(u, v) for u in range(n_features) for v in range(u + 1, n_features)
+                   if not ((added[:, 0] == u) & (added[:, 1] == v)).any()]
+        u, v = missing[rng.integers(len(missing))]
+        before, _ = check_forms_connectivity(added, member)
+        newly = components.add_edge(u, v)
+        added = np.vstack([added, [[u, v]]])
+        after, _ = check_forms_connectivity(added, member)
+        assert np.array_equal(newly, np.flatnonzero(after & ~before & member[:, u] & member[:, v]))
+        assert np.array_equal(components.n_components > 1, ~after)
+
+
+
+def test_merge_edge_adds_greedy_edges_until_connected(rng):
+    for _ in range(3):
+        member, edges = _random_case(rng, n_forms=20, n_features=8, n_edges=5)
+        # distinct column weights so that no column is merged into another
+        matrix = member * (1 + np.arange(member.shape[1]))
+        semantic_map = SemanticMap(matrix, [f'f{i}' for i in range(member.shape[1])], list(range(len(member))))
+        assert semantic_map.tfM.shape == member.shape
+        adj = np.zeros((member.shape[1], member.shape[1]))
+        adj[edges[:, 0], edges[:, 1]] = 1
+        merged, highlight = semantic_map.merge_edge(adj)
+
+        merged_edges = np.argwhere(np.triu(merged + merged.T) != 0)
+        assert check_forms_connectivity(merged_edges, member)[0].all()
+        graph_edges = edges
+        for u, v, _ in highlight:
+            # every added edge connects as many forms as the best candidate
+            missing = [(a, b) for a in range(member.shape[1]) for b in range(a + 1, member.shape[1])
+                       if not ((graph_edges[:, 0] == a) & (graph_edges[:, 1] == b)).any()]
+            best = max(_joined_forms(member, graph_edges, a, b) for a, b in missing)
+            assert _joined_forms(member, graph_edges, min(u, v), max(u, v)) == best
+            graph_edges = np.vstack([graph_edges, [[min(u, v), max(u, v)]]])
@@ -0,0 +1,49 @@
+import itertools
+import math
+
+import networkx as nx
+import numpy as np
+import pytest
+from networkx.algorithms.tree import SpanningTreeIterator
+
+from conftest import random_weighted_graph
+from degree_search import find_min_std_tree, get_degree_bound
+
+
+def _degree_std(n, edges):
+    return float(np.std(np.bincount(np.asarray(edges, dtype=np.int64).ravel(), minlength=n)))
+
+
+
+def test_min_std_tree_matches_exhaustive_search(rng):
+    for _ in range(15):
+        n = int(rng.integers(4, 8))
+        adj = random_weighted_graph(rng, n, density=0.7, n_weights=2)
+        # oracle: the smallest degree std over every maximum-weight spanning tree, the iterator yields the
+        # heaviest trees first
+        trees = ((tree.size(weight='weight'), list(tree.edges))
+                 for tree in SpanningTreeIterator(nx.from_numpy_array(adj), minimum=False))
+        optimum, edges = next(trees)
+        optimal = [edges] + [edges for _, edges in itertools.takewhile(lambda t: math.isclose(t[0], optimum), trees)]
+        best_std = min(_degree_std(n, edges) for edges in optimal)
+
+        result = find_min_std_tree(adj)
+        tree = result['tree']
+        assert len(tree) == n - 1
+        assert sum(adj[min(u, v), max(u, v)] for u, v in tree.tolist()) == pytest.approx(optimum)
+        assert result['deg_std'] == pytest.approx(_degree_std(n, tree))
+        assert result['deg_std'] == pytest.approx(best_std)
+        assert result['certified']
+
+
+
+@pytest.mark.parametrize('units', [0, 1, 2, 4, 7])
+def test_degree_bound_matches_exhaustive_filling(rng, units):
+    for _ in range(20):
+        degree = rng.integers(0, 4, size=4)
+        capacity = rng.integers(0, 3, size=4)
+        # oracle: every way of adding the units within the capacities
+        fillings = [np.array(added) for added in itertools.product(*[range(c + 1) for c in capacity])
+                    if sum(added) == units]
+        expected = min((int(np.sum((degree + added) ** 2)) for added in fillings), default=float('inf'))
+        assert get_degree_bound(degree, capacity, units) == expected
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+import packed
+from packed import PackedMatrix
+from relations import get_cooccurrence
+
+
+def _random_table(rng, n_forms=40, n_features=13, weighted=False):
+    matrix = (rng.random((n_forms, n_features)) < 0.3).astype(float)
+    if weighted:
+        matrix *= rng.integers(1, 5, size=matrix.shape)
+    return matrix
+
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+def test_packed_reads_back_the_table(rng, weighted):
+    matrix = _random_table(rng, weighted=weighted)
+    packed_matrix = PackedMatrix(matrix)
+    assert packed_matrix.shape == matrix.shape
+    assert packed_matrix.is_binary == (not weighted)
+    assert np.array_equal(packed_matrix.member(), matrix > 0)
+    assert np.array_equal(packed_matrix.toarray(), matrix)
+    rows = [3, 0, 7]
+    assert np.array_equal(packed_matrix.member(rows), matrix[rows] > 0)
+    assert np.array_equal(packed_matrix.toarray(rows), matrix[rows])
+    for row in range(len(matrix)):
+        assert np.array_equal(packed_matrix.get_features(row), np.flatnonzero(matrix[row]))
+    if not weighted:
+        # one bit per cell
+        assert packed_matrix.nbytes == len(matrix) * ((matrix.shape[1] + 7) // 8)
+
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+def test_cooccurrence_matches_dense(rng, monkeypatch, weighted):
+    matrix = _random_table(rng, weighted=weighted)
+    # oracle: the dense product of the whole table
+    expected = matrix.T @ matrix
+    for chunk_bytes in (8, 8 * 13 * 3, packed.PRODUCT_CHUNK_BYTES):
+        # blocks of 1 row, 3 rows and the whole table
+        monkeypatch.setattr(packed, 'PRODUCT_CHUNK_BYTES', chunk_bytes)
+        cooccurrence, feature_freq = get_cooccurrence(PackedMatrix(matrix))
+        assert np.allclose(cooccurrence, expected)
+        assert np.allclose(feature_freq, matrix.sum(axis=0))
+    if weighted:
+        with pytest.raises(ValueError):
+            PackedMatrix(matrix).get_cooccurrence()
+
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+def test_sparse_input_matches_dense(rng, monkeypatch, weighted):
+    sp = pytest.importorskip('scipy.sparse')
+    matrix = _random_table(rng, weighted=weighted)
+    dense = PackedMatrix(matrix)
+    for chunk_bytes in (8 * 13 * 3, packed.PRODUCT_CHUNK_BYTES):
+        monkeypatch.setattr(packed, 'PRODUCT_CHUNK_BYTES', chunk_bytes)
+        sparse = PackedMatrix(sp.csr_matrix(matrix))
+        assert np.array_equal(sparse.bits, dense.bits)
+        assert sparse.is_binary == dense.is_binary
+        assert np.array_equal(sparse.toarray(), matrix)
+        assert np.array_equal(sparse.toarray([5, 1]), matrix[[5, 1]])
+        cooccurrence, feature_freq = get_cooccurrence(sparse)
+        assert np.allclose(cooccurrence, matrix.T @ matrix)
+        assert np.allclose(feature_freq, matrix.sum(axis=0))
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from selection import TreeSelector
+
+
+def _stream(rng, n_trees, n_scores):
+    # every tree is a distinct object, its score is one of a few values as the degree std of trees is
+    trees = [np.array([[i, i + 1]]) for i in range(n_trees)]
+    scores = rng.integers(n_scores, size=n_trees) / 7
+    return trees, scores
+
+
+
+@pytest.mark.parametrize('n_trees', [1, 3, 5, 40, 1000])
+@pytest.mark.parametrize('n_candidates', [1, 2, 5])
+def test_select_matches_sorted_ranks(rng, n_trees, n_candidates):
+    trees, scores = _stream(rng, n_trees, 6)
+    selector = TreeSelector(n_candidates=n_candidates)
+    for tree, score in zip(trees, scores):
+        selector.add(tree, score)
+    picked = selector.select()
+    score_of = {id(tree): score for tree, score in zip(trees, scores)}
+    picked_scores = [score_of[id(tree)] for tree in picked]
+
+    # oracle: collect every tree, then sort by score
+    ordered = np.sort(scores)
+    if n_trees <= n_candidates:
+        assert len(picked) == n_trees
+        assert len({id(tree) for tree in picked}) == n_trees
+        assert picked_scores == sorted(picked_scores)
+        return
+    ranks = [0]
+    if n_candidates > 2:
+        ranks += np.linspace(1, n_trees - 2, n_candidates - 2, dtype=int).tolist()
+    if n_candidates > 1:
+        ranks.append(n_trees - 1)
+    assert np.allclose(picked_scores, ordered[ranks])
+    # the best tree is the first tree of the lowest score
+    assert picked[0] is trees[int(np.argmin(scores))]
+
+
+
+def test_select_with_merged_buckets(rng):
+    # more distinct scores than buckets: the histogram is approximate but the extremes stay exact
+    trees = [np.array([[i, i + 1]]) for i in range(500)]
+    scores = rng.random(500)
+    selector = TreeSelector(n_candidates=5, max_buckets=16)
+    for tree, score in zip(trees, scores):
+        selector.add(tree, score)
+    assert len(selector.buckets) <= 16
+    assert sum(bucket[0] for bucket in selector.buckets.values()) == 500
+    picked = selector.select()
+    assert len(picked) == 5
+    assert picked[0] is trees[int(np.argmin(scores))]
+    assert picked[-1] is trees[int(np.argmax(scores))]
+
+
+
+def test_jaccard_diversity_picks_distinct_trees(rng):
+    trees, scores = _stream(rng, 200, 3)
+    selector = TreeSelector(n_candidates=5, diversity='jaccard')
+    for tree, score in zip(trees, scores):
+        selector.add(tree, score)
+    picked = selector.select()
+    assert len({id(tree) for tree in picked}) == len(picked) == 5
+    assert selector.edge_jaccard_distance(trees[0], trees[0]) == 0
+    assert selector.edge_jaccard_distance(trees[0], trees[1]) == 1
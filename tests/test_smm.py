@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from SMM import SemanticMap
+
+
+def _table_with_duplicates(rng, n_forms=12, n_columns=8, n_copies=10, weighted=False):
+    base = (rng.random((n_forms, n_columns)) < 0.3).astype(float)
+    if weighted:
+        base *= rng.integers(1, 4, size=base.shape)
+    base[:, 0] = 0
+    # copies of random columns, the zero column included, in a shuffled order
+    matrix = np.concatenate([base, base[:, rng.integers(n_columns, size=n_copies)]], axis=1)
+    return matrix[:, rng.permutation(matrix.shape[1])]
+
+
+
+def _check_deduplication(matrix, semantic_map):
+    names = [f'f{i}' for i in range(matrix.shape[1])]
+    # oracle: equal nonzero columns share their np.unique class, every zero column is kept on its own
+    _, inverse = np.unique(matrix, axis=1, return_inverse=True)
+    inverse = inverse.ravel()
+    nonzero = matrix.any(axis=0)
+    index = semantic_map.unmerged_index
+    for i in range(matrix.shape[1]):
+        for j in range(i + 1, matrix.shape[1]):
+            same = nonzero[i] and nonzero[j] and inverse[i] == inverse[j]
+            assert (index[i] == index[j]) == same
+    assert semantic_map.tfM.shape[1] == len(np.unique(inverse[nonzero])) + np.count_nonzero(~nonzero)
+    # every original column is read back from the column it was merged into
+    assert np.array_equal(semantic_map.tfM.toarray()[:, index], matrix)
+    # the names of a merged column are joined in the order of the original columns
+    for k, name in enumerate(semantic_map.unique_featNames):
+        assert name == '/'.join(names[i] for i in np.flatnonzero(index == k))
+
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+def test_merge_feat_matches_unique(rng, weighted):
+    for _ in range(5):
+        matrix = _table_with_duplicates(rng, weighted=weighted)
+        names = [f'f{i}' for i in range(matrix.shape[1])]
+        _check_deduplication(matrix, SemanticMap(matrix, names, list(range(len(matrix)))))
+
+
+
+def test_merge_feat_negative_zero(rng):
+    matrix = _table_with_duplicates(rng)
+    # the same column with -0.0 in place of its zeros
+    matrix[:, 2] = np.arange(len(matrix)) % 2
+    matrix[:, 1] = np.where(matrix[:, 2] == 0, -0.0, matrix[:, 2])
+    names = [f'f{i}' for i in range(matrix.shape[1])]
+    semantic_map = SemanticMap(matrix, names, list(range(len(matrix))))
+    assert semantic_map.unmerged_index[1] == semantic_map.unmerged_index[2]
+    _check_deduplication(matrix + 0.0, semantic_map)
+
+
+
+@pytest.mark.parametrize('weighted', [False, True])
+def test_merge_feat_sparse_matches_dense(rng, weighted):
+    sp = pytest.importorskip('scipy.sparse')
+    matrix = _table_with_duplicates(rng, weighted=weighted)
+    names = [f'f{i}' for i in range(matrix.shape[1])]
+    dense_map = SemanticMap(matrix, names, list(range(len(matrix))))
+    for sparse in (sp.csr_matrix(matrix), sp.coo_matrix(matrix), sp.csc_matrix(matrix)):
+        sparse_map = SemanticMap(sparse, names, list(range(len(matrix))))
+        _check_deduplication(matrix, sparse_map)
+        assert np.array_equal(sparse_map.unmerged_index, dense_map.unmerged_index)
+        assert sparse_map.unique_featNames == dense_map.unique_featNames
@@ -0,0 +1,77 @@
+import math
+
+import networkx as nx
+import numpy as np
+import pytest
+from networkx.algorithms.tree import SpanningTreeIterator
+
+from conftest import random_weighted_graph
+from spanning import (iter_k_best_trees, iter_optimal_trees, count_optimal_trees, iter_uniform_trees,
+                      iter_near_optimal_trees, iter_band_samples, get_band_weight)
+
+
+def _key(tree):
+    return frozenset(tuple(sorted(edge)) for edge in np.asarray(tree).tolist())
+
+
+
+def _all_trees(adj):
+    # oracle: every spanning tree with its weight, heaviest first
+    graph = nx.from_numpy_array(adj)
+    return [(_key(tree.edges), tree.size(weight='weight')) for tree in SpanningTreeIterator(graph, minimum=False)]
+
+
+
+def _weight(adj, tree):
+    return sum(adj[min(u, v), max(u, v)] for u, v in tree)
+
+
+
+def _graphs(rng, count=8):
+    return [random_weighted_graph(rng, int(rng.integers(4, 7))) for _ in range(count)]
+
+
+
+def test_k_best_trees_match_spanning_tree_iterator(rng):
+    for adj in _graphs(rng):
+        trees = _all_trees(adj)
+        k = min(len(trees), 12)
+        best = list(iter_k_best_trees(adj, k))
+        assert len(best) == k
+        assert len({_key(tree) for tree in best}) == k
+        # the same weights in the same order, tied trees in any order
+        assert np.allclose([_weight(adj, _key(tree)) for tree in best], [weight for _, weight in trees[:k]])
+        assert {_key(tree) for tree in best} <= {key for key, _ in trees}
+        # asking for more trees than there are yields all of them
+        assert len(list(iter_k_best_trees(adj, len(trees) + 5))) == len(trees)
+
+
+
+def test_optimal_trees_match_spanning_tree_iterator(rng):
+    for adj in _graphs(rng):
+        trees = _all_trees(adj)
+        optimum = trees[0][1]
+        expected = {key for key, weight in trees if math.isclose(weight, optimum)}
+        enumerated = [_key(tree) for tree in iter_optimal_trees(adj)]
+        assert len(enumerated) == len(set(enumerated))
+        assert set(enumerated) == expected
+        assert count_optimal_trees(adj) == pytest.approx(math.log(len(expected)))
+        # sampling fewer trees than the optimal set only yields optimal trees, each once
+        sampled = [_key(tree) for tree in iter_uniform_trees(adj, max(1, len(expected) // 2), seed=1)]
+        assert len(sampled) == len(set(sampled))
+        assert set(sampled) <= expected
+
+
+
+def test_near_optimal_trees_match_spanning_tree_iterator(rng):
+    for adj in _graphs(rng):
+        trees = _all_trees(adj)
+        optimum, band_weight = get_band_weight(adj, tolerance=1.5)
+        assert optimum == pytest.approx(trees[0][1])
+        expected = {key for key, weight in trees if weight >= band_weight - 1e-9}
+        enumerated = list(iter_near_optimal_trees(adj, tolerance=1.5))
+        assert {_key(tree) for tree in enumerated} == expected
+        weights = [_weight(adj, _key(tree)) for tree in enumerated]
+        assert weights == sorted(weights, reverse=True)
+        # the random walk stays in the band
+        assert {_key(tree) for tree in iter_band_samples(adj, tolerance=1.5, n_samples=50)} <= expected
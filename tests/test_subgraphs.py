@@ -0,0 +1,80 @@
+from itertools import combinations
+
+import networkx as nx
+import numpy as np
+import pytest
+
+from SMM import SemanticMap
+from subgraphs import count_connected_subgraphs
+
+
+def _brute_force_counts(n, edges):
+    # oracle: every node combination, kept when its induced subgraph is connected
+    graph = nx.Graph()
+    graph.add_nodes_from(range(n))
+    graph.add_edges_from((u, v) for u, v in edges if u != v)
+    counts = [0] * (n + 1)
+    for size in range(1, n + 1):
+        counts[size] = sum(nx.is_connected(graph.subgraph(nodes)) for nodes in combinations(range(n), size))
+    return counts
+
+
+
+def _random_edges(rng, n, n_edges):
+    return rng.integers(n, size=(n_edges, 2))
+
+
+
+@pytest.mark.parametrize('n, n_edges', [(1, 0), (5, 0), (6, 5), (8, 7), (8, 10), (9, 20), (10, 14)])
+def test_counts_match_combinations(rng, n, n_edges):
+    for _ in range(5):
+        # self-loops and repeated edges are allowed in the input
+        edges = _random_edges(rng, n, n_edges)
+        assert list(count_connected_subgraphs(n, edges)) == _brute_force_counts(n, edges.tolist())
+
+
+
+@pytest.mark.parametrize('graph', [nx.path_graph(9), nx.star_graph(8), nx.cycle_graph(9), nx.complete_graph(7),
+                                   nx.lollipop_graph(4, 5), nx.balanced_tree(3, 2)])
+def test_counts_of_known_graphs(graph):
+    n = graph.number_of_nodes()
+    edges = np.array(graph.edges, dtype=np.int64).reshape(-1, 2)
+    assert list(count_connected_subgraphs(n, edges)) == _brute_force_counts(n, edges.tolist())
+
+
+
+def test_limit_on_enumerated_sets(rng):
+    edges = _random_edges(rng, 10, 18)
+    exact, n_sets = count_connected_subgraphs(10, edges, return_sets=True)
+    assert n_sets > 0
+    assert list(count_connected_subgraphs(10, edges, max_sets=n_sets)) == list(exact)
+    assert count_connected_subgraphs(10, edges, max_sets=n_sets - 1) is None
+    # a forest has no 2-core, so no limit applies to it
+    tree = np.array(nx.balanced_tree(2, 3).edges)
+    assert count_connected_subgraphs(15, tree, max_sets=0, return_sets=True)[1] == 0
+
+
+
+def test_productivity_matches_brute_force(rng):
+    member = rng.random((25, 7)) < 0.4
+    matrix = member * (1 + np.arange(7))
+    semantic_map = SemanticMap(matrix, [f'f{i}' for i in range(7)], list(range(25)))
+    adj = np.triu((rng.random((7, 7)) < 0.4).astype(float), 1)
+    # a triangle, so that the map has a 2-core
+    adj[0, 1] = adj[1, 2] = adj[0, 2] = 1
+    metrics = semantic_map.get_evaluation_metrics([adj], range(25))[0]
+    edges = np.argwhere(adj != 0)
+    graph = nx.Graph()
+    graph.add_nodes_from(range(7))
+    graph.add_edges_from(edges.tolist())
+    # connected subgraphs with 2 to D - 1 nodes
+    n_subgraphs = sum(_brute_force_counts(7, edges.tolist())[2:7])
+    n_connected = sum(nx.number_connected_components(graph.subgraph(np.flatnonzero(row).tolist())) <= 1
+                      for row in member)
+    assert metrics['productivity'] == pytest.approx(n_connected / n_subgraphs)
+    assert metrics['productivity_truncated'] is False
+    # over the count limit the productivity is unavailable rather than wrong
+    semantic_map.count_limit = 0
+    metrics = semantic_map.get_evaluation_metrics([adj], range(25))[0]
+    assert metrics['productivity'] is None
+    assert metrics['productivity_truncated'] is True
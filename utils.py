@@ -1 +1,33 @@
-port = 5086
\ No newline at end of file
+port = 5086
+
+# number of uploaded datasets kept in memory, and seconds before an idle one expires
+session_cache_size = 32
+session_ttl = 3600
+
+# directory of the on-disk result cache (relative to app.py) and its size cap in bytes
+result_cache_dir = 'cache'
+result_cache_size = 256 * 1024 * 1024
+
+# worker processes of the background jobs, number of finished jobs kept, progress polling interval in seconds
+job_workers = 2
+job_history = 256
+job_poll_interval = 0.5
+
+# worker processes evaluating the candidate maps, and the number of candidates times the size of the form-feature
+# matrix below which they are evaluated in the request process
+eval_workers = 4
+eval_parallel_min_size = 2000000
+# upper bound on the number of candidate maps of a request
+max_candidates = 50
+# upper bound in seconds on the time budget of the 'min_std' tree search of a request
+max_search_budget = 60
+
+# largest accepted upload in bytes
+max_upload_size = 64 * 1024 * 1024
+
+# record the timing of the pipeline stages (/metrics, 'timing': true in a request)
+instrumentation_enabled = True
+# requests slower than this many seconds have their stack samples written to profile_dir, None disables the profiler
+profile_slow_requests = None
+profile_interval = 0.005
+profile_dir = 'profiles'